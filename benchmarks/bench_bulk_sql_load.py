@@ -0,0 +1,58 @@
+"""Cold SQLite population time of the bulk loader, against the row by row ORM load for small catalogs.
+
+    python -m benchmarks.bench_bulk_sql_load 1000 10000 100000
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, clear_mappers
+from sqlalchemy.pool import NullPool
+
+from benchmarks.synthetic import write_catalog
+from library.adapters import abstractrepository
+from library.adapters.databaserepository import SqlAlchemyRepository
+from library.adapters.jsondatareader import BooksJSONReader
+from library.adapters.orm import metadata, map_model_to_tables
+
+# the ORM load needs minutes well before this size
+ROW_BY_ROW_LIMIT = 2000
+
+
+def load_seconds(database_file, paths, bulk: bool) -> float:
+    clear_mappers()
+    engine = create_engine(f"sqlite:///{database_file}", poolclass=NullPool)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    map_model_to_tables()
+    session_factory = sessionmaker(autocommit=False, autoflush=True, bind=engine)
+    abstractrepository.repo_instance = SqlAlchemyRepository(session_factory)
+    reader = BooksJSONReader(*paths)
+    start = time.perf_counter()
+    if bulk:
+        reader.read_json_files_bulk()
+    else:
+        reader.read_json_files_sql()
+    seconds = time.perf_counter() - start
+    abstractrepository.repo_instance.close_session()
+    engine.dispose()
+    return seconds
+
+
+def main(sizes):
+    print(f"{'books':>10} {'bulk (s)':>10} {'row by row (s)':>15}")
+    with tempfile.TemporaryDirectory() as folder:
+        database_file = Path(folder) / "bench.db"
+        for size in sizes:
+            paths = write_catalog(folder, size)
+            bulk = load_seconds(database_file, paths, bulk=True)
+            row_by_row = "-"
+            if size <= ROW_BY_ROW_LIMIT:
+                row_by_row = f"{load_seconds(database_file, paths, bulk=False):.2f}"
+            print(f"{size:>10} {bulk:>10.2f} {row_by_row:>15}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,84 @@
+"""Multi-predicate book filters on the columnar store against walking the Book objects.
+
+Books get random release years, ratings, page counts, ebook flags and publishers, with some values missing.
+Every query is run on BookColumns and as the list comprehension over Book properties that SearchMethod
+style filters use. Both return the same books. The time to place the rows in bins is printed as well.
+A query matching tens of thousands of books spends most of its time building the list of matches.
+
+    python -m benchmarks.bench_column_filter 1000000
+"""
+import random
+import sys
+import time
+import timeit
+
+from library.adapters.columnstore import BookColumns
+from library.domain.model import Book, Publisher
+
+QUERIES = [
+    {"release_year": (2010, 2012)},
+    {"release_year": (2000, None), "rating": (4.0, 4.5)},
+    {"rating": (3.0, None), "num_pages": (100, 400), "ebook": True},
+    {"publisher": "Publisher 7", "release_year": (1990, 2000)},
+    {"num_pages": (250, 251)},
+]
+
+
+def make_books(num_books: int) -> list:
+    rng = random.Random(235)
+    publishers = [Publisher(f"Publisher {publisher_id}") for publisher_id in range(500)]
+    books = []
+    for book_id in range(num_books):
+        book = Book(book_id, f"Book {book_id}")
+        if rng.random() < 0.9:
+            book.release_year = rng.randrange(1950, 2022)
+        if rng.random() < 0.95:
+            book.rating = round(rng.uniform(1, 4.99), 2)
+        book.num_pages = rng.randrange(20, 1200)
+        book.ebook = rng.random() < 0.3
+        book.publisher = rng.choice(publishers)
+        books.append(book)
+    return books
+
+
+def in_range(value, bounds) -> bool:
+    low, high = bounds
+    return value is not None and (low is None or low <= value) and (high is None or value <= high)
+
+
+def walk(books, query: dict) -> list:
+    return [book for book in books
+            if ("release_year" not in query or in_range(book.release_year, query["release_year"]))
+            and ("rating" not in query or in_range(book.rating, query["rating"]))
+            and ("num_pages" not in query or in_range(book.num_pages, query["num_pages"]))
+            and ("ebook" not in query or book.ebook is query["ebook"])
+            and ("publisher" not in query or book.publisher is not None
+                 and book.publisher.name == query["publisher"])]
+
+
+def milliseconds(function) -> float:
+    runs, seconds = timeit.Timer(function).autorange()
+    return seconds / runs * 1e3
+
+
+def main(num_books: int):
+    books = make_books(num_books)
+    columns = BookColumns()
+    started = time.perf_counter()
+    for book in books:
+        columns.append(book)
+    appended = time.perf_counter()
+    columns.build()
+    built = time.perf_counter()
+    print(f"{num_books} books: append {appended - started:.2f} s, build {built - appended:.2f} s")
+    print(f"{'query':>70} {'matches':>8} {'columns (ms)':>13} {'objects (ms)':>13}")
+    for query in QUERIES:
+        found = columns.filter(**query)
+        assert found == walk(books, query)
+        columns_ms = milliseconds(lambda: columns.filter(**query))
+        objects_ms = milliseconds(lambda: walk(books, query))
+        print(f"{str(query):>70} {len(found):>8} {columns_ms:>13.1f} {objects_ms:>13.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
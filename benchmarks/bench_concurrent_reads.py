@@ -0,0 +1,92 @@
+"""Read throughput of a shared MemoryRepository as reader threads are added, with and without a writer.
+
+Every reader runs the same mix of lookups a page request makes: a book by id, a tag, a year range, a title
+search and a book's reviews. With a writer, one more thread keeps adding books and reviews. Readers take no
+lock. Each write builds a new version that shares the containers of the last one and copies only the parts
+it changes, so a write costs about the same at any catalog size. The writer runs flat out, and readers lose
+the interpreter time its writes take. Threads of one process share the interpreter lock, so the numbers do
+not show reads speeding up across cores. A threaded server gets that by running more worker processes.
+
+    python -m benchmarks.bench_concurrent_reads 10000 1 2 4 8
+"""
+import random
+import sys
+import threading
+import time
+
+from library.adapters.repository import MemoryRepository
+from library.domain.model import Book, Review, User
+
+SECONDS = 2.0
+TAGS = [f"tag{tag}" for tag in range(50)]
+
+
+def make_book(book_id: int, rng: random.Random) -> Book:
+    book = Book(book_id, f"Book {book_id} {rng.choice(TAGS)}")
+    book.tags = set(rng.sample(TAGS, 3))
+    book.release_year = rng.randrange(1950, 2022)
+    return book
+
+
+def fill(num_books: int, user: User) -> MemoryRepository:
+    rng = random.Random(235)
+    repository = MemoryRepository()
+    with repository.batch():
+        repository.add_user(user)
+        for book_id in range(num_books):
+            book = make_book(book_id, rng)
+            repository.add_book(book)
+            repository.add_review(Review(user, book, "Review", 3))
+    return repository
+
+
+def run(repository: MemoryRepository, num_books: int, num_readers: int, with_writer: bool, user: User) -> tuple:
+    stop = threading.Event()
+    reads = [0] * num_readers
+    writes = [0]
+
+    def read(reader: int):
+        rng = random.Random(reader)
+        while not stop.is_set():
+            book = repository.get_book(rng.randrange(num_books))
+            repository.get_books_by_tag(rng.choice(TAGS))
+            start = rng.randrange(1950, 2020)
+            repository.get_books_by_date_range(start, start + 1)
+            repository.get_books_by_title(f"Book {rng.randrange(1000)} ")
+            repository.get_reviews(book, 20)
+            reads[reader] += 1
+
+    def write():
+        rng = random.Random(-1)
+        book_id = num_books * 10
+        while not stop.is_set():
+            book = make_book(book_id, rng)
+            repository.add_book(book)
+            repository.add_review(Review(user, book, "Review", 3))
+            book_id += 1
+            writes[0] += 1
+
+    threads = [threading.Thread(target=read, args=(reader,)) for reader in range(num_readers)]
+    if with_writer:
+        threads.append(threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+    time.sleep(SECONDS)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / SECONDS, writes[0] / SECONDS
+
+
+def main(num_books: int, reader_counts):
+    user = User("reader", "password", "r1")
+    print(f"{'readers':>8} {'writer':>7} {'reads/s':>10} {'writes/s':>10}")
+    for num_readers in reader_counts:
+        for with_writer in (False, True):
+            reads, writes = run(fill(num_books, user), num_books, num_readers, with_writer, user)
+            print(f"{num_readers:>8} {'yes' if with_writer else 'no':>7} {reads:>10.0f} {writes:>10.0f}")
+
+
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:]]
+    main(arguments[0] if arguments else 10000, arguments[1:] or [1, 2, 4, 8])
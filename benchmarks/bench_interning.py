@@ -0,0 +1,47 @@
+"""Bytes saved by interning tag, publisher and author names in a loaded memory repository.
+
+For every name field the report compares the bytes the name strings take as loaded, with each distinct
+name stored once, against one string per reference as the reader produced them before interning.
+
+    python -m benchmarks.bench_interning 10000
+"""
+import sys
+import tempfile
+from collections import defaultdict
+
+from benchmarks.synthetic import write_catalog
+from library.adapters.jsondatareader import BooksJSONReader
+from library.adapters.repository import MemoryRepository
+
+
+def name_references(repository: MemoryRepository) -> dict:
+    references = defaultdict(list)
+    for book in repository.books:
+        references["tag"].extend(book.tags)
+        if book.publisher is not None:
+            references["publisher"].append(book.publisher.name)
+        references["author"].extend(author.full_name for author in book.authors)
+    return references
+
+
+def main(num_books: int):
+    with tempfile.TemporaryDirectory() as folder:
+        repository = MemoryRepository()
+        # a small author pool keeps the load quick; names repeat across books as they do in real exports
+        BooksJSONReader(*write_catalog(folder, num_books, num_authors=2000, num_reviews=0)).read_json_files(repository)
+
+    print(f"{num_books} books")
+    print(f"{'names':>10} {'references':>11} {'distinct':>9} {'objects':>8} {'unshared (MB)':>14} "
+          f"{'interned (MB)':>14} {'saved per 100k books (MB)':>26}")
+    for kind, names in name_references(repository).items():
+        unshared = sum(sys.getsizeof(name) for name in names)
+        distinct_names = {name: name for name in names}
+        interned = sum(sys.getsizeof(name) for name in distinct_names)
+        objects = len({id(name) for name in names})
+        saved_per_100k = (unshared - interned) * 100000 / num_books
+        print(f"{kind:>10} {len(names):>11} {len(distinct_names):>9} {objects:>8} {unshared / 2 ** 20:>14.1f} "
+              f"{interned / 2 ** 20:>14.1f} {saved_per_100k / 2 ** 20:>26.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else 10000)
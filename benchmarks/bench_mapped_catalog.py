@@ -0,0 +1,88 @@
+"""Memory of worker processes that each load the snapshot against workers that map one shared catalog file.
+
+Every worker loads the catalog its own way, looks up a thousand random books and reports its proportional
+set size (Pss), which splits each shared page between the processes mapping it, and its private memory.
+Linux only, as the sizes are read from /proc/self/smaps_rollup.
+
+    python -m benchmarks.bench_mapped_catalog 100000 4
+"""
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import write_catalog as write_json_catalog
+from library.adapters.jsondatareader import BooksJSONReader
+from library.adapters.mappedcatalog import open_catalog, write_catalog
+from library.adapters.mappedrepository import MappedRepository
+from library.adapters.repository import MemoryRepository
+from library.adapters.snapshot import load_snapshot, save_snapshot
+
+LOOKUPS = 1000
+
+
+# (Pss, private) of the calling process in MB
+def memory_use() -> tuple:
+    sizes = {}
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            fields = line.split()
+            if len(fields) == 3 and fields[2] == "kB":
+                sizes[fields[0].rstrip(":")] = int(fields[1]) / 1024
+    return sizes["Pss"], sizes["Private_Clean"] + sizes["Private_Dirty"]
+
+
+def worker(kind: str, file_name: str, source_files, num_books: int, started, results):
+    begin = time.perf_counter()
+    if kind == "snapshot":
+        repository = load_snapshot(file_name, source_files)
+    else:
+        repository = MappedRepository(open_catalog(file_name, source_files))
+    rng = random.Random(235)
+    for _ in range(LOOKUPS):
+        assert repository.get_book(rng.randrange(num_books)) is not None
+    seconds = time.perf_counter() - begin
+    # every worker measures once all of them have loaded, so the shared pages are split between all of them
+    started.wait()
+    results.put((*memory_use(), seconds))
+
+
+def run(kind: str, file_name: str, source_files, num_books: int, num_workers: int) -> list:
+    started = multiprocessing.Barrier(num_workers)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(kind, file_name, source_files, num_books, started,
+                                                            results)) for _ in range(num_workers)]
+    for process in workers:
+        process.start()
+    measured = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    return measured
+
+
+def main(num_books: int, num_workers: int):
+    multiprocessing.set_start_method("spawn")
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_json_catalog(folder, num_books)
+        repository = MemoryRepository()
+        BooksJSONReader(*paths).read_json_files(repository)
+        snapshot_file = str(Path(folder) / "repository.snapshot")
+        catalog_file = str(Path(folder) / "catalog.bin")
+        save_snapshot(repository, snapshot_file, paths)
+        write_catalog(repository, catalog_file, paths)
+        del repository
+
+        print(f"{num_books} books, {num_workers} workers")
+        print(f"{'catalog':>9} {'load (s)':>9} {'Pss per worker (MB)':>20} {'private per worker (MB)':>24}")
+        for kind, file_name in (("snapshot", snapshot_file), ("mapped", catalog_file)):
+            measured = run(kind, file_name, paths, num_books, num_workers)
+            pss = sum(result[0] for result in measured) / num_workers
+            private = sum(result[1] for result in measured) / num_workers
+            seconds = sum(result[2] for result in measured) / num_workers
+            print(f"{kind:>9} {seconds:>9.2f} {pss:>20.1f} {private:>24.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else 4)
@@ -0,0 +1,41 @@
+"""Speedup of multi-process parsing of the books and reviews files across worker counts.
+
+Only the parse and normalise stages are timed, which are the part that runs in the workers.
+
+    python -m benchmarks.bench_parallel_parse 100000 1 2 4 8
+"""
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import write_catalog
+from library.adapters.jsondatareader import BooksJSONReader
+
+
+def parse_seconds(paths, workers: int) -> float:
+    reader = BooksJSONReader(*paths, workers=workers)
+    start = time.perf_counter()
+    for _ in reader.iter_book_records():
+        pass
+    for _ in reader.iter_review_records():
+        pass
+    return time.perf_counter() - start
+
+
+def main(num_books: int, worker_counts):
+    print(f"{num_books} books on {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_catalog(folder, num_books)
+        serial = None
+        for workers in worker_counts:
+            seconds = parse_seconds(paths, workers)
+            if serial is None:
+                serial = seconds
+            print(f"{workers:>8} {seconds:>9.2f} {serial / seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:]]
+    main(arguments[0] if arguments else 100000, arguments[1:] or [1, 2, 4, 8])
@@ -0,0 +1,74 @@
+"""Lookup latency of MemoryRepository's primary key getters as the repository grows.
+
+The repository is filled with minimal books, authors, publishers and users, then every getter is timed
+on random keys that are present. The scan column times the linear search over the books that get_book
+used before it had an index, for comparison.
+
+    python -m benchmarks.bench_primary_key_lookup 150 10000 100000 1000000
+"""
+import random
+import sys
+import timeit
+
+from library.adapters.repository import MemoryRepository
+from library.domain.model import Author, Book, Publisher, User
+
+LOOKUPS = 10000
+SCANS = 20
+
+
+def num_users(num_books: int) -> int:
+    return max(num_books // 100, 10)
+
+
+def fill(num_books: int) -> MemoryRepository:
+    repository = MemoryRepository()
+    with repository.batch():
+        for user_id in range(num_users(num_books)):
+            repository.add_user(User(f"user{user_id}", "password", str(user_id)))
+        for author_id in range(max(num_books // 10, 10)):
+            repository.add_author(Author(author_id, f"Author {author_id}"))
+        for publisher_id in range(max(num_books // 50, 10)):
+            repository.add_publisher(Publisher(f"Publisher {publisher_id}"))
+        for book_id in range(num_books):
+            repository.add_book(Book(book_id, f"Book {book_id}"))
+    return repository
+
+
+def microseconds_per_call(getter, keys) -> float:
+    seconds = timeit.timeit(lambda: [getter(key) for key in keys], number=1)
+    return seconds / len(keys) * 1e6
+
+
+def scan_get_book(repository: MemoryRepository, book_id):
+    for book in repository.books:
+        if book.book_id == int(book_id):
+            return book
+    return None
+
+
+def main(sizes):
+    rng = random.Random(235)
+    print(f"{'books':>10} {'get_book':>9} {'get_user':>9} {'by_id':>9} {'author':>9} {'publisher':>10} "
+          f"{'scan':>10}  (us per lookup)")
+    for num_books in sizes:
+        repository = fill(num_books)
+        book_keys = [rng.randrange(num_books) for _ in range(LOOKUPS)]
+        user_keys = [rng.randrange(num_users(num_books)) for _ in range(LOOKUPS)]
+        times = [
+            microseconds_per_call(repository.get_book, book_keys),
+            microseconds_per_call(repository.get_user, [f"user{key}" for key in user_keys]),
+            microseconds_per_call(repository.get_user_by_id, [str(key) for key in user_keys]),
+            microseconds_per_call(repository.get_author,
+                                  [rng.randrange(repository.get_num_authors()) for _ in range(LOOKUPS)]),
+            microseconds_per_call(repository.get_publisher,
+                                  [f"Publisher {rng.randrange(repository.get_num_publishers())}"
+                                   for _ in range(LOOKUPS)]),
+            microseconds_per_call(lambda book_id: scan_get_book(repository, book_id), book_keys[:SCANS])
+        ]
+        print(f"{num_books:>10} {times[0]:>9.2f} {times[1]:>9.2f} {times[2]:>9.2f} {times[3]:>9.2f} "
+              f"{times[4]:>10.2f} {times[5]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [150, 10000, 100000, 1000000])
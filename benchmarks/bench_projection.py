@@ -0,0 +1,37 @@
+"""Memory held by the list of parsed book entries, with and without field projection.
+
+    python -m benchmarks.bench_projection 10000 100000
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import write_catalog
+from library.adapters.jsondatareader import BooksJSONReader
+
+
+def measure(reader: BooksJSONReader, projected: bool):
+    tracemalloc.start()
+    start = time.perf_counter()
+    books_json = reader.read_books_file(projected=projected)
+    seconds = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del books_json
+    return held, peak, seconds
+
+
+def main(sizes):
+    print(f"{'books':>10} {'reader':>10} {'held (MB)':>10} {'peak (MB)':>10} {'seconds':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            reader = BooksJSONReader(*write_catalog(folder, size, num_reviews=0))
+            for projected in (False, True):
+                held, peak, seconds = measure(reader, projected)
+                name = "projected" if projected else "full"
+                print(f"{size:>10} {name:>10} {held / 2 ** 20:>10.1f} {peak / 2 ** 20:>10.1f} {seconds:>8.2f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000])
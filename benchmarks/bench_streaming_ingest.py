@@ -0,0 +1,81 @@
+"""Peak RSS and load time of the streaming ingestion pipeline as the book file grows.
+
+Each size is loaded in a fresh interpreter into a repository that counts inserted books and
+reviews instead of keeping them, so the reported RSS is what the reader itself needs.
+
+    python -m benchmarks.bench_streaming_ingest 150 10000 100000 1000000
+"""
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+
+from benchmarks.synthetic import write_catalog
+
+
+class CountingRepository:
+    # keeps the author and publisher dimensions, drops books and reviews after counting them
+    def __init__(self):
+        self.authors = {}
+        self.publishers = {}
+        self.num_books = 0
+        self.num_reviews = 0
+
+    def batch(self):
+        return nullcontext()
+
+    def get_publisher(self, publisher_name):
+        return self.publishers.get(publisher_name)
+
+    def add_publisher(self, publisher):
+        self.publishers[publisher.name] = publisher
+
+    def get_author(self, author_id):
+        return self.authors.get(author_id)
+
+    def add_author(self, author):
+        self.authors[author.unique_id] = author
+
+    def add_book(self, book):
+        self.num_books += 1
+
+    def get_books_by_ids(self, book_ids):
+        return {}
+
+    def get_users_by_ids(self, user_ids):
+        return {}
+
+    def add_review(self, review):
+        self.num_reviews += 1
+
+
+def measure(books_path, authors_path, reviews_path):
+    from library.adapters.jsondatareader import BooksJSONReader
+    repository = CountingRepository()
+    start = time.perf_counter()
+    BooksJSONReader(books_path, authors_path, reviews_path).read_json_files_mem(repository)
+    seconds = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{repository.num_books} {repository.num_reviews} {peak_kb} {seconds}")
+
+
+def main(sizes):
+    print(f"{'books':>10} {'reviews':>10} {'peak RSS (MB)':>14} {'seconds':>9} {'us/book':>8}")
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            paths = write_catalog(folder, size)
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_streaming_ingest", "--measure", *paths],
+                                    check=True, capture_output=True, text=True).stdout.split()
+            num_books, num_reviews, peak_kb = (int(value) for value in output[-4:-1])
+            seconds = float(output[-1])
+            print(f"{num_books:>10} {num_reviews:>10} {peak_kb / 1024:>14.1f} {seconds:>9.2f} "
+                  f"{seconds / num_books * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        measure(*sys.argv[2:5])
+    else:
+        main([int(size) for size in sys.argv[1:]] or [150, 10000, 100000, 1000000])
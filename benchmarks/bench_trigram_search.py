@@ -0,0 +1,52 @@
+"""Search-box latency of the trigram title index against a lower-cased substring scan.
+
+Titles are random runs of the words used in the 150 book excerpt's titles, so trigram frequencies look like
+those of real titles while every title is different. Each query is timed on the index and on a scan.
+Queries matching thousands of titles are bound by reading every match's title, not by the search.
+
+    python -m benchmarks.bench_trigram_search 10000 100000 1000000
+"""
+import random
+import re
+import sys
+import timeit
+
+from benchmarks.synthetic import load_templates
+from library.adapters.trigramindex import TrigramIndex
+
+QUERIES = ["sherlock holmes", "superiority trooper", "aquaman", "moskva", "zzzz", "the"]
+
+
+def vocabulary() -> list:
+    books, _ = load_templates()
+    return sorted({word for book in books for word in re.findall(r"[\w.'-]+", book["title"]) if len(word) > 1})
+
+
+def titles(num_titles: int, rng: random.Random) -> list:
+    words = vocabulary()
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(2, 6))) for _ in range(num_titles)]
+
+
+def milliseconds(function) -> float:
+    runs, seconds = timeit.Timer(function).autorange()
+    return seconds / runs * 1e3
+
+
+def main(sizes):
+    rng = random.Random(235)
+    print(f"{'titles':>9} {'query':>20} {'matches':>8} {'index (ms)':>11} {'scan (ms)':>10}")
+    for num_titles in sizes:
+        index = TrigramIndex()
+        texts = titles(num_titles, rng)
+        for row, text in enumerate(texts):
+            index.add(row, text)
+        lowered = [text.lower() for text in texts]
+        for query in QUERIES:
+            matches = len(index.search(query))
+            index_ms = milliseconds(lambda: index.search(query))
+            scan_ms = milliseconds(lambda: [row for row, text in enumerate(lowered) if query.lower() in text])
+            print(f"{num_titles:>9} {query:>20} {matches:>8} {index_ms:>11.3f} {scan_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,50 @@
+"""Cold start (parse the json files) against warm start (load the repository snapshot) for the memory repository.
+
+    python -m benchmarks.bench_warm_start 150 10000 100000
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import write_catalog, DATA_FOLDER
+import library.adapters.abstractrepository as repo
+from library.adapters.abstractrepository import add_users
+from library.adapters.jsondatareader import BooksJSONReader
+from library.adapters.repository import MemoryRepository
+from library.adapters.snapshot import save_snapshot, load_snapshot
+
+
+def main(sizes):
+    users_file = str(DATA_FOLDER / "users.txt")
+    print(f"{'books':>10} {'cold (s)':>9} {'save (s)':>9} {'warm (s)':>9} {'snapshot (MB)':>14}")
+    with tempfile.TemporaryDirectory() as folder:
+        snapshot_file = str(Path(folder) / "repository.snapshot")
+        for size in sizes:
+            paths = write_catalog(folder, size)
+            source_files = [*paths, users_file]
+
+            start = time.perf_counter()
+            repo.repo_instance = MemoryRepository()
+            add_users(users_file)
+            BooksJSONReader(*paths).read_json_files(repo.repo_instance)
+            repo.populate()
+            cold = time.perf_counter() - start
+
+            start = time.perf_counter()
+            save_snapshot(repo.repo_instance, snapshot_file, source_files)
+            save = time.perf_counter() - start
+            repo.repo_instance = None
+
+            start = time.perf_counter()
+            repo.repo_instance = load_snapshot(snapshot_file, source_files)
+            warm = time.perf_counter() - start
+            assert repo.repo_instance.get_num_books() == size
+
+            megabytes = os.path.getsize(snapshot_file) / 1024 / 1024
+            print(f"{size:>10} {cold:>9.2f} {save:>9.2f} {warm:>9.2f} {megabytes:>14.1f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [150, 10000, 100000])
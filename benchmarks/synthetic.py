@@ -0,0 +1,58 @@
+"""Writes synthetic catalog files in the same JSON lines format as library/adapters/data.
+
+The records are copies of the 150 book excerpt with fresh book and author ids, so the
+benchmarks can grow the catalog to any size while keeping realistic record shapes.
+"""
+import json
+import random
+from pathlib import Path
+
+from utils import get_project_root
+
+DATA_FOLDER = get_project_root() / "library" / "adapters" / "data"
+
+
+def load_templates():
+    with open(DATA_FOLDER / "150.json", encoding='UTF-8') as books_jsonfile:
+        books = [json.loads(line) for line in books_jsonfile]
+    with open(DATA_FOLDER / "reviews.json", encoding='UTF-8') as reviews_jsonfile:
+        reviews = [json.loads(line) for line in reviews_jsonfile]
+    return books, reviews
+
+
+def write_catalog(folder, num_books: int, num_authors: int = None, num_reviews: int = None, seed: int = 235):
+    # returns the (books, authors, reviews) paths written into folder
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    book_templates, review_templates = load_templates()
+    if num_authors is None:
+        num_authors = max(1, num_books // 2)
+    if num_reviews is None:
+        num_reviews = num_books * 2
+
+    books_path = folder / f"books_{num_books}.json"
+    authors_path = folder / f"authors_{num_books}.json"
+    reviews_path = folder / f"reviews_{num_books}.json"
+
+    with open(authors_path, "w", encoding='UTF-8') as authors_jsonfile:
+        for author_id in range(num_authors):
+            authors_jsonfile.write(json.dumps({"average_rating": "4.00", "author_id": str(author_id),
+                                               "text_reviews_count": "1", "name": f"Author {author_id}",
+                                               "ratings_count": "1"}) + "\n")
+
+    with open(books_path, "w", encoding='UTF-8') as books_jsonfile:
+        for book_id in range(num_books):
+            book_json = dict(book_templates[book_id % len(book_templates)])
+            book_json["book_id"] = str(book_id)
+            book_json["authors"] = [{"author_id": str(rng.randrange(num_authors)), "role": ""}
+                                    for _ in range(1 + book_id % 2)]
+            books_jsonfile.write(json.dumps(book_json) + "\n")
+
+    with open(reviews_path, "w", encoding='UTF-8') as reviews_jsonfile:
+        for review_number in range(num_reviews):
+            review_json = dict(review_templates[review_number % len(review_templates)])
+            review_json["book_id"] = str(rng.randrange(num_books))
+            reviews_jsonfile.write(json.dumps(review_json) + "\n")
+
+    return str(books_path), str(authors_path), str(reviews_path)
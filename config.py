@@ -11,3 +11,11 @@ class Config:
     REPOSITORY = environ.get("REPOSITORY")
     SQLALCHEMY_DATABASE_URI = environ.get("SQLALCHEMY_DATABASE_URI")
     SQLALCHEMY_ECHO = environ.get("SQLALCHEMY_ECHO")
+    INGEST_WORKERS = environ.get("INGEST_WORKERS")
+    SNAPSHOT_PATH = environ.get("SNAPSHOT_PATH")
+    CATALOG_PATH = environ.get("CATALOG_PATH")
+    WAL_PATH = environ.get("WAL_PATH")
+    WAL_SYNC_SECONDS = environ.get("WAL_SYNC_SECONDS")
+    INGEST_POLL_SECONDS = environ.get("INGEST_POLL_SECONDS")
+    INGEST_PROFILE = environ.get("INGEST_PROFILE")
+    INGEST_PROFILE_MEMORY = environ.get("INGEST_PROFILE_MEMORY")
@@ -1,4 +1,5 @@
 """Initialize Flask app."""
+import atexit
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, clear_mappers
@@ -8,22 +9,117 @@ from flask import Flask, render_template
 import library.adapters.abstractrepository as repo
 from library.adapters.abstractrepository import add_users, populate
 from library.adapters.repository import MemoryRepository
+from library.adapters.mappedcatalog import catalog_lock, open_catalog, write_catalog
+from library.adapters.mappedrepository import MappedRepository
 from library.adapters import databaserepository
 from library.adapters.jsondatareader import BooksJSONReader
 from library.adapters.orm import map_model_to_tables, metadata
+from library.adapters.profiler import IngestProfiler
+from library.adapters.snapshot import load_snapshot, save_snapshot
+from library.adapters.writeaheadlog import SYNC_SECONDS, WriteAheadLog
+
+BOOKS_FILE = "library/adapters/data/150.json"
+AUTHORS_FILE = "library/adapters/data/output.json"
+REVIEWS_FILE = "library/adapters/data/reviews.json"
+USERS_FILE = "library/adapters/data/users.txt"
+
+
+# The users, reviews and reading list entries written since the snapshot or data files were read are made
+# again from the write-ahead log at WAL_PATH, which the repository appends new ones to
+def attach_write_ahead_log(app, profiler: IngestProfiler, repository) -> WriteAheadLog:
+    log_file = app.config['WAL_PATH']
+    log = WriteAheadLog(log_file, float(app.config['WAL_SYNC_SECONDS'] or SYNC_SECONDS))
+    with profiler.stage("log: replay"):
+        print(f"Replayed {log.replay(repository)} writes from {log_file}")
+    repository.attach_log(log)
+    atexit.register(log.close)
+    return log
 
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object("config.Config")
-    reader = BooksJSONReader("library/adapters/data/150.json",
-                             "library/adapters/data/output.json",
-                             "library/adapters/data/reviews.json")
-    if app.config['REPOSITORY'] == 'memory':
-        repo.repo_instance = MemoryRepository()
-        add_users("library/adapters/data/users.txt")
-        reader.read_json_files(repo.repo_instance)
-        repo.populate()
+    # INGEST_PROFILE prints a report of the time, records and peak memory of each stage of populating the
+    # repository, or writes it as json when it names a .json file
+    profiler = IngestProfiler(trace_memory=app.config['INGEST_PROFILE_MEMORY'] != "False")
+    if app.config['INGEST_PROFILE']:
+        profiler.start()
+    reader = BooksJSONReader(BOOKS_FILE, AUTHORS_FILE, REVIEWS_FILE, int(app.config['INGEST_WORKERS'] or 1), profiler)
+    if app.config['REPOSITORY'] == 'memory' and app.config['CATALOG_PATH']:
+        # every worker maps the same read-only catalog file. The first to take the catalog's lock writes it from
+        # the data files when it is missing or out of date, the others wait for it and then map what it wrote.
+        catalog_file = app.config['CATALOG_PATH']
+        catalog_sources = [BOOKS_FILE, AUTHORS_FILE]
+        with catalog_lock(catalog_file):
+            with profiler.stage("catalog: open"):
+                catalog = open_catalog(catalog_file, catalog_sources)
+            if catalog is None:
+                repository = MemoryRepository()
+                reader.read_json_files(repository)
+                with profiler.stage("catalog: write"):
+                    write_catalog(repository, catalog_file, catalog_sources)
+                    catalog = open_catalog(catalog_file, catalog_sources)
+                del repository
+        repo.repo_instance = MappedRepository(catalog)
+        with profiler.stage("users"):
+            add_users(USERS_FILE)
+        reader.read_json_reviews(repo.repo_instance)
+        with profiler.stage("populate"):
+            repo.populate()
+        reader.mark_files_read()
+        if app.config['WAL_PATH']:
+            # there is no snapshot to compact the log into, so every start replays all of it
+            attach_write_ahead_log(app, profiler, repo.repo_instance)
+
+        @app.before_request
+        def pin_repository_version():
+            repo.repo_instance.pin_version()
+
+        @app.teardown_request
+        def unpin_repository_version(exception=None):
+            repo.repo_instance.unpin_version()
+    elif app.config['REPOSITORY'] == 'memory':
+        snapshot_file = app.config['SNAPSHOT_PATH']
+        source_files = [BOOKS_FILE, AUTHORS_FILE, REVIEWS_FILE, USERS_FILE]
+        repo.repo_instance = None
+        if snapshot_file:
+            with profiler.stage("snapshot: load"):
+                repo.repo_instance = load_snapshot(snapshot_file, source_files)
+        if repo.repo_instance is None:
+            repo.repo_instance = MemoryRepository()
+            with profiler.stage("users"):
+                add_users(USERS_FILE)
+            reader.read_json_files(repo.repo_instance)
+            with profiler.stage("populate"):
+                repo.populate()
+            if snapshot_file:
+                with profiler.stage("snapshot: save"):
+                    save_snapshot(repo.repo_instance, snapshot_file, source_files)
+        else:
+            reader.mark_files_read()
+        log_file = app.config['WAL_PATH']
+        if log_file:
+            log = attach_write_ahead_log(app, profiler, repo.repo_instance)
+
+            # folds the log into the snapshot, so the next start replays only what was written after it.
+            # Run it with the app stopped: flask compact-log
+            @app.cli.command("compact-log")
+            def compact_log():
+                if not snapshot_file:
+                    print("Set SNAPSHOT_PATH to compact the write-ahead log into a snapshot")
+                    return
+                save_snapshot(repo.repo_instance, snapshot_file, source_files)
+                print(f"Compacted {log.compact()} writes from {log_file} into {snapshot_file}")
+
+        # each request reads the repository version that was current when it started, even if writes are
+        # published while it runs
+        @app.before_request
+        def pin_repository_version():
+            repo.repo_instance.pin_version()
+
+        @app.teardown_request
+        def unpin_repository_version(exception=None):
+            repo.repo_instance.unpin_version()
     elif app.config['REPOSITORY'] == 'database':
         database_uri = app.config['SQLALCHEMY_DATABASE_URI']
         database_echo = app.config['SQLALCHEMY_ECHO']
@@ -33,19 +129,35 @@ def create_app():
         repo.repo_instance = databaserepository.SqlAlchemyRepository(session_factory)
         if app.config["TESTING"] == "True" or len(database_engine.table_names()) == 0:
             #print("Repopulating Database")
-            clear_mappers()
-            metadata.create_all(database_engine)
-            for table in reversed(metadata.sorted_tables):
-                database_engine.execute(table.delete())
-            map_model_to_tables()
+            with profiler.stage("database: reset"):
+                clear_mappers()
+                metadata.create_all(database_engine)
+                for table in reversed(metadata.sorted_tables):
+                    database_engine.execute(table.delete())
+                map_model_to_tables()
 
-            add_users("library/adapters/data/users.txt")
-            populate()
+            with profiler.stage("users"):
+                add_users(USERS_FILE)
+            with profiler.stage("populate"):
+                populate()
             reader.read_json_files()
             print("Finished populating")
         else:
             map_model_to_tables()
+            reader.mark_files_read()
+
+    if profiler.running:
+        profiler.finish()
+        if app.config['INGEST_PROFILE'].endswith(".json"):
+            profiler.write_report(app.config['INGEST_PROFILE'])
+        else:
+            profiler.print_report()
 
+    if app.config['INGEST_POLL_SECONDS'] and isinstance(repo.repo_instance, MappedRepository):
+        print("The mapped catalog is read-only, write it again to pick up new books")
+    elif app.config['INGEST_POLL_SECONDS']:
+        # picks up lines appended to the books and reviews files while the app is running
+        reader.start_polling(repo.repo_instance, float(app.config['INGEST_POLL_SECONDS']))
 
     with app.app_context():
         from .books_blueprint import books
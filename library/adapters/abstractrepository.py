@@ -1,6 +1,8 @@
 import abc
-from typing import List
+from datetime import datetime
+from typing import List, Dict
 
+from library.adapters.bookquery import BookQuery
 from library.domain.model import Publisher, Author, Book, SearchMethod, User, Review, ReadingCollection
 
 repo_instance = None
@@ -33,8 +35,18 @@ class AbstractRepository(abc.ABC):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def get_reviews(self, book: Book) -> List[Review]:
-        # returns reviews of a given book.
+    def get_reviews(self, book: Book, limit: int = None, before: datetime = None,
+                    before_id: int = None) -> List[Review]:
+        # returns reviews of a given book, newest first and by review_id among reviews written at the same time.
+        # limit caps the number returned and before only returns reviews written before that time, or with
+        # before_id as well, the reviews that come after the one with that timestamp and review_id. The
+        # timestamp and review_id of the last review shown fetch the next page.
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_user_reviews(self, user: User, limit: int = None, before: datetime = None,
+                         before_id: int = None) -> List[Review]:
+        # returns reviews written by a given user, newest first, paged like get_reviews
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -47,6 +59,11 @@ class AbstractRepository(abc.ABC):
         # gets a user based on the given user_name
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_users_by_ids(self, user_ids) -> Dict[str, User]:
+        # gets the users with any of the given user_ids, keyed by user_id. Ids that are not found are left out
+        raise NotImplementedError
+
     @abc.abstractmethod
     def add_book(self, book: Book):
         # adds a book to the repository
@@ -57,6 +74,30 @@ class AbstractRepository(abc.ABC):
         # gets a book based on the given book_id
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_books_by_ids(self, book_ids) -> Dict[int, Book]:
+        # gets the books with any of the given book_ids, keyed by book_id. Ids that are not found are left out
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_books_page(self, limit: int, after: int = None) -> List[Book]:
+        # returns up to limit books in order of book_id. after only returns books with a higher book_id, so the
+        # book_id of the last book shown fetches the next page
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_top_books(self, ranking: str, limit: int, tag: str = None, publisher: Publisher = None) -> List[Book]:
+        # returns up to limit books with the highest 'rating', the most 'reviews' or the most pages ('num_pages'),
+        # best first and ties in order of book_id, among the books with the tag and the publisher when given.
+        # Books without a value to rank, or without reviews, are left out
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_facet_counts(self, book_ids=None) -> Dict[str, dict]:
+        # returns, for each of 'tag', 'publisher', 'decade' and 'format' ('ebook' or 'print'), the number of books
+        # with each value, the most common first. Counts every book unless book_ids names the books to count
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get_num_books(self) -> int:
         # returns the amount of books in the repository
@@ -67,14 +108,38 @@ class AbstractRepository(abc.ABC):
         # returns books with the given tag
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_tag_counts(self, tags) -> Dict[str, int]:
+        # returns the number of books with each of the given tags, keyed by tag name
+        raise NotImplementedError
+
     @abc.abstractmethod
     def get_books_by_author(self, author: Author) -> List[Book]:
         # gets books written by an inputted author
         raise NotImplementedError
 
     @abc.abstractmethod
-    def get_books_by_date_range(self, start: int, end: int) -> List[Book]:
-        # gets books within a given publication year range
+    def get_books_by_authors(self, authors) -> List[Book]:
+        # gets the books written by any of the given authors, each book once
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_books_by_date_range(self, start: int = None, end: int = None, descending: bool = False) -> List[Book]:
+        # gets books released from the start year up to and including the end year, oldest first unless
+        # descending. A start or end of None leaves that side of the range open
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def filter_books(self, release_year: tuple = None, rating: tuple = None, num_pages: tuple = None,
+                     ebook: bool = None, publisher: Publisher = None) -> List[Book]:
+        # returns the books matching every given filter. release_year, rating and num_pages take a (low, high)
+        # range, inclusive at both ends, where either end can be None. Books without the attribute never match
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def find_books(self, query: BookQuery, explain: bool = False):
+        # returns the books meeting every condition of the query in ascending order of book_id, or with explain
+        # a QueryPlan of the steps the repository would take to find them
         raise NotImplementedError
 
     @abc.abstractmethod
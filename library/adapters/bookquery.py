@@ -0,0 +1,123 @@
+from typing import List
+
+from library.domain.model import Author, Book, Publisher
+
+
+# whether value is from low up to and including high, either of which can be None to leave that side open
+def in_range(value, bounds: tuple) -> bool:
+    low, high = bounds
+    return value is not None and (low is None or low <= value) and (high is None or value <= high)
+
+
+# a book's tags are a set of names in memory, and Tag objects on books the database loads
+def has_tag(book: Book, tag: str) -> bool:
+    if isinstance(book.tags, set):
+        return tag in book.tags
+    return any(getattr(book_tag, 'tag', book_tag) == tag for book_tag in book.tags)
+
+
+# describes a (low, high) range for plans, such as 2010..2015 or 4.0..
+def range_text(bounds: tuple) -> str:
+    low, high = bounds
+    return f"{'' if low is None else low}..{'' if high is None else high}"
+
+
+class BookQuery:
+    # A combination of conditions for find_books, of which a book has to meet every one that is set.
+    # release_year, rating and num_pages take a (low, high) range, inclusive at both ends, where either end
+    # can be None. A book has to have every one of the tags, and title matches part of the title in any case.
+
+    def __init__(self, tags=(), author: Author = None, publisher: Publisher = None, release_year: tuple = None,
+                 rating: tuple = None, num_pages: tuple = None, ebook: bool = None, title: str = None):
+        self.__tags = tuple(tags)
+        self.__author = author
+        self.__publisher = publisher
+        self.__release_year = release_year
+        self.__rating = rating
+        self.__num_pages = num_pages
+        self.__ebook = ebook
+        self.__title = title
+
+    @property
+    def tags(self) -> tuple:
+        return self.__tags
+
+    @property
+    def author(self) -> Author:
+        return self.__author
+
+    @property
+    def publisher(self) -> Publisher:
+        return self.__publisher
+
+    @property
+    def release_year(self) -> tuple:
+        return self.__release_year
+
+    @property
+    def rating(self) -> tuple:
+        return self.__rating
+
+    @property
+    def num_pages(self) -> tuple:
+        return self.__num_pages
+
+    @property
+    def ebook(self) -> bool:
+        return self.__ebook
+
+    @property
+    def title(self) -> str:
+        return self.__title
+
+    # (name, description, check) for each condition that is set, where check tells whether a book meets it
+    def conditions(self) -> list:
+        conditions = [(f"tag {tag!r}", f"tag {tag!r}", lambda book, tag=tag: has_tag(book, tag))
+                      for tag in self.__tags]
+        if self.__author is not None:
+            conditions.append(("author", f"author {self.__author.unique_id}",
+                               lambda book: self.__author in book.authors))
+        if self.__publisher is not None:
+            conditions.append(("publisher", f"publisher {self.__publisher.name!r}",
+                               lambda book: book.publisher is not None
+                               and book.publisher.name == self.__publisher.name))
+        if self.__release_year is not None:
+            conditions.append(("release_year", f"release_year {range_text(self.__release_year)}",
+                               lambda book: isinstance(book.release_year, int)
+                               and in_range(book.release_year, self.__release_year)))
+        if self.__rating is not None:
+            conditions.append(("rating", f"rating {range_text(self.__rating)}",
+                               lambda book: in_range(book.rating, self.__rating)))
+        if self.__num_pages is not None:
+            conditions.append(("num_pages", f"num_pages {range_text(self.__num_pages)}",
+                               lambda book: in_range(book.num_pages, self.__num_pages)))
+        if self.__ebook is not None:
+            conditions.append(("ebook", f"ebook {self.__ebook}", lambda book: book.ebook is self.__ebook))
+        if self.__title is not None:
+            conditions.append(("title", f"title {self.__title!r}",
+                               lambda book: self.__title.lower() in book.title.lower()))
+        return conditions
+
+    # whether the book meets every condition
+    def matches(self, book: Book) -> bool:
+        return all(check(book) for _, _, check in self.conditions())
+
+    def __repr__(self):
+        return f"<BookQuery {', '.join(description for _, description, _ in self.conditions()) or 'all books'}>"
+
+
+class QueryPlan:
+    # The steps a repository takes to answer a BookQuery, one line each, as find_books returns them in explain mode
+
+    def __init__(self, steps: List[str]):
+        self.__steps = steps
+
+    @property
+    def steps(self) -> List[str]:
+        return self.__steps
+
+    def __str__(self):
+        return "\n".join(self.__steps)
+
+    def __repr__(self):
+        return f"<QueryPlan {self.__steps}>"
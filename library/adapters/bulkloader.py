@@ -0,0 +1,167 @@
+from datetime import datetime
+
+from sqlalchemy import select, func
+
+from library.adapters.orm import metadata, users_table, authors_table, publishers_table, books_table, \
+    reviews_table, tags_table, books_authors_table, books_tags_table
+
+BATCH_SIZE = 5000
+
+
+# the columns each table is filled with, in the order rows are buffered
+COLUMNS = {
+    publishers_table: ('id', 'publisher'),
+    authors_table: ('id', 'author'),
+    tags_table: ('id', 'tag'),
+    books_table: ('id', 'title', 'description', 'publisher_id', 'release_year', 'ebook', 'num_pages', 'image_url',
+                  'rating'),
+    books_authors_table: ('book', 'author'),
+    books_tags_table: ('book_id', 'tag_id'),
+    reviews_table: ('user_id', 'book_id', 'review', 'rating', 'timestamp')
+}
+
+
+class BulkLoader:
+    # Writes normalised book and review records (see jsondatareader.book_record) straight into the tables.
+    # Rows are buffered per table as tuples and sent as executemany inserts on the given connection, so the
+    # caller decides the transaction. The rows match what the row by row ORM load would have stored.
+
+    def __init__(self, connection, batch_size: int = BATCH_SIZE):
+        self.__connection = connection
+        self.__batch_size = batch_size
+        self.__tables = [table for table in metadata.sorted_tables if table in COLUMNS]
+        self.__rows = {table: [] for table in self.__tables}
+        self.__inserts = {table: self.__compile_insert(table) for table in self.__tables}
+        self.__unknown_author_ids = set()
+
+        # keys that are already in the database, so a load on top of existing data does not collide
+        self.__user_ids = set(connection.execute(select(users_table.c.user_id)).scalars())
+        self.__author_ids = set(connection.execute(select(authors_table.c.id)).scalars())
+        self.__book_ids = set(connection.execute(select(books_table.c.id)).scalars())
+        self.__publisher_ids = {name: publisher_id for publisher_id, name in
+                                connection.execute(select(publishers_table.c.id, publishers_table.c.publisher))}
+        self.__tag_ids = {name: tag_id for tag_id, name in
+                          connection.execute(select(tags_table.c.id, tags_table.c.tag))}
+        self.__next_publisher_id = self.__next_id(publishers_table)
+        self.__next_tag_id = self.__next_id(tags_table)
+
+    @property
+    def unknown_author_ids(self) -> set:
+        return self.__unknown_author_ids
+
+    def add_book(self, record: tuple, author_names: dict):
+        book_id, title, publisher_name, release_year, ebook, description, num_pages, rating, image_url, \
+            tag_names, author_ids = record
+        if book_id in self.__book_ids:
+            return
+        if not isinstance(title, str) or title.strip() == "":
+            raise ValueError
+        if release_year is not None and release_year < 0:
+            raise ValueError
+        self.__book_ids.add(book_id)
+
+        self.__add(books_table, (
+            book_id,
+            title.strip(),
+            description.strip() if isinstance(description, str) else None,
+            self.__publisher_id(publisher_name),
+            release_year,
+            ebook,
+            num_pages if num_pages is not None and num_pages >= 0 else 0,
+            image_url,
+            rating if rating is not None and 0 < rating < 5 else None
+        ))
+
+        book_author_ids = []
+        for author_id in author_ids:
+            if author_id in book_author_ids:
+                continue
+            if author_id not in self.__author_ids:
+                if author_id not in author_names:
+                    self.__unknown_author_ids.add(author_id)
+                    continue
+                self.__author_ids.add(author_id)
+                self.__add(authors_table, (author_id, author_names[author_id].strip()))
+            book_author_ids.append(author_id)
+            self.__add(books_authors_table, (book_id, author_id))
+
+        book_tag_ids = {}
+        for tag_name in tag_names or ():
+            tag_id = self.__tag_ids.get(tag_name)
+            if tag_id is None:
+                tag_id = self.__next_tag_id
+                self.__next_tag_id += 1
+                self.__tag_ids[tag_name] = tag_id
+                self.__add(tags_table, (tag_id, tag_name))
+            book_tag_ids[tag_id] = None
+        # a book has dozens of shelves, so its links are buffered in one go
+        self.__add_all(books_tags_table, [(book_id, tag_id) for tag_id in book_tag_ids])
+
+    def add_review(self, record: tuple):
+        user_id, book_id, review_text, rating = record
+        if not isinstance(rating, int) or not 0 <= rating <= 5:
+            raise ValueError
+        self.__add(reviews_table, (
+            user_id if user_id in self.__user_ids else None,
+            book_id if book_id in self.__book_ids else None,
+            review_text.strip() if isinstance(review_text, str) else "N/A",
+            rating,
+            datetime.now()
+        ))
+
+    # writes every buffered row, parents before children
+    def flush(self, table=None):
+        for sorted_table in self.__tables:
+            rows = self.__rows[sorted_table]
+            if rows:
+                statement, processors, positional = self.__inserts[sorted_table]
+                if processors:
+                    rows = [tuple(value if processor is None else processor(value)
+                                  for value, processor in zip(row, processors)) for row in rows]
+                if not positional:
+                    rows = [dict(zip(COLUMNS[sorted_table], row)) for row in rows]
+                self.__connection.exec_driver_sql(statement, rows)
+                self.__rows[sorted_table] = []
+            if sorted_table is table:
+                break
+
+    # A Core insert compiled once for the dialect. Executing it through the driver skips the per row
+    # parameter handling of Connection.execute; the column types' bind processors are applied in flush.
+    def __compile_insert(self, table):
+        dialect = self.__connection.dialect
+        columns = COLUMNS[table]
+        statement = table.insert().compile(dialect=dialect, column_keys=list(columns))
+        processors = [table.c[column].type.bind_processor(dialect) for column in columns]
+        if all(processor is None for processor in processors):
+            processors = None
+        return str(statement), processors, dialect.positional
+
+    def __add(self, table, row: tuple):
+        rows = self.__rows[table]
+        rows.append(row)
+        if len(rows) >= self.__batch_size:
+            # flushing a table first writes the tables that come before it in dependency order
+            self.flush(table)
+
+    def __add_all(self, table, new_rows: list):
+        rows = self.__rows[table]
+        rows.extend(new_rows)
+        if len(rows) >= self.__batch_size:
+            self.flush(table)
+
+    # the row by row load looks publishers up by the raw name but stores them stripped,
+    # so names such as "" never match an existing publisher and get a row per book
+    def __publisher_id(self, publisher_name):
+        publisher_id = self.__publisher_ids.get(publisher_name)
+        if publisher_id is None:
+            name = publisher_name.strip() if isinstance(publisher_name, str) else ""
+            if name == "":
+                name = "N/A"
+            publisher_id = self.__next_publisher_id
+            self.__next_publisher_id += 1
+            self.__publisher_ids.setdefault(name, publisher_id)
+            self.__add(publishers_table, (publisher_id, name))
+        return publisher_id
+
+    def __next_id(self, table) -> int:
+        return (self.__connection.execute(select(func.max(table.c.id))).scalar() or 0) + 1
@@ -0,0 +1,251 @@
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from copy import copy
+from functools import partial
+from itertools import compress
+
+from library.adapters.copyonwrite import SharedList, SharedMap
+
+# a column with at most this many distinct values gets a bin for each value, one with more gets this many
+# bins holding about the same number of rows each
+MAX_BINS = 254
+# the values a column with many distinct values is sampled at to place its bin bounds
+SAMPLE_ROWS = 65536
+# stored in place of a missing value, below every value a book can have
+MISSING_INT = -2 ** 31
+MISSING_RATING = -1.0
+# a mask with fewer than one match in this many rows is searched for its matches instead of compressed
+SPARSE_RATIO = 64
+# the share of rows a range is assumed to match in a column without rows
+UNBUILT_SELECTIVITY = 1 / 3
+
+
+class Column:
+    # One attribute of every row in a typed array, and a byte per row naming the bin its value falls in.
+    # Bin 0 holds the missing values and bin b the values from bounds[b - 1] up to but not including bounds[b].
+    # A range is matched against a whole column with one bytes.translate that maps every bin inside it to 1,
+    # which runs in C. Only the rows of the bins the range cuts through are compared one at a time.
+
+    def __init__(self, typecode: str, missing):
+        self.__values = SharedList(array(typecode))
+        self.__missing = missing
+        # replaced rather than changed, so copies can share them
+        self.__bounds = []
+        # every bin holds a single value
+        self.__exact = True
+        self.__codes = SharedList(bytearray())
+        # the number of rows in each bin
+        self.__counts = [0] * 256
+
+    # the copy shares the values and codes with the original and appends to them by length
+    def __copy__(self):
+        column = Column.__new__(Column)
+        column.__missing = self.__missing
+        column.__values = copy(self.__values)
+        column.__bounds = self.__bounds
+        column.__exact = self.__exact
+        column.__codes = copy(self.__codes)
+        column.__counts = list(self.__counts)
+        return column
+
+    def append(self, value):
+        value = self.__missing if value is None else value
+        self.__values.append(value)
+        bin_number = self.__bin(value)
+        self.__codes.append(bin_number)
+        self.__counts[bin_number] += 1
+
+    # The bin of a value appended after the bins were built. A value below the first bound lowers it, and a
+    # value that is not a bound of an exact column turns its bins into ranges, as they are for a column with
+    # many distinct values, until the next build.
+    def __bin(self, value) -> int:
+        if value == self.__missing:
+            return 0
+        bounds = self.__bounds
+        if not bounds or value < bounds[0]:
+            if bounds:
+                self.__exact = False
+            self.__bounds = [value] + bounds[1:]
+            return 1
+        bin_number = bisect_right(bounds, value)
+        if self.__exact and bounds[bin_number - 1] != value:
+            self.__exact = False
+        return bin_number
+
+    # places every row in a bin again
+    def build(self):
+        values = self.__values[:]
+        distinct = set(values)
+        distinct.discard(self.__missing)
+        if len(distinct) <= MAX_BINS:
+            self.__bounds = sorted(distinct)
+            self.__exact = True
+        else:
+            sample = sorted(value for value in values[::max(len(values) // SAMPLE_ROWS, 1)]
+                            if value != self.__missing)
+            bounds = [min(distinct)]
+            for position in range(1, MAX_BINS):
+                bound = sample[position * len(sample) // MAX_BINS]
+                if bound > bounds[-1]:
+                    bounds.append(bound)
+            self.__bounds = bounds
+            self.__exact = False
+        # the missing value is below the first bound, so it lands in bin 0
+        codes = bytearray(map(partial(bisect_right, self.__bounds), values))
+        self.__codes = SharedList(codes)
+        counts = [0] * 256
+        for bin_number, count in Counter(codes).items():
+            counts[bin_number] = count
+        self.__counts = counts
+
+    # the bins wholly inside the range from low to high, and the bins the range cuts through
+    def __bins(self, low, high) -> tuple:
+        bounds = self.__bounds
+        first = 1 if low is None else max(bisect_right(bounds, low), 1)
+        last = len(bounds) if high is None else bisect_right(bounds, high)
+        inside_bins = []
+        cut_bins = []
+        for bin_number in range(first, last + 1):
+            above_low = low is None or low <= bounds[bin_number - 1]
+            if self.__exact:
+                if above_low:
+                    inside_bins.append(bin_number)
+            elif above_low and (high is None or bin_number < len(bounds) and bounds[bin_number] <= high):
+                inside_bins.append(bin_number)
+            else:
+                cut_bins.append(bin_number)
+        return inside_bins, cut_bins
+
+    # the share of the built rows the range from low to high is expected to match, read off the bin counts
+    # with half of every bin the range cuts through
+    def selectivity(self, low=None, high=None) -> float:
+        if not self.__codes:
+            return UNBUILT_SELECTIVITY
+        inside_bins, cut_bins = self.__bins(low, high)
+        rows = sum(self.__counts[bin_number] for bin_number in inside_bins) + \
+            sum(self.__counts[bin_number] for bin_number in cut_bins) / 2
+        return rows / len(self.__codes)
+
+    # a byte for each row placed in a bin, 1 where its value is from low up to and including high.
+    # Either end can be None to leave that side open, and missing values never match.
+    def mask(self, low=None, high=None) -> bytearray:
+        inside_bins, cut_bins = self.__bins(low, high)
+        table = bytearray(256)
+        for bin_number in inside_bins:
+            table[bin_number] = 1
+        codes = self.__codes[:]
+        mask = codes.translate(table)
+        for bin_number in cut_bins:
+            row = codes.find(bin_number)
+            while row != -1:
+                if self.matches(row, low, high):
+                    mask[row] = 1
+                row = codes.find(bin_number, row + 1)
+        return mask
+
+    # whether the value of a single row is from low up to and including high
+    def matches(self, row: int, low=None, high=None) -> bool:
+        value = self.__values[row]
+        return value != self.__missing and (low is None or low <= value) and (high is None or value <= high)
+
+
+class BookColumns:
+    # The attributes books are filtered on, kept for every book in the order the books were added as typed
+    # arrays aligned by row. A row is placed in the bins of each column as it is added. The bins are placed
+    # by build from the values of the rows at the time, which is due again once the rows have doubled.
+
+    def __init__(self):
+        self.__books = SharedList()
+        self.__publisher_ids = SharedMap()
+        self.__columns = {
+            'release_year': Column('i', MISSING_INT),
+            'rating': Column('d', MISSING_RATING),
+            'num_pages': Column('i', MISSING_INT),
+            'ebook': Column('b', -1),
+            'publisher': Column('i', -1)
+        }
+        self.__built_rows = 0
+
+    def __copy__(self):
+        columns = BookColumns()
+        columns.__books = copy(self.__books)
+        columns.__publisher_ids = copy(self.__publisher_ids)
+        columns.__columns = {name: column.__copy__() for name, column in self.__columns.items()}
+        columns.__built_rows = self.__built_rows
+        return columns
+
+    def __len__(self) -> int:
+        return len(self.__books)
+
+    def append(self, book):
+        self.__books.append(book)
+        columns = self.__columns
+        columns['release_year'].append(book.release_year if isinstance(book.release_year, int) else None)
+        columns['rating'].append(book.rating)
+        columns['num_pages'].append(book.num_pages)
+        columns['ebook'].append(None if book.ebook is None else int(book.ebook))
+        columns['publisher'].append(None if book.publisher is None else
+                                    self.__publisher_ids.setdefault(book.publisher.name, len(self.__publisher_ids)))
+
+    # the number of books filter is expected to return for the same filters, taking the columns as independent
+    def estimate(self, release_year: tuple = None, rating: tuple = None, num_pages: tuple = None,
+                 ebook: bool = None, publisher: str = None) -> float:
+        ranges = self.__ranges(release_year, rating, num_pages, ebook, publisher)
+        if ranges is None:
+            return 0
+        rows = len(self.__books)
+        for name, (low, high) in ranges.items():
+            rows *= self.__columns[name].selectivity(low, high)
+        return rows
+
+    # the filters as a (low, high) range for each column, or None when the publisher has no books
+    def __ranges(self, release_year: tuple, rating: tuple, num_pages: tuple, ebook: bool, publisher: str):
+        ranges = {name: bounds for name, bounds in
+                  (('release_year', release_year), ('rating', rating), ('num_pages', num_pages)) if bounds is not None}
+        if ebook is not None:
+            ranges['ebook'] = (int(ebook), int(ebook))
+        if publisher is not None:
+            if publisher not in self.__publisher_ids:
+                return None
+            publisher_id = self.__publisher_ids[publisher]
+            ranges['publisher'] = (publisher_id, publisher_id)
+        return ranges
+
+    @property
+    def needs_build(self) -> bool:
+        return len(self.__books) > 2 * self.__built_rows
+
+    def build(self):
+        for column in self.__columns.values():
+            column.build()
+        self.__built_rows = len(self.__books)
+
+    # The books matching every given filter, in the order they were added. release_year, rating and num_pages
+    # take a (low, high) range where either end can be None, ebook a bool and publisher a publisher name.
+    def filter(self, release_year: tuple = None, rating: tuple = None, num_pages: tuple = None, ebook: bool = None,
+               publisher: str = None) -> list:
+        ranges = self.__ranges(release_year, rating, num_pages, ebook, publisher)
+        if ranges is None:
+            return []
+        if not ranges:
+            return list(self.__books)
+
+        masks = [self.__columns[name].mask(low, high) for name, (low, high) in ranges.items()]
+        mask = masks[0]
+        if len(masks) > 1:
+            # the masks of the columns are combined as integers, a byte for each row
+            combined = -1
+            for column_mask in masks:
+                combined &= int.from_bytes(column_mask, 'little')
+            mask = combined.to_bytes(len(self.__books), 'little')
+        if mask.count(1) * SPARSE_RATIO < len(mask):
+            # a few matches are found faster by searching for them than by going through every row
+            books = []
+            row = mask.find(1)
+            while row != -1:
+                books.append(self.__books[row])
+                row = mask.find(1, row + 1)
+        else:
+            books = list(compress(self.__books, mask))
+        return books
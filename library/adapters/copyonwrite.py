@@ -0,0 +1,330 @@
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping, Sequence
+from copy import copy
+
+# bits of a key's hash that pick the entry at each of the two levels of a SharedMap above its leaves
+BRANCH_BITS = 6
+BRANCHES = 1 << BRANCH_BITS
+BRANCH_MASK = BRANCHES - 1
+# a SortedIndex chunk with more pairs than this is split in two
+CHUNK_SIZE = 512
+_MISSING = object()
+
+
+class VersionWriter:
+    # Builds the next version of a set of containers without changing the current one, which readers may still
+    # be using. The first change to a container copies it and later changes go to the copy, so a batch of writes
+    # copies each of them once. The containers of a repository version are the shared structures below, whose
+    # copies share everything with the original and copy only what is changed, so a write costs time in
+    # proportion to what it changes rather than to the size of the containers.
+
+    def __init__(self, version):
+        self.__version = copy(version)
+        self.__version.number += 1
+        # the containers made by this writer, by id, which it can change in place
+        self.__owned = {}
+
+    @property
+    def version(self):
+        return self.__version
+
+    # the named container of the new version, copied the first time it is asked for
+    def field(self, name: str):
+        value = getattr(self.__version, name)
+        if id(value) not in self.__owned:
+            value = self.__own(copy(value))
+            setattr(self.__version, name, value)
+        return value
+
+    # sets the named container of the new version to one the writer built itself
+    def replace(self, name: str, value):
+        setattr(self.__version, name, self.__own(value))
+
+    # the value under key in a mapping returned by field, copied with copy_item the first time it is asked for,
+    # or made by new when the key is missing
+    def item(self, mapping, key, new, copy_item=copy):
+        value = mapping.get(key)
+        if value is None:
+            value = new()
+        elif id(value) in self.__owned:
+            return value
+        else:
+            value = copy_item(value)
+        mapping[key] = self.__own(value)
+        return value
+
+    def __own(self, value):
+        self.__owned[id(value)] = value
+        return value
+
+
+class SharedList(Sequence):
+    # The first length items of a list or array that only ever grows. A copy shares the items with the original
+    # and has a length of its own, so appending to the copy leaves the original holding what it held. One copy
+    # is appended to at a time, as a repository makes one write at a time: items past the length were appended
+    # by a write that was never published, and the next append drops them.
+
+    def __init__(self, items=None):
+        self.__items = [] if items is None else items
+        self.__length = len(self.__items)
+
+    def __copy__(self):
+        shared = SharedList.__new__(SharedList)
+        shared.__items = self.__items
+        shared.__length = self.__length
+        return shared
+
+    # a snapshot holds only the list's own items
+    def __getstate__(self):
+        return self.__items[:self.__length]
+
+    def __setstate__(self, items):
+        self.__items = items
+        self.__length = len(items)
+
+    def __len__(self) -> int:
+        return self.__length
+
+    # an int index gives an item and a slice a list, or an array of the same type for an array
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.__length)
+            if step == 1:
+                return self.__items[start:stop]
+            return self.__items[:self.__length][index]
+        if index < 0:
+            index += self.__length
+        if not 0 <= index < self.__length:
+            raise IndexError("SharedList index out of range")
+        return self.__items[index]
+
+    def __iter__(self):
+        return iter(self.__items[:self.__length])
+
+    # The list or array the items are kept in, which can hold items past the length. Reading it at positions
+    # known to be below the length saves a method call for each item.
+    @property
+    def backing(self):
+        return self.__items
+
+    def __repr__(self) -> str:
+        return f"SharedList({self[:]!r})"
+
+    def append(self, item):
+        if len(self.__items) > self.__length:
+            del self.__items[self.__length:]
+        self.__items.append(item)
+        self.__length += 1
+
+    def extend(self, items):
+        if len(self.__items) > self.__length:
+            del self.__items[self.__length:]
+        self.__items.extend(items)
+        self.__length = len(self.__items)
+
+
+class SharedMap(Mapping):
+    # A dict split into leaf dicts by the hash of its keys, under a root and branches of BRANCHES entries each.
+    # A copy shares the whole tree with the original. Setting a key in the copy copies the root, the branch and
+    # the leaf on the key's path the first time the copy changes them, and changes its own copies in place
+    # after that, so the original holds what it held. Keys come in no particular order.
+
+    def __init__(self, items=()):
+        self.__root = [None] * BRANCHES
+        self.__size = 0
+        # the ids of the nodes this map made, which no other map shares
+        self.__owned = {id(self.__root)}
+        for key, value in items:
+            self[key] = value
+
+    def __copy__(self):
+        shared = SharedMap.__new__(SharedMap)
+        shared.__root = self.__root
+        shared.__size = self.__size
+        shared.__owned = set()
+        # the nodes are shared now, so the original copies them before changing them as well
+        self.__owned = set()
+        return shared
+
+    # keys are placed by their hash, which can differ between processes, so a snapshot holds the pairs
+    def __getstate__(self):
+        return list(self.items())
+
+    def __setstate__(self, items):
+        self.__init__(items)
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def get(self, key, default=None):
+        code = hash(key)
+        branch = self.__root[code & BRANCH_MASK]
+        if branch is not None:
+            leaf = branch[code >> BRANCH_BITS & BRANCH_MASK]
+            if leaf is not None:
+                return leaf.get(key, default)
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __leaves(self):
+        for branch in self.__root:
+            if branch is not None:
+                for leaf in branch:
+                    if leaf is not None:
+                        yield leaf
+
+    def __iter__(self):
+        for leaf in self.__leaves():
+            yield from leaf
+
+    def values(self):
+        for leaf in self.__leaves():
+            yield from leaf.values()
+
+    def items(self):
+        for leaf in self.__leaves():
+            yield from leaf.items()
+
+    def __setitem__(self, key, value):
+        leaf = self.__leaf(hash(key))
+        if key not in leaf:
+            self.__size += 1
+        leaf[key] = value
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = value = default
+        return value
+
+    # the leaf the hash falls in, with the nodes on its path copied if this map did not make them
+    def __leaf(self, code: int) -> dict:
+        if id(self.__root) not in self.__owned:
+            self.__root = self.__own(list(self.__root))
+        branch = self.__child(self.__root, code & BRANCH_MASK, lambda: [None] * BRANCHES, list)
+        return self.__child(branch, code >> BRANCH_BITS & BRANCH_MASK, dict, dict)
+
+    def __child(self, node: list, position: int, new, copy_node):
+        child = node[position]
+        if child is None:
+            child = node[position] = self.__own(new())
+        elif id(child) not in self.__owned:
+            child = node[position] = self.__own(copy_node(child))
+        return child
+
+    def __own(self, node):
+        self.__owned.add(id(node))
+        return node
+
+
+class SortedIndex:
+    # (key, value) pairs in order of key, held in chunks of at most CHUNK_SIZE pairs. A copy shares the chunks
+    # with the original and copies only the lists of them, so inserting into the copy costs a copy of those lists
+    # and of the one chunk the pair goes in. Pairs with equal keys stay in the order they were inserted.
+
+    def __init__(self):
+        # the keys and the values of each chunk, the key of each chunk's last pair, and the position of each
+        # chunk's first pair among all the pairs
+        self.__keys = []
+        self.__values = []
+        self.__maxes = []
+        self.__starts = []
+        self.__length = 0
+        # the ids of the chunks this index made, which no other index shares
+        self.__owned = set()
+
+    def __copy__(self):
+        index = SortedIndex()
+        index.__keys = list(self.__keys)
+        index.__values = list(self.__values)
+        index.__maxes = list(self.__maxes)
+        index.__starts = list(self.__starts)
+        index.__length = self.__length
+        # the chunks are shared now, so the original copies them before changing them as well
+        self.__owned = set()
+        return index
+
+    def __getstate__(self):
+        return self.__keys, self.__values, self.__maxes, self.__starts, self.__length
+
+    def __setstate__(self, state):
+        self.__keys, self.__values, self.__maxes, self.__starts, self.__length = state
+        self.__owned = set()
+
+    def __len__(self) -> int:
+        return self.__length
+
+    def insert(self, key, value):
+        if not self.__keys:
+            self.__keys.append(self.__own([key]))
+            self.__values.append(self.__own([value]))
+            self.__maxes.append(key)
+            self.__starts.append(0)
+            self.__length = 1
+            return
+        # the chunk holding the first key above key, or the last chunk when there is none
+        chunk = min(bisect_right(self.__maxes, key), len(self.__keys) - 1)
+        keys = self.__chunk(self.__keys, chunk)
+        values = self.__chunk(self.__values, chunk)
+        position = bisect_right(keys, key)
+        keys.insert(position, key)
+        values.insert(position, value)
+        self.__maxes[chunk] = keys[-1]
+        starts = self.__starts
+        for later in range(chunk + 1, len(starts)):
+            starts[later] += 1
+        self.__length += 1
+        if len(keys) > CHUNK_SIZE:
+            half = len(keys) // 2
+            self.__keys.insert(chunk + 1, self.__own(keys[half:]))
+            self.__values.insert(chunk + 1, self.__own(values[half:]))
+            del keys[half:]
+            del values[half:]
+            self.__maxes.insert(chunk, keys[-1])
+            starts.insert(chunk + 1, starts[chunk] + half)
+
+    def __chunk(self, chunks: list, chunk: int) -> list:
+        if id(chunks[chunk]) not in self.__owned:
+            chunks[chunk] = self.__own(list(chunks[chunk]))
+        return chunks[chunk]
+
+    def __own(self, chunk: list) -> list:
+        self.__owned.add(id(chunk))
+        return chunk
+
+    # the position of the first pair whose key is not below key
+    def bisect_left(self, key) -> int:
+        chunk = bisect_left(self.__maxes, key)
+        if chunk == len(self.__maxes):
+            return self.__length
+        return self.__starts[chunk] + bisect_left(self.__keys[chunk], key)
+
+    # the position of the first pair whose key is above key
+    def bisect_right(self, key) -> int:
+        chunk = bisect_right(self.__maxes, key)
+        if chunk == len(self.__maxes):
+            return self.__length
+        return self.__starts[chunk] + bisect_right(self.__keys[chunk], key)
+
+    # the values of the pairs from position start up to but not including stop
+    def values(self, start: int = 0, stop: int = None) -> list:
+        stop = self.__length if stop is None else min(stop, self.__length)
+        if start >= stop:
+            return []
+        starts, chunks = self.__starts, self.__values
+        first = bisect_right(starts, start) - 1
+        last = bisect_left(starts, stop) - 1
+        values = chunks[first][start - starts[first]:stop - starts[first]]
+        for chunk in range(first + 1, last):
+            values.extend(chunks[chunk])
+        if last > first:
+            values.extend(chunks[last][:stop - starts[last]])
+        return values
@@ -1,16 +1,26 @@
 import random
-from datetime import date
-from typing import List
-from sqlalchemy import desc, asc, delete, select, func
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import List, Dict
+from sqlalchemy import desc, asc, delete, select, func, text, and_, or_
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 
-from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm import scoped_session, selectinload
 from flask import _app_ctx_stack
 
 from library.adapters.abstractrepository import AbstractRepository
-from library.adapters.orm import tags_table, books_authors_table, books_tags_table
+from library.adapters.bulkloader import BulkLoader, BATCH_SIZE
+from library.adapters.bookquery import BookQuery, QueryPlan
+from library.adapters.facets import FACETS, most_common_first
+from library.adapters.leaderboard import RANKINGS
+from library.adapters.orm import tags_table, books_authors_table, books_tags_table, reviews_table, books_table, \
+    publishers_table
 from library.domain.model import Book, User, Author, Publisher, Review, Tag
 
+# ids bound into one IN clause, well below the variable limit of older SQLite builds
+MAX_IN_IDS = 500
+
 
 class SessionContextManager:
     def __init__(self, session_factory):
@@ -55,6 +65,19 @@ class SqlAlchemyRepository(AbstractRepository):
     def reset_session(self):
         self._session_cm.reset_session()
 
+    # yields a BulkLoader whose rows are all written in a single transaction when the block exits
+    @contextmanager
+    def bulk_loader(self, batch_size: int = BATCH_SIZE):
+        # the session's pending changes are committed first, an open write on it would lock the database out
+        self._session_cm.commit()
+        engine = self._session_cm.session.get_bind()
+        with engine.begin() as connection:
+            loader = BulkLoader(connection, batch_size)
+            yield loader
+            loader.flush()
+        # objects the session already holds may now have stale relationships, such as user reviews
+        self._session_cm.session.expire_all()
+
     def books(self) -> List[Book]:
         return self._session_cm.session.query(Book).all()
 
@@ -79,15 +102,28 @@ class SqlAlchemyRepository(AbstractRepository):
                 scm.rollback()
             #print('added Review', review)
 
-    def get_reviews(self, book: Book) -> List[Review]:
-        print(f"BOOK_ID FOR REVIEWS {book.book_id}")
-        reviews = None
-        try:
-            reviews = self._session_cm.session.query(Review).filter(Review._Review__book == book).all()
-
-        except NoResultFound:
-            pass
-        return reviews
+    def get_reviews(self, book: Book, limit: int = None, before: datetime = None,
+                    before_id: int = None) -> List[Review]:
+        query = self._session_cm.session.query(Review).filter(Review._Review__book == book)
+        return self.__review_page(query, limit, before, before_id)
+
+    def get_user_reviews(self, user: User, limit: int = None, before: datetime = None,
+                         before_id: int = None) -> List[Review]:
+        query = self._session_cm.session.query(Review).filter(reviews_table.c.user_id == user.user_id)
+        return self.__review_page(query, limit, before, before_id)
+
+    # newest first, walking the reviews_*_timestamp index, which holds the id of each row after its timestamp
+    @staticmethod
+    def __review_page(query, limit: int, before: datetime, before_id: int) -> List[Review]:
+        if before is not None and before_id is not None:
+            query = query.filter(or_(Review._Review__timestamp < before,
+                                     and_(Review._Review__timestamp == before, reviews_table.c.id < before_id)))
+        elif before is not None:
+            query = query.filter(Review._Review__timestamp < before)
+        query = query.order_by(desc(Review._Review__timestamp), desc(reviews_table.c.id))
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
 
     def add_user(self, user: User):
         # print("adding", user)
@@ -117,6 +153,14 @@ class SqlAlchemyRepository(AbstractRepository):
             pass
         return user
 
+    # one query per MAX_IN_IDS user ids
+    def get_users_by_ids(self, user_ids) -> Dict[str, User]:
+        users = {}
+        for chunk in self.__id_chunks(user_ids):
+            for user in self._session_cm.session.query(User).filter(User._User__user_id.in_(chunk)):
+                users[user.user_id] = user
+        return users
+
     def add_book(self, book: Book):
         #print(f"adding book {book}")
         with self._session_cm as scm:
@@ -134,6 +178,27 @@ class SqlAlchemyRepository(AbstractRepository):
             pass
         return book
 
+    # one query per MAX_IN_IDS book ids
+    def get_books_by_ids(self, book_ids) -> Dict[int, Book]:
+        books = {}
+        for chunk in self.__id_chunks(int(book_id) for book_id in book_ids):
+            for book in self._session_cm.session.query(Book).filter(Book._Book__book_id.in_(chunk)):
+                books[book.book_id] = book
+        return books
+
+    @staticmethod
+    def __id_chunks(ids) -> list:
+        ids = list(set(ids))
+        return [ids[start:start + MAX_IN_IDS] for start in range(0, len(ids), MAX_IN_IDS)]
+
+    # keyset pagination on the primary key, so a page is a range scan however deep it is. The listing shows
+    # each book's authors, which are loaded for the whole page in one more query
+    def get_books_page(self, limit: int, after: int = None) -> List[Book]:
+        query = self._session_cm.session.query(Book).options(selectinload(Book._Book__authors))
+        if after is not None:
+            query = query.filter(books_table.c.id > after)
+        return query.order_by(books_table.c.id).limit(limit).all()
+
     def get_num_books(self) -> int:
         return self._session_cm.session.query(Book).count()
 
@@ -147,6 +212,44 @@ class SqlAlchemyRepository(AbstractRepository):
             pass
         return books
 
+    # one grouped count per MAX_IN_IDS tags
+    def get_tag_counts(self, tags) -> Dict[str, int]:
+        tag_names = [tag.tag if isinstance(tag, Tag) else tag for tag in tags]
+        counts = {tag_name: 0 for tag_name in tag_names}
+        for chunk in self.__id_chunks(tag_names):
+            statement = select(tags_table.c.tag, func.count(books_tags_table.c.book_id)) \
+                .select_from(tags_table.join(books_tags_table, tags_table.c.id == books_tags_table.c.tag_id)) \
+                .where(tags_table.c.tag.in_(chunk)).group_by(tags_table.c.tag)
+            counts.update(self._session_cm.session.execute(statement).all())
+        return counts
+
+    # one GROUP BY per facet, and per MAX_IN_IDS books when counting a result set
+    def get_facet_counts(self, book_ids=None) -> Dict[str, dict]:
+        decade = books_table.c.release_year / 10 * 10
+        statements = {
+            'tag': select(tags_table.c.tag, func.count())
+            .select_from(tags_table.join(books_tags_table, tags_table.c.id == books_tags_table.c.tag_id))
+            .group_by(tags_table.c.tag),
+            'publisher': select(publishers_table.c.publisher, func.count())
+            .select_from(books_table.join(publishers_table, publishers_table.c.id == books_table.c.publisher_id))
+            .group_by(publishers_table.c.publisher),
+            'decade': select(decade, func.count()).where(books_table.c.release_year.isnot(None)).group_by(decade),
+            'format': select(books_table.c.ebook, func.count()).where(books_table.c.ebook.isnot(None))
+            .group_by(books_table.c.ebook)
+        }
+        book_id_columns = {'tag': books_tags_table.c.book_id}
+        chunks = [None] if book_ids is None else self.__id_chunks(int(book_id) for book_id in book_ids)
+        counts = {facet: Counter() for facet in FACETS}
+        for facet, statement in statements.items():
+            book_id_column = book_id_columns.get(facet, books_table.c.id)
+            for chunk in chunks:
+                in_chunk = statement if chunk is None else statement.where(book_id_column.in_(chunk))
+                for value, count in self._session_cm.session.execute(in_chunk):
+                    if facet == 'format':
+                        value = 'ebook' if value else 'print'
+                    counts[facet][value] += count
+        return {facet: most_common_first(counts[facet]) for facet in FACETS}
+
     def get_books_by_author(self, author: Author) -> List[Book]:
         books = None
         try:
@@ -156,6 +259,16 @@ class SqlAlchemyRepository(AbstractRepository):
             pass
         return books
 
+    # one query per MAX_IN_IDS authors
+    def get_books_by_authors(self, authors) -> List[Book]:
+        books = {}
+        for chunk in self.__id_chunks(author.unique_id for author in authors):
+            query = self._session_cm.session.query(Book).join(books_authors_table) \
+                .filter(books_authors_table.c.author.in_(chunk)).distinct()
+            for book in query:
+                books.setdefault(book.book_id, book)
+        return list(books.values())
+
     def get_books_by_title(self, title: str):
         books = None
         try:
@@ -164,8 +277,81 @@ class SqlAlchemyRepository(AbstractRepository):
             pass
         return books
 
-    def get_books_by_date_range(self, start: int, end: int) -> List[Book]:
-        return self._session_cm.session.query(Book).filter(start <= Book._Book__release_year <= end)
+    def get_books_by_date_range(self, start: int = None, end: int = None, descending: bool = False) -> List[Book]:
+        query = self._session_cm.session.query(Book).filter(Book._Book__release_year.isnot(None))
+        if start is not None:
+            query = query.filter(Book._Book__release_year >= start)
+        if end is not None:
+            query = query.filter(Book._Book__release_year <= end)
+        order = desc if descending else asc
+        return query.order_by(order(Book._Book__release_year), order(Book._Book__book_id)).all()
+
+    def filter_books(self, release_year: tuple = None, rating: tuple = None, num_pages: tuple = None,
+                     ebook: bool = None, publisher: Publisher = None) -> List[Book]:
+        return self.find_books(BookQuery(release_year=release_year, rating=rating, num_pages=num_pages, ebook=ebook,
+                                         publisher=publisher))
+
+    # The query compiles to a single SELECT with a WHERE clause for each condition. Tags, the author and the
+    # publisher are matched by subqueries on their tables, which leaves the choice of index to SQLite.
+    # Explain returns the statement followed by SQLite's plan for it.
+    def find_books(self, query: BookQuery, explain: bool = False):
+        statement = self._session_cm.session.query(Book)
+        for tag in query.tags:
+            statement = statement.filter(books_table.c.id.in_(
+                select(books_tags_table.c.book_id).join(tags_table, tags_table.c.id == books_tags_table.c.tag_id)
+                .where(tags_table.c.tag == tag)))
+        if query.author is not None:
+            statement = statement.filter(books_table.c.id.in_(
+                select(books_authors_table.c.book).where(books_authors_table.c.author == query.author.unique_id)))
+        if query.publisher is not None:
+            statement = statement.filter(books_table.c.publisher_id.in_(
+                select(publishers_table.c.id).where(publishers_table.c.publisher == query.publisher.name)))
+        for column, bounds in ((books_table.c.release_year, query.release_year), (books_table.c.rating, query.rating),
+                               (books_table.c.num_pages, query.num_pages)):
+            if bounds is not None:
+                low, high = bounds
+                statement = statement.filter(column.isnot(None))
+                if low is not None:
+                    statement = statement.filter(column >= low)
+                if high is not None:
+                    statement = statement.filter(column <= high)
+        if query.ebook is not None:
+            statement = statement.filter(books_table.c.ebook == query.ebook)
+        if query.title is not None:
+            statement = statement.filter(books_table.c.title.contains(query.title, autoescape=True))
+        statement = statement.order_by(books_table.c.id)
+        if not explain:
+            return statement.all()
+
+        dialect = self._session_cm.session.get_bind().dialect
+        sql = str(statement.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+        steps = sql.splitlines()
+        if dialect.name == 'sqlite':
+            steps += [f"plan: {row[-1]}" for row in self._session_cm.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        return QueryPlan(steps)
+
+    # ORDER BY ... LIMIT, which reads the top of the books_rating or books_num_pages index (or its per-publisher
+    # twin) instead of sorting. Review counts are grouped off the reviews_book_timestamp index
+    def get_top_books(self, ranking: str, limit: int, tag: str = None, publisher: Publisher = None) -> List[Book]:
+        if ranking not in RANKINGS:
+            raise ValueError(f"books can be ranked by {', '.join(RANKINGS)}, not {ranking!r}")
+        statement = self._session_cm.session.query(Book).options(selectinload(Book._Book__authors))
+        if ranking == 'reviews':
+            counts = select(reviews_table.c.book_id, func.count().label('num_reviews')) \
+                .group_by(reviews_table.c.book_id).subquery()
+            statement = statement.join(counts, counts.c.book_id == books_table.c.id)
+            score = counts.c.num_reviews
+        else:
+            score = books_table.c[ranking]
+            statement = statement.filter(score.isnot(None))
+        if tag is not None:
+            statement = statement.filter(books_table.c.id.in_(
+                select(books_tags_table.c.book_id).join(tags_table, tags_table.c.id == books_tags_table.c.tag_id)
+                .where(tags_table.c.tag == tag)))
+        if publisher is not None:
+            statement = statement.filter(books_table.c.publisher_id.in_(
+                select(publishers_table.c.id).where(publishers_table.c.publisher == publisher.name)))
+        return statement.order_by(desc(score), books_table.c.id).limit(limit).all()
 
     def get_related_books(self, book: Book) -> List[Book]:
         the_book = self.get_books_by_tag('read-it')[0]
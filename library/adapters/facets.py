@@ -0,0 +1,91 @@
+from array import array
+from collections import Counter
+from copy import copy
+from itertools import chain
+
+from library.adapters.copyonwrite import SharedList, SharedMap
+
+# the facets books are counted by: each tag, publisher, decade of release and ebook or print
+FACETS = ('tag', 'publisher', 'decade', 'format')
+# stored for a book without a value for a facet, which is not counted
+MISSING = -1
+
+
+class FacetCounts:
+    # The number of books with each value of every facet, kept up to date as books are added. Each book gets
+    # a row holding a code for its value of each facet, in a typed array per facet, and its tags' codes in one
+    # array sliced by row offsets. The books of a result set are counted from their rows by book_id, so the
+    # Book objects are never read.
+
+    def __init__(self):
+        self.__rows_by_id = SharedMap()
+        # the value of each code, and the code of each value, for every facet
+        self.__values = {facet: SharedList() for facet in FACETS}
+        self.__codes_by_value = {facet: SharedMap() for facet in FACETS}
+        # the number of books with each code over every book added, by code
+        self.__counts = {facet: SharedMap() for facet in FACETS}
+        self.__rows = {facet: SharedList(array('i')) for facet in FACETS if facet != 'tag'}
+        self.__tag_codes = SharedList(array('i'))
+        self.__tag_offsets = SharedList(array('I', [0]))
+
+    # the copy shares every list and map with the original, and changes only what a book it adds touches
+    def __copy__(self):
+        facets = FacetCounts()
+        facets.__rows_by_id = copy(self.__rows_by_id)
+        facets.__values = {facet: copy(values) for facet, values in self.__values.items()}
+        facets.__codes_by_value = {facet: copy(codes) for facet, codes in self.__codes_by_value.items()}
+        facets.__counts = {facet: copy(counts) for facet, counts in self.__counts.items()}
+        facets.__rows = {facet: copy(rows) for facet, rows in self.__rows.items()}
+        facets.__tag_codes = copy(self.__tag_codes)
+        facets.__tag_offsets = copy(self.__tag_offsets)
+        return facets
+
+    def __len__(self) -> int:
+        return len(self.__rows_by_id)
+
+    def add(self, book):
+        self.__rows_by_id[book.book_id] = len(self.__rows_by_id)
+        release_year = book.release_year if isinstance(book.release_year, int) else None
+        values = {
+            'publisher': None if book.publisher is None else book.publisher.name,
+            'decade': None if release_year is None else release_year // 10 * 10,
+            'format': None if book.ebook is None else 'ebook' if book.ebook else 'print'
+        }
+        for facet, value in values.items():
+            self.__rows[facet].append(self.__count(facet, value))
+        self.__tag_codes.extend(self.__count('tag', tag) for tag in book.tags)
+        self.__tag_offsets.append(len(self.__tag_codes))
+
+    # the code of the facet's value with one more book counted for it
+    def __count(self, facet: str, value) -> int:
+        if value is None:
+            return MISSING
+        code = self.__codes_by_value[facet].get(value)
+        if code is None:
+            code = self.__codes_by_value[facet][value] = len(self.__values[facet])
+            self.__values[facet].append(value)
+        counts = self.__counts[facet]
+        counts[code] = counts.get(code, 0) + 1
+        return code
+
+    # For each facet, the number of books with each of its values, the most common first. Counts every book
+    # added unless book_ids names the books of a result set, each counted once and ids never added left out.
+    def counts(self, book_ids=None) -> dict:
+        if book_ids is None:
+            counts = {facet: self.__counts[facet].items() for facet in FACETS}
+        else:
+            rows = {self.__rows_by_id[book_id] for book_id in book_ids if book_id in self.__rows_by_id}
+            counts = {facet: Counter(map(self.__rows[facet].__getitem__, rows)).items() for facet in self.__rows}
+            tag_codes, offsets = self.__tag_codes, self.__tag_offsets
+            counts['tag'] = Counter(chain.from_iterable(tag_codes[offsets[row]:offsets[row + 1]]
+                                                        for row in rows)).items()
+        return {facet: self.__by_count(facet, counts[facet]) for facet in FACETS}
+
+    def __by_count(self, facet: str, counts) -> dict:
+        values = self.__values[facet]
+        return most_common_first({values[code]: count for code, count in counts if code != MISSING and count})
+
+
+# the counts of a facet's values, the most common first and values with the same count in order
+def most_common_first(counts: dict) -> dict:
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], str(item[0]))))
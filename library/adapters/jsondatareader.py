@@ -1,17 +1,86 @@
 import json
+import os
+import threading
+from contextlib import nullcontext
+from itertools import islice
 from typing import List
 
 from library import MemoryRepository
 from library.adapters.databaserepository import SqlAlchemyRepository
+from library.adapters.parallelreader import iter_records_parallel
+from library.adapters.profiler import IngestProfiler
 from library.domain.model import Publisher, Author, Book, SearchMethod, Review, Tag
 import library.adapters.abstractrepository as repo
 
+
+# the keys of each file that Book, Author and Review are built from; everything else is dropped at parse time
+BOOK_FIELDS = ('book_id', 'title', 'publisher', 'publication_year', 'is_ebook', 'description', 'num_pages',
+               'average_rating', 'image_url', 'popular_shelves', 'authors')
+AUTHOR_FIELDS = ('author_id', 'name')
+REVIEW_FIELDS = ('user_id', 'book_id', 'review_text', 'rating')
+
+# reviews whose books and users are looked up together
+REVIEW_CHUNK_SIZE = 2000
+
+
+# projection stage: keeps only the consumed keys. The shelves, which are most of a book entry, are reduced
+# to a list of their names and the authors to a list of their ids.
+def project_book(book_json: dict) -> dict:
+    book = {field: book_json[field] for field in BOOK_FIELDS}
+    if book['popular_shelves'] != "":
+        book['popular_shelves'] = [tag['name'] for tag in book['popular_shelves']]
+    book['authors'] = [author_id['author_id'] for author_id in book['authors']]
+    return book
+
+
+def project_author(author_json: dict) -> dict:
+    return {field: author_json[field] for field in AUTHOR_FIELDS}
+
+
+def project_review(review_json: dict) -> dict:
+    return {field: review_json[field] for field in REVIEW_FIELDS}
+
+
+# normalise stage: reduces a parsed book entry to the plain values the domain model uses,
+# (book_id, title, publisher, release_year, ebook, description, num_pages, rating, image_url, tag_names, author_ids).
+# Missing values are None, and tag_names is None when the entry has no shelves at all.
+def book_record(book_json: dict) -> tuple:
+    release_year = int(book_json['publication_year']) if book_json['publication_year'] != "" else None
+    ebook = None
+    if book_json['is_ebook'].lower() == 'false':
+        ebook = False
+    elif book_json['is_ebook'].lower() == 'true':
+        ebook = True
+    num_pages = int(book_json['num_pages']) if book_json['num_pages'] != "" else None
+    rating = float(book_json['average_rating']) if book_json['average_rating'] != "" else None
+    image_url = book_json['image_url'] if book_json['image_url'] != "" else None
+    tag_names = None
+    if book_json['popular_shelves'] != "":
+        tag_names = tuple(tag['name'] for tag in book_json['popular_shelves'])
+    author_ids = tuple(int(author_id['author_id']) for author_id in book_json['authors'])
+    return (int(book_json['book_id']), book_json['title'], book_json['publisher'], release_year, ebook,
+            book_json['description'], num_pages, rating, image_url, tag_names, author_ids)
+
+
+# normalise stage for reviews: (user_id, book_id, review_text, rating)
+def review_record(review_json: dict) -> tuple:
+    return review_json['user_id'], int(review_json['book_id']), review_json['review_text'], review_json['rating']
+
+
 class BooksJSONReader:
 
-    def __init__(self, books_file_name: str, authors_file_name: str, reviews_file_name: str):
+    # workers above 1 parse the books and reviews files in that many processes.
+    # The stages of a load are timed while the given profiler is running.
+    def __init__(self, books_file_name: str, authors_file_name: str, reviews_file_name: str, workers: int = 1,
+                 profiler: IngestProfiler = None):
         self.__books_file_name = books_file_name
         self.__authors_file_name = authors_file_name
         self.__reviews_file_name = reviews_file_name
+        self.__workers = workers
+        self.__unknown_author_ids = set()
+        # byte offset up to which each file has been ingested, so ingest_new only parses appended lines
+        self.__offsets = {}
+        self.__profiler = profiler if profiler is not None else IngestProfiler()
         # self.__dataset_of_books = []
         # self.__search = SearchMethod(self.__dataset_of_books)
 
@@ -23,148 +92,267 @@ class BooksJSONReader:
     # def dataset_of_books(self) -> List[Book]:
     #     return self.__dataset_of_books
 
-    def read_books_file(self) -> list:
-        books_json = []
-        with open(self.__books_file_name, encoding='UTF-8') as books_jsonfile:
-            for line in books_jsonfile:
-                book_entry = json.loads(line)
-                books_json.append(book_entry)
-        return books_json
-
-    def read_authors_file(self) -> list:
-        authors_json = []
-        with open(self.__authors_file_name, encoding='UTF-8') as authors_jsonfile:
-            for line in authors_jsonfile:
-                author_entry = json.loads(line)
-                authors_json.append(author_entry)
-        return authors_json
-
-    def read_reviews_file(self) -> list:
-        reviews_json = []
-        with open(self.__reviews_file_name, encoding='UTF-8') as reviews_jsonfile:
-            for line in reviews_jsonfile:
-                review_entry = json.loads(line)
-                reviews_json.append(review_entry)
-        return reviews_json
+    @property
+    def profiler(self) -> IngestProfiler:
+        return self.__profiler
 
-    def read_json_files(self, repo=None):
-        if repo is None:
-            self.read_json_files_sql()
-        elif isinstance(repo, MemoryRepository):
-            self.read_json_files_mem(repo)
-
-    def read_json_files_sql(self):
-        # print("READING BITCH")
-        authors_json = self.read_authors_file()
-        books_json = self.read_books_file()
-        reviews_json = self.read_reviews_file()
-        for book_json in books_json:
-            publisher = repo.repo_instance.get_publisher(book_json['publisher'])
-            if not publisher:
-                publisher = Publisher(book_json['publisher'])
-                repo.repo_instance.add_publisher(publisher)
-            book_instance = Book(int(book_json['book_id']), book_json['title'])
-            book_instance.publisher = publisher
-            if book_json['publication_year'] != "":
-                book_instance.release_year = int(book_json['publication_year'])
-            if book_json['is_ebook'].lower() == 'false':
-                book_instance.ebook = False
-            else:
-                if book_json['is_ebook'].lower() == 'true':
-                    book_instance.ebook = True
-            book_instance.description = book_json['description']
-            if book_json['num_pages'] != "":
-                book_instance.num_pages = int(book_json['num_pages'])
-            if book_json['average_rating'] != "":
-                book_instance.rating = float(book_json["average_rating"])
-            if book_json["image_url"] != "":
-                book_instance.image_url = book_json["image_url"]
-            if book_json['popular_shelves'] != "":
-                for tag in book_json['popular_shelves']:
-                    #print("CHECKING TAG")
-                    #repo.repo_instance.add_tag(tag['name'], book_instance)
-                    book_instance.add_tag(repo.repo_instance.get_tag(tag['name']))
-
-                # extract the author ids:
-            list_of_authors_ids = book_json['authors']
-            for author_id in list_of_authors_ids:
-                numerical_id = int(author_id['author_id'])
-                # We assume book authors are available in the authors file,
-                # otherwise more complex handling is required.
-                author_name = None
-                for author_json in authors_json:
-                    if int(author_json['author_id']) == numerical_id:
-                        author_name = author_json['name']
-                author = repo.repo_instance.get_author(numerical_id)
-                if not author:
-                    author = Author(numerical_id, author_name)
-                    repo.repo_instance.add_author(author)
-                book_instance.add_author(author)
-            repo.repo_instance.add_book(book_instance)
-
-        for review in reviews_json:
-            book_instance = repo.repo_instance.get_book(review["book_id"])
-            user = repo.repo_instance.get_user_by_id(review["user_id"])
-            json_review = Review(user,book_instance, review["review_text"], review['rating'])
-            #print(json_review.review_text)
-            if user:
-                user.add_review(json_review)
-            repo.repo_instance.add_review(json_review)
-
-    def read_json_files_mem(self, repo):
-        authors_json = self.read_authors_file()
-        books_json = self.read_books_file()
-        reviews_json = self.read_reviews_file()
-        for book_json in books_json:
-            publisher = repo.get_publisher(book_json['publisher'])
+    # author ids referenced by books that are missing from the authors file, filled in by the last load
+    @property
+    def unknown_author_ids(self) -> set:
+        return self.__unknown_author_ids
+
+    # the whole file as a list of the original entries; projected=True keeps only the keys the domain reads
+    def read_books_file(self, projected: bool = False) -> list:
+        return list(self.iter_books_file(projected=projected))
+
+    def read_authors_file(self, projected: bool = False) -> list:
+        return list(self.iter_authors_file(projected=projected))
+
+    def read_reviews_file(self, projected: bool = False) -> list:
+        return list(self.iter_reviews_file(projected=projected))
+
+    # parse stage: yields one decoded json entry per line so a whole file is never held in memory. With
+    # projected each entry is cut down to the keys the domain model reads before it is handed on.
+    # With resume the file is read from where the previous read of it stopped.
+    def iter_books_file(self, resume: bool = False, projected: bool = False):
+        entries = self.__iter_json_lines(self.__books_file_name, "books: decode", resume)
+        return map(project_book, entries) if projected else entries
+
+    def iter_authors_file(self, resume: bool = False, projected: bool = False):
+        entries = self.__iter_json_lines(self.__authors_file_name, "authors: decode", resume)
+        return map(project_author, entries) if projected else entries
+
+    def iter_reviews_file(self, resume: bool = False, projected: bool = False):
+        entries = self.__iter_json_lines(self.__reviews_file_name, "reviews: decode", resume)
+        return map(project_review, entries) if projected else entries
+
+    def __iter_json_lines(self, file_name: str, stage: str, resume: bool = False):
+        offset = self.__offsets.get(file_name, 0) if resume else 0
+        with open(file_name, 'rb') as jsonfile:
+            jsonfile.seek(offset)
+            for line in jsonfile:
+                if not line.endswith(b"\n"):
+                    # the last line may still be being written, it is only taken once it is complete json
+                    try:
+                        with self.__profiler.stage(stage):
+                            entry = json.loads(line)
+                    except ValueError:
+                        break
+                elif line.strip():
+                    with self.__profiler.stage(stage):
+                        entry = json.loads(line)
+                else:
+                    entry = None
+                offset += len(line)
+                self.__offsets[file_name] = offset
+                if entry is not None:
+                    yield entry
+
+    # the files' current ends count as read, for when the repository was restored without reading them
+    def mark_files_read(self):
+        for file_name in (self.__books_file_name, self.__authors_file_name, self.__reviews_file_name):
+            self.__offsets[file_name] = os.path.getsize(file_name)
+
+    def has_new_lines(self) -> bool:
+        return any(os.path.getsize(file_name) > self.__offsets.get(file_name, 0)
+                   for file_name in (self.__books_file_name, self.__reviews_file_name))
+
+    # author dimension stage: maps every author id in the authors file to its name, built once per load
+    def read_author_names(self) -> dict:
+        with self.__profiler.stage("author names"):
+            author_names = {}
+            for author_json in self.iter_authors_file(projected=True):
+                author_names[int(author_json['author_id'])] = author_json['name']
+        return author_names
+
+    @property
+    def workers(self) -> int:
+        return self.__workers
+
+    # normalise stage over the whole books and reviews files, or only their appended lines with resume
+    def iter_book_records(self, resume: bool = False):
+        if self.__workers > 1 and not resume:
+            return self.__iter_records_parallel(self.__books_file_name, book_record, "books: parse (workers)")
+        # book_record already keeps only what the domain model reads, so the entries are not projected first.
+        # The normalise stages also hold the time taken to read the lines off disk.
+        books_file = self.iter_books_file(resume)
+        return self.__profiler.iterate("books: normalise", map(book_record, books_file))
+
+    def iter_review_records(self, resume: bool = False):
+        if self.__workers > 1 and not resume:
+            return self.__iter_records_parallel(self.__reviews_file_name, review_record, "reviews: parse (workers)")
+        reviews_file = self.iter_reviews_file(resume)
+        return self.__profiler.iterate("reviews: normalise", map(review_record, reviews_file))
+
+    # the parent only waits on the workers here, so decoding and normalising are timed as one stage
+    def __iter_records_parallel(self, file_name: str, normalise, stage: str):
+        file_size = os.path.getsize(file_name)
+        records = iter_records_parallel(file_name, normalise, self.__workers, file_size=file_size)
+        yield from self.__profiler.iterate(stage, records)
+        self.__offsets[file_name] = file_size
+
+    # transform stage: turns the parsed book entries into Book instances one at a time.
+    # tag_factory is given by the database path, which stores Tag objects instead of tag names.
+    def iter_books(self, repository, author_names: dict, tag_factory=None, resume: bool = False):
+        for record in self.iter_book_records(resume):
+            yield self.__make_book(record, repository, author_names, tag_factory)
+
+    # transform stage: turns the parsed review entries into Review instances one at a time.
+    # The books and users of a chunk of reviews are fetched with one lookup each and attached through dicts.
+    def iter_reviews(self, repository, resume: bool = False):
+        records = self.iter_review_records(resume)
+        while True:
+            chunk = list(islice(records, REVIEW_CHUNK_SIZE))
+            if not chunk:
+                return
+            with self.__profiler.stage("reviews: resolve"):
+                books = repository.get_books_by_ids({record[1] for record in chunk})
+                users = repository.get_users_by_ids({record[0] for record in chunk})
+            for user_id, book_id, review_text, rating in chunk:
+                with self.__profiler.stage("reviews: construct"):
+                    user = users.get(user_id)
+                    json_review = Review(user, books.get(book_id), review_text, rating)
+                    if user:
+                        user.add_review(json_review)
+                yield json_review
+
+    # the publisher, tag and author stages are timed apart from the rest of building the book
+    def __make_book(self, record: tuple, repository, author_names: dict, tag_factory) -> Book:
+        with self.__profiler.stage("books: construct"):
+            return self.__build_book(record, repository, author_names, tag_factory)
+
+    def __build_book(self, record: tuple, repository, author_names: dict, tag_factory) -> Book:
+        book_id, title, publisher_name, release_year, ebook, description, num_pages, rating, image_url, \
+            tag_names, author_ids = record
+        with self.__profiler.stage("books: publishers"):
+            publisher = repository.get_publisher(publisher_name)
             if not publisher:
-                publisher = Publisher(book_json['publisher'])
-                repo.add_publisher(publisher)
-            book_instance = Book(int(book_json['book_id']), book_json['title'])
-            book_instance.publisher = publisher
-            if book_json['publication_year'] != "":
-                book_instance.release_year = int(book_json['publication_year'])
-            if book_json['is_ebook'].lower() == 'false':
-                book_instance.ebook = False
-            else:
-                if book_json['is_ebook'].lower() == 'true':
-                    book_instance.ebook = True
-            book_instance.description = book_json['description']
-            if book_json['num_pages'] != "":
-                book_instance.num_pages = int(book_json['num_pages'])
-            if book_json['average_rating'] != "":
-                book_instance.rating = float(book_json["average_rating"])
-            if book_json["image_url"] != "":
-                book_instance.image_url = book_json["image_url"]
-            if book_json['popular_shelves'] != "":
-                temp_tags = set()
-                for tag in book_json['popular_shelves']:
-                    temp_tags.add(tag['name'])
-                book_instance.tags = temp_tags
-                # extract the author ids:
-            list_of_authors_ids = book_json['authors']
-            for author_id in list_of_authors_ids:
-                numerical_id = int(author_id['author_id'])
-                # We assume book authors are available in the authors file,
-                # otherwise more complex handling is required.
-                author_name = None
-                for author_json in authors_json:
-                    if int(author_json['author_id']) == numerical_id:
-                        author_name = author_json['name']
-                author = repo.get_author(numerical_id)
+                publisher = Publisher(publisher_name)
+                repository.add_publisher(publisher)
+        book_instance = Book(book_id, title)
+        book_instance.publisher = publisher
+        if release_year is not None:
+            book_instance.release_year = release_year
+        if ebook is not None:
+            book_instance.ebook = ebook
+        book_instance.description = description
+        if num_pages is not None:
+            book_instance.num_pages = num_pages
+        if rating is not None:
+            book_instance.rating = rating
+        if image_url is not None:
+            book_instance.image_url = image_url
+        if tag_names is not None:
+            with self.__profiler.stage("books: tags"):
+                if tag_factory is None:
+                    book_instance.tags = set(tag_names)
+                else:
+                    for tag_name in tag_names:
+                        book_instance.add_tag(tag_factory(tag_name))
+        with self.__profiler.stage("books: authors"):
+            for author_id in author_ids:
+                author = repository.get_author(author_id)
                 if not author:
-                    author = Author(numerical_id, author_name)
-                    repo.add_author(author)
+                    if author_id not in author_names:
+                        # the authors file has no name for this id, so the book is loaded without it
+                        self.__unknown_author_ids.add(author_id)
+                        continue
+                    author = Author(author_id, author_names[author_id])
+                    repository.add_author(author)
                 book_instance.add_author(author)
-            repo.add_book(book_instance)
+        return book_instance
+
+    def read_json_files(self, repo=None):
+        self.__unknown_author_ids = set()
+        author_names = self.read_author_names()
+        if repo is None or isinstance(repo, SqlAlchemyRepository):
+            self.read_json_files_bulk(repo, author_names)
+        elif isinstance(repo, MemoryRepository):
+            self.read_json_files_mem(repo, author_names)
+        if self.__unknown_author_ids:
+            print(f"{len(self.__unknown_author_ids)} author ids are not in {self.__authors_file_name}: "
+                  f"{sorted(self.__unknown_author_ids)}")
+
+    # parse -> transform -> insert run as chained generators, so only one book or review is in flight at a time
+    def read_json_files_sql(self, author_names: dict = None):
+        if author_names is None:
+            author_names = self.read_author_names()
+        for book_instance in self.iter_books(repo.repo_instance, author_names, repo.repo_instance.get_tag):
+            with self.__profiler.stage("books: insert"):
+                repo.repo_instance.add_book(book_instance)
+
+        for json_review in self.iter_reviews(repo.repo_instance):
+            with self.__profiler.stage("reviews: insert"):
+                repo.repo_instance.add_review(json_review)
+
+    # database load that skips the ORM: rows are batched into executemany inserts inside one transaction
+    def read_json_files_bulk(self, repository=None, author_names: dict = None):
+        if repository is None:
+            repository = repo.repo_instance
+        if author_names is None:
+            author_names = self.read_author_names()
+        with repository.bulk_loader() as loader:
+            for record in self.iter_book_records():
+                with self.__profiler.stage("books: insert"):
+                    loader.add_book(record, author_names)
+            for record in self.iter_review_records():
+                with self.__profiler.stage("reviews: insert"):
+                    loader.add_review(record)
+            with self.__profiler.stage("bulk: flush"):
+                loader.flush()
+        self.__unknown_author_ids.update(loader.unknown_author_ids)
+
+    # the whole load is one batch, published as a single repository version
+    def read_json_files_mem(self, repo, author_names: dict = None):
+        if author_names is None:
+            author_names = self.read_author_names()
+        with repo.batch():
+            for book_instance in self.iter_books(repo, author_names):
+                with self.__profiler.stage("books: insert"):
+                    repo.add_book(book_instance)
+
+            for json_review in self.iter_reviews(repo):
+                with self.__profiler.stage("reviews: insert"):
+                    repo.add_review(json_review)
+
+    # the reviews alone, for a repository whose books come from elsewhere such as a mapped catalog
+    def read_json_reviews(self, repository):
+        for json_review in self.iter_reviews(repository):
+            with self.__profiler.stage("reviews: insert"):
+                repository.add_review(json_review)
+
+    # Applies only the lines appended to the books and reviews files since the last read to the repository,
+    # one object at a time through the repository's add methods. Returns the number of books and reviews added.
+    # A memory repository publishes the new books and reviews together as one version, and does not log them
+    # as they are read from the data files again on startup.
+    def ingest_new(self, repository) -> tuple:
+        memory = isinstance(repository, MemoryRepository)
+        with repository.batch(logged=False) if memory else nullcontext():
+            return self.__ingest_new(repository, memory)
 
-        for review in reviews_json:
-            book_instance = repo.get_book(review["book_id"])
-            json_review = Review(None, book_instance, review["review_text"], review['rating'])
-            user = repo.get_user_by_id(review["user_id"])
-            if user:
-                user.add_review(json_review)
-            repo.add_review(json_review)
+    def __ingest_new(self, repository, memory: bool) -> tuple:
+        num_books = num_reviews = 0
+        if os.path.getsize(self.__books_file_name) > self.__offsets.get(self.__books_file_name, 0):
+            author_names = self.read_author_names()
+            tag_factory = None if memory else repository.get_tag
+            for book_instance in self.iter_books(repository, author_names, tag_factory, resume=True):
+                repository.add_book(book_instance)
+                num_books += 1
+        for json_review in self.iter_reviews(repository, resume=True):
+            repository.add_review(json_review)
+            num_reviews += 1
+        return num_books, num_reviews
 
+    # Polls the data files every interval seconds on a daemon thread and ingests appended lines.
+    # Setting the returned event stops the polling.
+    def start_polling(self, repository, interval: float) -> threading.Event:
+        stop = threading.Event()
 
+        def poll():
+            while not stop.wait(interval):
+                if self.has_new_lines():
+                    num_books, num_reviews = self.ingest_new(repository)
+                    print(f"Ingested {num_books} new books and {num_reviews} new reviews")
 
+        threading.Thread(target=poll, name="ingest-poller", daemon=True).start()
+        return stop
@@ -0,0 +1,50 @@
+from bisect import bisect_left, insort
+
+# the most books a leaderboard keeps, longer top lists are taken from every book in scope with a bounded heap
+LEADERBOARD_SIZE = 100
+# what books can be ranked by, best first: the book's rating, its number of reviews and its number of pages
+RANKINGS = ('rating', 'reviews', 'num_pages')
+
+
+class Leaderboard:
+    # The LEADERBOARD_SIZE best scoring books of one ranking, as (-score, book_id) entries in ascending order,
+    # so the best book comes first and ties go to the lower book_id. A book's score only ever goes up, ratings
+    # and page counts are set once and review counts grow, so a book that falls off the end can only get back on
+    # when its own score changes, and that is when it is offered again.
+
+    def __init__(self):
+        self.__entries = []
+
+    def __copy__(self):
+        leaderboard = Leaderboard()
+        leaderboard.__entries = list(self.__entries)
+        return leaderboard
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    # whether offering the book with this score would change the leaderboard
+    def changes(self, book_id: int, score, old_score=None) -> bool:
+        return old_score is not None and self.__position(book_id, old_score) is not None or \
+            len(self.__entries) < LEADERBOARD_SIZE or (-score, book_id) < self.__entries[-1]
+
+    # puts the book in its place for its new score, taking it out of its place for old_score first
+    def offer(self, book_id: int, score, old_score=None):
+        entries = self.__entries
+        if old_score is not None:
+            position = self.__position(book_id, old_score)
+            if position is not None:
+                del entries[position]
+        if len(entries) < LEADERBOARD_SIZE or (-score, book_id) < entries[-1]:
+            insort(entries, (-score, book_id))
+            del entries[LEADERBOARD_SIZE:]
+
+    def __position(self, book_id: int, score):
+        position = bisect_left(self.__entries, (-score, book_id))
+        if position < len(self.__entries) and self.__entries[position] == (-score, book_id):
+            return position
+        return None
+
+    # the book_ids of the best books, at most limit of them
+    def top(self, limit: int) -> list:
+        return [book_id for _, book_id in self.__entries[:limit]]
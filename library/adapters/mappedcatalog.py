@@ -0,0 +1,419 @@
+import mmap
+import os
+import pickle
+import sys
+from array import array
+from bisect import bisect, bisect_left
+from collections import Counter
+from collections.abc import Sequence
+from contextlib import contextmanager
+from itertools import chain
+from weakref import WeakValueDictionary
+
+from library.adapters.columnstore import MISSING_INT, MISSING_RATING
+from library.adapters.facets import FACETS, most_common_first
+from library.adapters.snapshot import source_key
+from library.domain.model import Author, Book, Publisher
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CATALOG_MAGIC = b"LIBCATL\n"
+# bump when the layout of the sections changes
+CATALOG_VERSION = 1
+# stored for a missing string, publisher or ebook flag
+MISSING = -1
+# every section starts on a multiple of this many bytes, so the typed views over it are aligned
+ALIGNMENT = 8
+# the typecode of each section. Books are rows in order of book_id, authors rows in order of author_id, and
+# publishers and tags rows in order of name. The lists of all rows are kept one after another in a section such
+# as book_tags, and sliced by row with the offsets in the section named after it in the singular, book_tag_offsets.
+# The lower-cased titles and author names are kept in the order they were added, each followed by a zero byte.
+SECTIONS = {
+    'strings': 'B', 'string_offsets': 'Q',
+    'book_ids': 'q', 'titles': 'i', 'descriptions': 'i', 'image_urls': 'i', 'publishers': 'i',
+    'release_years': 'i', 'num_pages': 'i', 'ratings': 'd', 'ebooks': 'b',
+    'book_author_offsets': 'I', 'book_authors': 'i', 'book_tag_offsets': 'I', 'book_tags': 'i',
+    'added_rows': 'i', 'years': 'i', 'year_rows': 'i', 'rating_rows': 'i', 'num_pages_rows': 'i',
+    'author_ids': 'q', 'author_names': 'i', 'author_book_offsets': 'I', 'author_books': 'i',
+    'added_authors': 'i',
+    'publisher_names': 'i', 'publisher_book_offsets': 'I', 'publisher_books': 'i',
+    'tag_names': 'i', 'tag_book_offsets': 'I', 'tag_books': 'i',
+    'lower_titles': 'B', 'lower_title_offsets': 'Q', 'lower_author_names': 'B', 'lower_author_name_offsets': 'Q'
+}
+
+
+# the section that slices a section of lists by row
+def offsets_of(name: str) -> str:
+    return f"{name[:-1]}_offsets"
+
+
+class CatalogWriter:
+    # Lays out the books, authors, publishers and tags of a populated MemoryRepository as the typed sections
+    # of a catalog file, with every string stored once.
+
+    def __init__(self, repository):
+        self.__strings = {}
+        self.__sections = {name: array(typecode) for name, typecode in SECTIONS.items()}
+        self.__sections['string_offsets'].append(0)
+        self.__add(repository)
+
+    @property
+    def sections(self) -> dict:
+        return self.__sections
+
+    def __string(self, value) -> int:
+        if value is None:
+            return MISSING
+        index = self.__strings.get(value)
+        if index is None:
+            index = self.__strings[value] = len(self.__strings)
+            self.__sections['strings'].frombytes(value.encode('utf-8'))
+            self.__sections['string_offsets'].append(len(self.__sections['strings']))
+        return index
+
+    @staticmethod
+    def __text(section: array, offsets: array, texts):
+        offsets.append(0)
+        for text in texts:
+            section.frombytes(text.lower().encode('utf-8') + b'\0')
+            offsets.append(len(section))
+
+    def __add(self, repository):
+        sections = self.__sections
+        books = repository.get_books_page(repository.get_num_books())
+        rows = {book.book_id: row for row, book in enumerate(books)}
+        # the first author added under an id is the one the repository returns
+        authors = {}
+        for author in repository.authors:
+            authors.setdefault(author.unique_id, author)
+        author_ids = sorted(authors)
+        author_rows = {author_id: row for row, author_id in enumerate(author_ids)}
+        publisher_names = sorted({book.publisher.name for book in books if book.publisher is not None})
+        publisher_rows = {name: row for row, name in enumerate(publisher_names)}
+        tag_names = sorted({tag for book in books for tag in book.tags})
+        tag_rows = {tag: row for row, tag in enumerate(tag_names)}
+
+        sections['book_author_offsets'].append(0)
+        sections['book_tag_offsets'].append(0)
+        for book in books:
+            sections['book_ids'].append(book.book_id)
+            sections['titles'].append(self.__string(book.title))
+            sections['descriptions'].append(self.__string(book.description))
+            sections['image_urls'].append(self.__string(book.image_url))
+            sections['publishers'].append(MISSING if book.publisher is None else publisher_rows[book.publisher.name])
+            release_year = book.release_year if isinstance(book.release_year, int) else None
+            sections['release_years'].append(MISSING_INT if release_year is None else release_year)
+            sections['num_pages'].append(MISSING_INT if book.num_pages is None else book.num_pages)
+            sections['ratings'].append(MISSING_RATING if book.rating is None else book.rating)
+            sections['ebooks'].append(MISSING if book.ebook is None else int(book.ebook))
+            sections['book_authors'].extend(author_rows[author.unique_id] for author in book.authors
+                                       if author.unique_id in author_rows)
+            sections['book_author_offsets'].append(len(sections['book_authors']))
+            sections['book_tags'].extend(sorted(tag_rows[tag] for tag in book.tags))
+            sections['book_tag_offsets'].append(len(sections['book_tags']))
+
+        # the books the repository indexed, in the order they were added
+        added = [book for book in repository.books if rows.get(book.book_id) is not None
+                 and books[rows[book.book_id]] is book]
+        sections['added_rows'].extend(rows[book.book_id] for book in added)
+        self.__text(sections['lower_titles'], sections['lower_title_offsets'], (book.title for book in added))
+        year_entries = sorted((book.release_year, position, rows[book.book_id]) for position, book in enumerate(added)
+                              if isinstance(book.release_year, int))
+        sections['years'].extend(entry[0] for entry in year_entries)
+        sections['year_rows'].extend(entry[2] for entry in year_entries)
+        for ranking in ('rating', 'num_pages'):
+            ranked = sorted((-getattr(book, ranking), book.book_id) for book in books
+                            if getattr(book, ranking) is not None)
+            sections[f'{ranking}_rows'].extend(rows[book_id] for _, book_id in ranked)
+
+        for kind, keys, books_of in (
+                ('author', author_ids, lambda author_id: repository.get_books_by_author(authors[author_id])),
+                ('publisher', publisher_names, lambda name: repository.get_books_by_publisher(Publisher(name))),
+                ('tag', tag_names, repository.get_books_by_tag)):
+            offsets, section = sections[f'{kind}_book_offsets'], sections[f'{kind}_books']
+            offsets.append(0)
+            for key in keys:
+                section.extend(rows[book.book_id] for book in books_of(key))
+                offsets.append(len(section))
+        sections['author_ids'].extend(author_ids)
+        sections['author_names'].extend(self.__string(authors[author_id].full_name) for author_id in author_ids)
+        added_authors = [author for author in repository.authors if authors[author.unique_id] is author]
+        sections['added_authors'].extend(author_rows[author.unique_id] for author in added_authors)
+        self.__text(sections['lower_author_names'], sections['lower_author_name_offsets'],
+                    (author.full_name for author in added_authors))
+        sections['publisher_names'].extend(self.__string(name) for name in publisher_names)
+        sections['tag_names'].extend(self.__string(tag) for tag in tag_names)
+
+
+# the layout and the source files a catalog was written for, which a catalog has to match to be used
+def catalog_key(source_files) -> tuple:
+    return CATALOG_VERSION, sys.byteorder, source_key(source_files)
+
+
+# Held by a worker while it opens the catalog or writes it, so one worker builds a missing catalog while the
+# others wait for it and then map the file it wrote. The lock is taken on a file next to the catalog.
+@contextmanager
+def catalog_lock(file_name: str):
+    with open(f"{file_name}.lock", 'ab') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Writes the catalog of a populated MemoryRepository: the magic bytes, the sections one after another, then a
+# pickled header with their typecodes, offsets and lengths, and finally the offset of the header. The file is
+# written next to its destination first, under a name of its own, so a writer that does not hold catalog_lock
+# never runs into another.
+def write_catalog(repository, file_name: str, source_files):
+    temp_file_name = f"{file_name}.{os.getpid()}.tmp"
+    with open(temp_file_name, 'wb') as catalog_file:
+        catalog_file.write(CATALOG_MAGIC)
+        layout = {}
+        for name, section in CatalogWriter(repository).sections.items():
+            catalog_file.write(bytes(-catalog_file.tell() % ALIGNMENT))
+            layout[name] = (section.typecode, catalog_file.tell(), len(section))
+            section.tofile(catalog_file)
+        header_offset = catalog_file.tell()
+        pickle.dump((catalog_key(source_files), layout), catalog_file, pickle.HIGHEST_PROTOCOL)
+        catalog_file.write(header_offset.to_bytes(8, 'little'))
+    os.replace(temp_file_name, file_name)
+
+
+# returns the mapped catalog, or None when there is no catalog or it does not match the source files
+def open_catalog(file_name: str, source_files):
+    if not os.path.exists(file_name):
+        return None
+    with open(file_name, 'rb') as catalog_file:
+        if catalog_file.read(len(CATALOG_MAGIC)) != CATALOG_MAGIC:
+            return None
+    catalog = MappedCatalog(file_name)
+    return catalog if catalog.key == catalog_key(source_files) else None
+
+
+class MappedCatalog:
+    # A read-only catalog file mapped into memory. The sections are read through typed memoryviews over the
+    # mapping, so every process that maps the file shares one copy of its pages. Book, Author and Publisher
+    # objects are built from their rows when asked for and kept only while something else holds them.
+
+    def __init__(self, file_name: str):
+        with open(file_name, 'rb') as catalog_file:
+            self.__map = mmap.mmap(catalog_file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_offset = int.from_bytes(self.__map[-8:], 'little')
+        self.__key, layout = pickle.loads(self.__map[header_offset:-8])
+        view = memoryview(self.__map)
+        self.__sections = {}
+        for name, (typecode, offset, length) in layout.items():
+            self.__sections[name] = view[offset:offset + length * array(typecode).itemsize].cast(typecode)
+        self.__blobs = {name: layout[name][1] for name in ('strings', 'lower_titles', 'lower_author_names')}
+        self.__books = WeakValueDictionary()
+        self.__authors = WeakValueDictionary()
+        self.__publishers = WeakValueDictionary()
+        self.__facet_counts = None
+
+    @property
+    def key(self) -> tuple:
+        return self.__key
+
+    def section(self, name: str) -> memoryview:
+        return self.__sections[name]
+
+    def __len__(self) -> int:
+        return len(self.__sections['book_ids'])
+
+    def string(self, index: int):
+        if index == MISSING:
+            return None
+        offsets = self.__sections['string_offsets']
+        start = self.__blobs['strings']
+        return self.__map[start + offsets[index]:start + offsets[index + 1]].decode('utf-8')
+
+    # the row in a section of string indexes, sorted by string, that holds value, or None
+    def __find_string(self, section: str, value: str):
+        names = self.__sections[section]
+        low, high = 0, len(names)
+        while low < high:
+            middle = (low + high) // 2
+            if self.string(names[middle]) < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(names) and self.string(names[low]) == value else None
+
+    def __slice(self, name: str, row: int) -> memoryview:
+        offsets = self.__sections[offsets_of(name)]
+        return self.__sections[name][offsets[row]:offsets[row + 1]]
+
+    # the rows whose text in a lower-cased text section holds the query, found by searching the mapping itself
+    def __search(self, name: str, added: str, query: str) -> list:
+        query = query.lower().encode('utf-8')
+        offsets = self.__sections[offsets_of(name)]
+        added_rows = self.__sections[added]
+        if not query:
+            return list(added_rows)
+        start = self.__blobs[name]
+        end = start + offsets[-1]
+        rows = []
+        position = self.__map.find(query, start, end)
+        while position != -1:
+            line = bisect(offsets, position - start) - 1
+            rows.append(added_rows[line])
+            position = self.__map.find(query, start + offsets[line + 1], end)
+        return rows
+
+    def row_of(self, book_id: int):
+        book_ids = self.__sections['book_ids']
+        row = bisect_left(book_ids, book_id)
+        return row if row < len(book_ids) and book_ids[row] == book_id else None
+
+    # the first row with a book_id above after
+    def row_after(self, book_id: int) -> int:
+        return bisect(self.__sections['book_ids'], book_id)
+
+    def book(self, row: int) -> Book:
+        book = self.__books.get(row)
+        if book is None:
+            book = self.__books[row] = self.__build_book(row)
+        return book
+
+    def books(self, rows) -> list:
+        return [self.book(row) for row in rows]
+
+    def __build_book(self, row: int) -> Book:
+        sections = self.__sections
+        book = Book(sections['book_ids'][row], self.string(sections['titles'][row]))
+        book.description = self.string(sections['descriptions'][row])
+        book.image_url = self.string(sections['image_urls'][row])
+        if sections['publishers'][row] != MISSING:
+            book.publisher = self.publisher(sections['publishers'][row])
+        if sections['release_years'][row] != MISSING_INT:
+            book.release_year = sections['release_years'][row]
+        if sections['num_pages'][row] != MISSING_INT:
+            book.num_pages = sections['num_pages'][row]
+        if sections['ratings'][row] != MISSING_RATING:
+            book.rating = sections['ratings'][row]
+        if sections['ebooks'][row] != MISSING:
+            book.ebook = bool(sections['ebooks'][row])
+        book.tags = {self.tag_name(tag_row) for tag_row in self.__slice('book_tags', row)}
+        for author_row in self.__slice('book_authors', row):
+            book.add_author(self.author(author_row))
+        return book
+
+    # the book's values of the columns a query can check, without building the book
+    def value(self, name: str, row: int):
+        value = self.__sections[name][row]
+        missing = {'ratings': MISSING_RATING, 'ebooks': MISSING, 'publishers': MISSING}.get(name, MISSING_INT)
+        return None if value == missing else value
+
+    def author_rows_of(self, row: int) -> memoryview:
+        return self.__slice('book_authors', row)
+
+    def tag_rows_of(self, row: int) -> memoryview:
+        return self.__slice('book_tags', row)
+
+    def lower_title(self, row: int) -> str:
+        return self.string(self.__sections['titles'][row]).lower()
+
+    def num_authors(self) -> int:
+        return len(self.__sections['author_ids'])
+
+    def author_row(self, author_id: int):
+        author_ids = self.__sections['author_ids']
+        row = bisect_left(author_ids, author_id)
+        return row if row < len(author_ids) and author_ids[row] == author_id else None
+
+    def author(self, row: int) -> Author:
+        author = self.__authors.get(row)
+        if author is None:
+            sections = self.__sections
+            author = Author(sections['author_ids'][row], self.string(sections['author_names'][row]))
+            self.__authors[row] = author
+        return author
+
+    def num_publishers(self) -> int:
+        return len(self.__sections['publisher_names'])
+
+    def publisher_row(self, name: str):
+        return self.__find_string('publisher_names', name)
+
+    def publisher(self, row: int) -> Publisher:
+        publisher = self.__publishers.get(row)
+        if publisher is None:
+            publisher = self.__publishers[row] = Publisher(self.string(self.__sections['publisher_names'][row]))
+        return publisher
+
+    def tag_row(self, tag: str):
+        return self.__find_string('tag_names', tag)
+
+    def tag_name(self, row: int) -> str:
+        return sys.intern(self.string(self.__sections['tag_names'][row]))
+
+    def tag_names(self) -> list:
+        return [self.tag_name(row) for row in range(len(self.__sections['tag_names']))]
+
+    # the rows of the books of an author, publisher or tag row, in the order they were added
+    def book_rows(self, name: str, row: int) -> memoryview:
+        return self.__slice(f'{name}_books', row) if row is not None else self.__sections['tag_books'][:0]
+
+    # the rows of the books released from start up to and including end, in year order
+    def year_rows(self, start: int = None, end: int = None) -> memoryview:
+        years = self.__sections['years']
+        low = 0 if start is None else bisect_left(years, start)
+        high = len(years) if end is None else bisect(years, end)
+        return self.__sections['year_rows'][low:high]
+
+    def title_rows(self, title: str) -> list:
+        return self.__search('lower_titles', 'added_rows', title)
+
+    def author_name_rows(self, name: str) -> list:
+        return self.__search('lower_author_names', 'added_authors', name)
+
+    # For each facet, the number of books with each value, the most common first, for every book or for the
+    # given rows, counted from the sections alone
+    def facet_counts(self, rows=None) -> dict:
+        if rows is None:
+            if self.__facet_counts is None:
+                self.__facet_counts = self.__count(range(len(self)))
+            return self.__facet_counts
+        return self.__count(set(rows))
+
+    def __count(self, rows) -> dict:
+        sections = self.__sections
+        publishers = Counter(map(sections['publishers'].__getitem__, rows))
+        years = Counter(map(sections['release_years'].__getitem__, rows))
+        ebooks = Counter(map(sections['ebooks'].__getitem__, rows))
+        tags = Counter(chain.from_iterable(map(self.tag_rows_of, rows)))
+        decades = Counter()
+        for year, count in years.items():
+            if year != MISSING_INT:
+                decades[year // 10 * 10] += count
+        counts = {
+            'tag': {self.tag_name(row): count for row, count in tags.items()},
+            'publisher': {self.string(sections['publisher_names'][row]): count for row, count in publishers.items()
+                          if row != MISSING},
+            'decade': decades,
+            'format': {'ebook' if ebook else 'print': count for ebook, count in ebooks.items() if ebook != MISSING}
+        }
+        return {facet: most_common_first(counts[facet]) for facet in FACETS}
+
+
+class CatalogBooks(Sequence):
+    # The catalog's books in the order they were added, built as they are indexed
+
+    def __init__(self, catalog: MappedCatalog):
+        self.__catalog = catalog
+
+    def __len__(self) -> int:
+        return len(self.__catalog.section('added_rows'))
+
+    def __getitem__(self, index):
+        rows = self.__catalog.section('added_rows')
+        if isinstance(index, slice):
+            return self.__catalog.books(rows[index])
+        return self.__catalog.book(rows[index])
@@ -0,0 +1,301 @@
+import heapq
+import random
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict
+
+from library.adapters.abstractrepository import AbstractRepository
+from library.adapters.bookquery import BookQuery, QueryPlan, range_text
+from library.adapters.leaderboard import RANKINGS
+from library.adapters.mappedcatalog import CatalogBooks, MappedCatalog
+from library.adapters.repository import MemoryRepository
+from library.adapters.writeaheadlog import WriteAheadLog
+from library.domain.model import Publisher, Author, Book, User, Review
+
+
+# raised by the writes a mapped catalog does not take, as the file is shared by every worker and never changed
+class ReadOnlyCatalogError(PermissionError):
+    pass
+
+
+class MappedRepository(AbstractRepository):
+    # Serves the books, authors, publishers and tags from a MappedCatalog, a read-only file every worker process
+    # maps, so the workers share one copy of the catalog instead of each building its own. Books, authors and
+    # publishers are built from the file as they are asked for. Users, reviews and reading lists are kept by a
+    # MemoryRepository of each process, as they are in memory mode, and logged to its write-ahead log.
+
+    def __init__(self, catalog: MappedCatalog):
+        self.__catalog = catalog
+        self.__memory = MemoryRepository()
+        # the number of reviews of each book_id, for ranking books by reviews, changed under the lock
+        self.__num_reviews = Counter()
+        self.__num_reviews_lock = threading.Lock()
+
+    @property
+    def catalog(self) -> MappedCatalog:
+        return self.__catalog
+
+    def pin_version(self):
+        self.__memory.pin_version()
+
+    def unpin_version(self):
+        self.__memory.unpin_version()
+
+    def batch(self, logged: bool = True):
+        return self.__memory.batch(logged)
+
+    def attach_log(self, log: WriteAheadLog):
+        self.__memory.attach_log(log)
+
+    @property
+    def log_seq(self) -> int:
+        return self.__memory.log_seq
+
+    @log_seq.setter
+    def log_seq(self, seq: int):
+        self.__memory.log_seq = seq
+
+    # the books in the order they were added, built as they are indexed
+    @property
+    def books(self) -> CatalogBooks:
+        return CatalogBooks(self.__catalog)
+
+    @property
+    def publishers(self) -> List[Publisher]:
+        return [self.__catalog.publisher(row) for row in range(self.__catalog.num_publishers())]
+
+    @property
+    def authors(self) -> List[Author]:
+        return [self.__catalog.author(row) for row in self.__catalog.section('added_authors')]
+
+    @property
+    def reviews(self) -> List[Review]:
+        return self.__memory.reviews
+
+    def add_review(self, review: Review):
+        if isinstance(review, Review):
+            self.__memory.add_review(review)
+            if review.book is not None:
+                with self.__num_reviews_lock:
+                    self.__num_reviews[review.book.book_id] += 1
+
+    def get_reviews(self, book: Book, limit: int = None, before: datetime = None,
+                    before_id: int = None) -> List[Review]:
+        return self.__memory.get_reviews(book, limit, before, before_id)
+
+    def get_user_reviews(self, user: User, limit: int = None, before: datetime = None,
+                         before_id: int = None) -> List[Review]:
+        return self.__memory.get_user_reviews(user, limit, before, before_id)
+
+    def add_user(self, user: User):
+        self.__memory.add_user(user)
+
+    def get_user(self, user_name: str):
+        return self.__memory.get_user(user_name)
+
+    def get_user_by_id(self, user_id: str):
+        return self.__memory.get_user_by_id(user_id)
+
+    def get_users_by_ids(self, user_ids) -> Dict[str, User]:
+        return self.__memory.get_users_by_ids(user_ids)
+
+    # the catalog is written once from the data files, new books are picked up by writing it again
+    def add_book(self, book: Book):
+        raise ReadOnlyCatalogError("the mapped catalog is read-only")
+
+    def add_author(self, author_input: Author):
+        raise ReadOnlyCatalogError("the mapped catalog is read-only")
+
+    def add_publisher(self, publisher_input: Publisher):
+        raise ReadOnlyCatalogError("the mapped catalog is read-only")
+
+    def get_book(self, book_id) -> Book:
+        row = self.__catalog.row_of(int(book_id))
+        return None if row is None else self.__catalog.book(row)
+
+    def get_books_by_ids(self, book_ids) -> Dict[int, Book]:
+        books = {}
+        for book_id in book_ids:
+            book = self.get_book(book_id)
+            if book is not None:
+                books[book.book_id] = book
+        return books
+
+    def get_books_page(self, limit: int, after: int = None) -> List[Book]:
+        start = 0 if after is None else self.__catalog.row_after(after)
+        return self.__catalog.books(range(start, min(start + limit, len(self.__catalog))))
+
+    def get_num_books(self) -> int:
+        return len(self.__catalog)
+
+    def get_books_by_tag(self, tag: str) -> List[Book]:
+        return self.__catalog.books(self.__catalog.book_rows('tag', self.__catalog.tag_row(tag)))
+
+    def get_tag_counts(self, tags) -> Dict[str, int]:
+        return {tag: len(self.__catalog.book_rows('tag', self.__catalog.tag_row(tag))) for tag in tags}
+
+    def get_tags_by_input(self, input: str):
+        return {tag for tag in self.__catalog.tag_names() if input in tag}
+
+    def get_books_by_author(self, author: Author) -> List[Book]:
+        return self.__catalog.books(self.__catalog.book_rows('author', self.__catalog.author_row(author.unique_id)))
+
+    def get_books_by_authors(self, authors) -> List[Book]:
+        rows = {}
+        for author in authors:
+            for row in self.__catalog.book_rows('author', self.__catalog.author_row(author.unique_id)):
+                rows.setdefault(row)
+        return self.__catalog.books(rows)
+
+    def get_books_by_publisher(self, publisher: Publisher) -> List[Book]:
+        return self.__catalog.books(self.__catalog.book_rows('publisher', self.__catalog.publisher_row(publisher.name)))
+
+    def get_books_by_date_range(self, start: int = None, end: int = None, descending: bool = False) -> List[Book]:
+        rows = self.__catalog.year_rows(start, end)
+        return self.__catalog.books(reversed(rows) if descending else rows)
+
+    def get_books_by_title(self, title: str):
+        return self.__catalog.books(self.__catalog.title_rows(title))
+
+    def get_authors_by_name(self, name: str):
+        return [self.__catalog.author(row) for row in self.__catalog.author_name_rows(name)]
+
+    def filter_books(self, release_year: tuple = None, rating: tuple = None, num_pages: tuple = None,
+                     ebook: bool = None, publisher: Publisher = None) -> List[Book]:
+        return self.find_books(BookQuery(release_year=release_year, rating=rating, num_pages=num_pages, ebook=ebook,
+                                         publisher=publisher))
+
+    # Books meeting every condition of the query, in order of book_id. The rows of the smallest index that
+    # answers one of the conditions are checked against the others in the catalog's columns, and only the
+    # books that pass are built.
+    def find_books(self, query: BookQuery, explain: bool = False):
+        catalog = self.__catalog
+        sources = [(f"tag {tag!r}", lambda tag=tag: catalog.book_rows('tag', catalog.tag_row(tag)))
+                   for tag in query.tags]
+        if query.author is not None:
+            sources.append(("author", lambda: catalog.book_rows('author', catalog.author_row(query.author.unique_id))))
+        if query.publisher is not None:
+            sources.append(("publisher",
+                            lambda: catalog.book_rows('publisher', catalog.publisher_row(query.publisher.name))))
+        if query.release_year is not None:
+            sources.append(("release_year", lambda: catalog.year_rows(*query.release_year)))
+        checks = self.__row_checks(query)
+        if sources:
+            name, rows = min(((name, rows()) for name, rows in sources), key=lambda source: len(source[1]))
+            source = f"{checks[name][0]} index"
+        elif query.title is not None:
+            name, rows = "title", catalog.title_rows(query.title)
+            source = f"{checks[name][0]} search"
+        else:
+            name, rows, source = None, range(len(catalog)), "all books"
+        checks.pop(name, None)
+        if explain:
+            return QueryPlan([f"{len(catalog)} books", f"use {source}: {len(rows)} rows"] +
+                             [f"check {description}" for description, _ in checks.values()])
+        rows = [row for row in rows if all(check(row) for _, check in checks.values())]
+        return catalog.books(sorted(rows))
+
+    # (description, check) for each condition of the query, keyed like the query's conditions, where check
+    # tells from the catalog's columns whether the book in a row meets it
+    def __row_checks(self, query: BookQuery) -> dict:
+        catalog = self.__catalog
+        checks = {}
+        for tag in query.tags:
+            tag_row = catalog.tag_row(tag)
+            checks[f"tag {tag!r}"] = (f"tag {tag!r}", lambda row, tag_row=tag_row: tag_row in catalog.tag_rows_of(row))
+        if query.author is not None:
+            author_row = catalog.author_row(query.author.unique_id)
+            checks["author"] = (f"author {query.author.unique_id}",
+                                lambda row: author_row in catalog.author_rows_of(row))
+        if query.publisher is not None:
+            publisher_row = catalog.publisher_row(query.publisher.name)
+            checks["publisher"] = (f"publisher {query.publisher.name!r}",
+                                   lambda row: publisher_row is not None
+                                   and catalog.value('publishers', row) == publisher_row)
+        for name, section, bounds in (("release_year", 'release_years', query.release_year),
+                                      ("rating", 'ratings', query.rating), ("num_pages", 'num_pages', query.num_pages)):
+            if bounds is not None:
+                checks[name] = (f"{name} {range_text(bounds)}",
+                                lambda row, section=section, bounds=bounds: self.__in_range(
+                                    catalog.value(section, row), bounds))
+        if query.ebook is not None:
+            checks["ebook"] = (f"ebook {query.ebook}", lambda row: catalog.value('ebooks', row) == int(query.ebook))
+        if query.title is not None:
+            title = query.title.lower()
+            checks["title"] = (f"title {query.title!r}", lambda row: title in catalog.lower_title(row))
+        return checks
+
+    @staticmethod
+    def __in_range(value, bounds: tuple) -> bool:
+        low, high = bounds
+        return value is not None and (low is None or low <= value) and (high is None or value <= high)
+
+    # The best books overall by rating or page count are the first rows of the catalog's ranked sections.
+    # Other lists are picked from the rows in scope with a heap of size limit.
+    def get_top_books(self, ranking: str, limit: int, tag: str = None, publisher: Publisher = None) -> List[Book]:
+        if ranking not in RANKINGS:
+            raise ValueError(f"books can be ranked by {', '.join(RANKINGS)}, not {ranking!r}")
+        catalog = self.__catalog
+        if ranking != 'reviews' and tag is None and publisher is None:
+            return catalog.books(catalog.section(f'{ranking}_rows')[:limit])
+        book_ids = catalog.section('book_ids')
+        if ranking == 'reviews':
+            with self.__num_reviews_lock:
+                num_reviews = Counter(self.__num_reviews)
+            rows = (catalog.row_of(book_id) for book_id in num_reviews)
+            rows = [row for row in rows if row is not None]
+        else:
+            rows = range(len(catalog))
+        if tag is not None:
+            tag_row = catalog.tag_row(tag)
+            rows = [row for row in rows if tag_row in catalog.tag_rows_of(row)]
+        if publisher is not None:
+            publisher_row = catalog.publisher_row(publisher.name)
+            rows = [row for row in rows if publisher_row is not None
+                    and catalog.value('publishers', row) == publisher_row]
+        if ranking == 'reviews':
+            scores = ((num_reviews[book_ids[row]], row) for row in rows)
+        else:
+            section = {'rating': 'ratings', 'num_pages': 'num_pages'}[ranking]
+            scores = ((catalog.value(section, row), row) for row in rows)
+        best = heapq.nsmallest(limit, ((-score, book_ids[row], row) for score, row in scores if score is not None))
+        return catalog.books(row for _, _, row in best)
+
+    def get_facet_counts(self, book_ids=None) -> Dict[str, dict]:
+        if book_ids is None:
+            return self.__catalog.facet_counts()
+        rows = (self.__catalog.row_of(int(book_id)) for book_id in book_ids)
+        return self.__catalog.facet_counts(row for row in rows if row is not None)
+
+    def get_related_books(self, book: Book) -> List[Book]:
+        catalog = self.__catalog
+        read_it = catalog.book_rows('tag', catalog.tag_row("read-it"))
+        if not read_it:
+            return []
+        related = set()
+        for tag_row in catalog.tag_rows_of(read_it[0]):
+            related.update(catalog.book_rows('tag', tag_row))
+        rec_books = catalog.books(random.sample(list(related), min(19, len(related))))
+        rec_books.append(catalog.book(read_it[0]))
+        return reversed(rec_books)
+
+    def get_author(self, author_id) -> Author:
+        row = self.__catalog.author_row(author_id)
+        return None if row is None else self.__catalog.author(row)
+
+    def get_num_authors(self) -> int:
+        return self.__catalog.num_authors()
+
+    def get_publisher(self, publisher_name) -> Publisher:
+        row = self.__catalog.publisher_row(publisher_name) if isinstance(publisher_name, str) else None
+        return None if row is None else self.__catalog.publisher(row)
+
+    def get_num_publishers(self) -> int:
+        return self.__catalog.num_publishers()
+
+    def add_entry(self, entry):
+        self.__memory.add_entry(entry)
+
+    def update_entry(self, entry):
+        self.__memory.update_entry(entry)
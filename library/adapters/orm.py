@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Table, MetaData, Column, Integer, String, Date, DateTime,
-    ForeignKey, Boolean, text
+    ForeignKey, Boolean, Index, text
 )
 from sqlalchemy.orm import mapper, relationship, synonym
 
@@ -53,6 +53,16 @@ reviews_table = Table(
     Column('timestamp', DateTime)
 )
 
+# the best books by rating or page count, overall and for a publisher, are read off the top of these
+Index('books_rating', books_table.c.rating)
+Index('books_num_pages', books_table.c.num_pages)
+Index('books_publisher_rating', books_table.c.publisher_id, books_table.c.rating)
+Index('books_publisher_num_pages', books_table.c.publisher_id, books_table.c.num_pages)
+
+# a page of a book's or a user's newest reviews is read off these without sorting
+Index('reviews_book_timestamp', reviews_table.c.book_id, reviews_table.c.timestamp)
+Index('reviews_user_timestamp', reviews_table.c.user_id, reviews_table.c.timestamp)
+
 tags_table = Table(
     'tags', metadata,
     Column('id', Integer, primary_key=True, autoincrement=True),
@@ -149,7 +159,8 @@ def map_model_to_tables():
         # '_Review__user': relationship(model.User),
         '_Review__review_text': reviews_table.c.review,
         '_Review__rating': reviews_table.c.rating,
-        '_Review__timestamp': reviews_table.c.timestamp
+        '_Review__timestamp': reviews_table.c.timestamp,
+        '_Review__review_id': reviews_table.c.id
     })
 
     mapper(model.Tag, tags_table, properties={
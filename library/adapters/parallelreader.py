@@ -0,0 +1,47 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# bytes of json lines handed to a worker at a time
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+# splits a json lines file, up to file_size bytes, into (start, end) byte ranges of about chunk_size bytes
+# that begin and end on line breaks
+def line_aligned_ranges(file_name: str, chunk_size: int = CHUNK_SIZE, file_size: int = None) -> list:
+    if file_size is None:
+        file_size = os.path.getsize(file_name)
+    ranges = []
+    with open(file_name, 'rb') as jsonfile:
+        start = 0
+        while start < file_size:
+            jsonfile.seek(min(start + chunk_size, file_size))
+            # finish the line the cut landed in, so the next range starts on a fresh line
+            jsonfile.readline()
+            end = min(jsonfile.tell(), file_size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+# runs in a worker process: decodes the lines in one byte range and normalises each into a plain tuple
+def parse_range(file_name: str, start: int, end: int, normalise) -> list:
+    with open(file_name, 'rb') as jsonfile:
+        jsonfile.seek(start)
+        lines = jsonfile.read(end - start).splitlines()
+    return [normalise(json.loads(line)) for line in lines if line.strip()]
+
+
+# Yields the normalised records of a json lines file in file order, parsed by a pool of worker processes.
+# Only a couple of ranges per worker are in flight, so the parent's memory stays bounded by the chunk size.
+def iter_records_parallel(file_name: str, normalise, workers: int, chunk_size: int = CHUNK_SIZE,
+                          file_size: int = None):
+    ranges = deque(line_aligned_ranges(file_name, chunk_size, file_size))
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while ranges or pending:
+            while ranges and len(pending) < workers * 2:
+                start, end = ranges.popleft()
+                pending.append(executor.submit(parse_range, file_name, start, end, normalise))
+            yield from pending.popleft().result()
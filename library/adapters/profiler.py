@@ -0,0 +1,135 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# handed out while the profiler is not running, so unprofiled loads only pay for an empty with block
+NOT_PROFILED = nullcontext()
+
+
+class IngestProfiler:
+    # Times the stages of a load. Stages nest, and time spent in an inner stage is only counted for the inner
+    # one, so the stage times add up to the load's time. Every entry of a stage counts as one record.
+    # With trace_memory the peak of the memory traced by tracemalloc is kept for each stage; a stage's peak
+    # includes the stages nested in it. Tracing memory slows the load down, times are best read without it.
+
+    def __init__(self, trace_memory: bool = True):
+        self.__trace_memory = trace_memory
+        self.__started_tracing = False
+        self.__running = False
+        self.__stack = []
+        self.__seconds = {}
+        self.__records = {}
+        self.__peaks = {}
+        self.__start_time = self.__mark = 0.0
+        self.__total_seconds = None
+
+    @property
+    def running(self) -> bool:
+        return self.__running
+
+    def start(self):
+        if self.__trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracing = True
+        self.__running = True
+        self.__start_time = self.__mark = time.perf_counter()
+
+    # stops timing and returns the report, later stages are not recorded
+    def finish(self) -> dict:
+        if self.__running:
+            self.__total_seconds = time.perf_counter() - self.__start_time
+            self.__running = False
+            if self.__started_tracing:
+                tracemalloc.stop()
+                self.__started_tracing = False
+        return self.report()
+
+    def stage(self, name: str):
+        return self.__timed(name) if self.__running else NOT_PROFILED
+
+    # times every step of an iterator as the named stage, for stages that are generators
+    def iterate(self, name: str, iterable):
+        return self.__timed_steps(name, iterable) if self.__running else iterable
+
+    @contextmanager
+    def __timed(self, name: str):
+        self.__enter(name)
+        try:
+            yield
+        finally:
+            self.__exit()
+
+    def __timed_steps(self, name: str, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    # the step that found the end did not produce a record
+                    self.__records[name] -= 1
+                    return
+            yield item
+
+    def __enter(self, name: str):
+        self.__switch()
+        self.__stack.append(name)
+        self.__records[name] = self.__records.get(name, 0) + 1
+        self.__seconds.setdefault(name, 0.0)
+
+    def __exit(self):
+        self.__switch()
+        self.__stack.pop()
+
+    # the time and peak memory since the last switch belong to the stage on top of the stack,
+    # and the peak also to the stages it is nested in
+    def __switch(self):
+        now = time.perf_counter()
+        if self.__stack:
+            self.__seconds[self.__stack[-1]] += now - self.__mark
+            if tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1]
+                for name in self.__stack:
+                    if peak > self.__peaks.get(name, 0):
+                        self.__peaks[name] = peak
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self.__mark = time.perf_counter()
+
+    def report(self) -> dict:
+        total_seconds = self.__total_seconds
+        if total_seconds is None:
+            total_seconds = time.perf_counter() - self.__start_time
+        stages = []
+        for name, seconds in self.__seconds.items():
+            records = self.__records[name]
+            stages.append({
+                "stage": name,
+                "records": records,
+                "seconds": seconds,
+                "records_per_second": records / seconds if seconds else None,
+                "peak_memory_mb": self.__peaks[name] / 2 ** 20 if name in self.__peaks else None
+            })
+        return {
+            "total_seconds": total_seconds,
+            "unattributed_seconds": max(total_seconds - sum(self.__seconds.values()), 0.0),
+            "memory_traced": self.__trace_memory,
+            "stages": stages
+        }
+
+    def print_report(self):
+        report = self.report()
+        print(f"Ingestion took {report['total_seconds']:.2f}s")
+        print(f"{'stage':<22} {'records':>9} {'seconds':>9} {'share':>6} {'records/s':>11} {'peak (MB)':>10}")
+        for stage in report["stages"]:
+            share = stage["seconds"] / report["total_seconds"] * 100 if report["total_seconds"] else 0
+            rate = f"{stage['records_per_second']:.0f}" if stage["records_per_second"] else "-"
+            peak = f"{stage['peak_memory_mb']:.1f}" if stage["peak_memory_mb"] is not None else "-"
+            print(f"{stage['stage']:<22} {stage['records']:>9} {stage['seconds']:>9.3f} {share:>5.1f}% "
+                  f"{rate:>11} {peak:>10}")
+        print(f"{'other':<22} {'':>9} {report['unattributed_seconds']:>9.3f}")
+
+    def write_report(self, file_name: str):
+        with open(file_name, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2)
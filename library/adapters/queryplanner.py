@@ -0,0 +1,143 @@
+from operator import attrgetter
+
+from library.adapters.bookquery import BookQuery, QueryPlan, range_text
+
+# Costs relative to checking one condition on one book in Python.
+# taking one book from an index's list of books
+INDEX_ROW_COST = 0.1
+# checking a candidate title from the trigram index, which mostly misses the cache
+TITLE_ROW_COST = 4.0
+# matching one column against one row of the columnar store, and picking a row out of the combined mask
+MASK_ROW_COST = 0.01
+PICK_ROW_COST = 0.05
+# the conditions the columnar store can answer, in the order BookColumns.filter takes them
+COLUMN_CONDITIONS = ('release_year', 'rating', 'num_pages', 'ebook', 'publisher')
+
+
+class AccessPath:
+    # One way of fetching the books that meet some of a query's conditions: an index or the columnar store
+
+    def __init__(self, description: str, covers: set, rows: float, cost: float, fetch):
+        self.__description = description
+        self.__covers = covers
+        self.__rows = rows
+        self.__cost = cost
+        self.__fetch = fetch
+
+    @property
+    def description(self) -> str:
+        return self.__description
+
+    # the names of the conditions every fetched book meets
+    @property
+    def covers(self) -> set:
+        return self.__covers
+
+    @property
+    def rows(self) -> float:
+        return self.__rows
+
+    @property
+    def cost(self) -> float:
+        return self.__cost
+
+    # the books, in whatever order the index holds them
+    def fetch(self) -> list:
+        return self.__fetch()
+
+
+class PlannedQuery:
+    # The access path chosen for a query, and the conditions it leaves to be checked book by book,
+    # the most selective first
+
+    def __init__(self, num_books: int, paths: list, path: AccessPath, checks: list, cost: float):
+        self.__num_books = num_books
+        self.__paths = paths
+        self.__path = path
+        self.__checks = checks
+        self.__cost = cost
+
+    # the books meeting the query in order of book_id, the order every repository returns them in
+    def run(self) -> list:
+        books = self.__path.fetch()
+        for _, _, check in self.__checks:
+            books = [book for book in books if check(book)]
+        books.sort(key=attrgetter('book_id'))
+        return books
+
+    def explain(self) -> QueryPlan:
+        steps = [f"{self.__num_books} books"]
+        for path in self.__paths:
+            steps.append(f"considered {path.description}: ~{path.rows:.0f} rows, cost {path.cost:.1f}")
+        steps.append(f"use {self.__path.description}: ~{self.__path.rows:.0f} rows, total cost {self.__cost:.1f}")
+        for description, selectivity, _ in self.__checks:
+            steps.append(f"check {description}: ~{selectivity:.0%} pass")
+        return QueryPlan(steps)
+
+
+# Estimates how many books meet each condition of the query from the repository version's indexes, costs every
+# way of fetching books for it and picks the cheapest, counting the checks of the conditions left over.
+def plan_query(version, query: BookQuery) -> PlannedQuery:
+    num_books = len(version.books_by_id)
+    conditions = {name: (description, check) for name, description, check in query.conditions()}
+    rows = {}
+    paths = []
+
+    def index_path(name: str, books):
+        rows[name] = len(books)
+        paths.append(AccessPath(f"{conditions[name][0]} index", {name}, len(books), len(books) * INDEX_ROW_COST,
+                                lambda: list(books)))
+
+    for tag in query.tags:
+        index_path(f"tag {tag!r}", version.books_by_tag.get(tag, ()))
+    if query.author is not None:
+        index_path("author", version.books_by_author.get(query.author.unique_id, ()))
+    if query.publisher is not None:
+        index_path("publisher", version.books_by_publisher.get(query.publisher.name, ()))
+    if query.release_year is not None:
+        low, high = query.release_year
+        books_by_year = version.books_by_year
+        first = 0 if low is None else books_by_year.bisect_left(low)
+        last = len(books_by_year) if high is None else books_by_year.bisect_right(high)
+        count = max(last - first, 0)
+        rows["release_year"] = count
+        paths.append(AccessPath(f"release_year {range_text(query.release_year)} index", {"release_year"}, count,
+                                count * INDEX_ROW_COST, lambda: books_by_year.values(first, last)))
+    if query.title is not None:
+        count = version.title_index.estimate(query.title)
+        rows["title"] = count
+        paths.append(AccessPath(f"title {query.title!r} trigram index", {"title"}, count, count * TITLE_ROW_COST,
+                                lambda: version.title_index.search(query.title)))
+
+    columns = version.book_columns
+    column_filters = {
+        'release_year': query.release_year, 'rating': query.rating, 'num_pages': query.num_pages,
+        'ebook': query.ebook, 'publisher': None if query.publisher is None else query.publisher.name
+    }
+    column_filters = {name: value for name, value in column_filters.items() if value is not None}
+    for name in ('rating', 'num_pages', 'ebook'):
+        if name in column_filters:
+            rows[name] = columns.estimate(**{name: column_filters[name]})
+    if column_filters:
+        paths.append(AccessPath(f"column masks on {', '.join(column_filters)}", set(column_filters),
+                                columns.estimate(**column_filters),
+                                num_books * (MASK_ROW_COST * len(column_filters) + PICK_ROW_COST),
+                                lambda: columns.filter(**column_filters)))
+    if not paths:
+        paths.append(AccessPath("all books", set(), num_books, num_books * INDEX_ROW_COST,
+                                lambda: list(version.books_by_id.values())))
+
+    best = None
+    for path in paths:
+        checks = sorted((rows[name] / num_books if num_books else 0, conditions[name][0], conditions[name][1])
+                        for name in conditions if name not in path.covers)
+        # every check runs on the books that passed the checks before it
+        cost = path.cost
+        passing = path.rows
+        for selectivity, _, _ in checks:
+            cost += passing
+            passing *= selectivity
+        if best is None or cost < best[0]:
+            best = (cost, path, [(description, selectivity, check) for selectivity, description, check in checks])
+    cost, path, checks = best
+    return PlannedQuery(num_books, paths, path, checks, cost)
@@ -1,160 +1,551 @@
 import csv
+import heapq
+import threading
+from contextlib import contextmanager
+from copy import copy
 from pathlib import Path
 from datetime import date, datetime
-from typing import List
+from typing import List, Dict
 
-from bisect import bisect, bisect_left, insort_left
+from bisect import bisect, bisect_left
 from werkzeug.security import generate_password_hash
 from library.domain.model import Publisher, Author, Book, SearchMethod, User, Review, ReadingCollection
 
 from library.adapters.abstractrepository import AbstractRepository
+from library.adapters.bookquery import BookQuery
+from library.adapters.columnstore import BookColumns
+from library.adapters.copyonwrite import SharedList, SharedMap, SortedIndex, VersionWriter
+from library.adapters.facets import FacetCounts
+from library.adapters.leaderboard import LEADERBOARD_SIZE, RANKINGS, Leaderboard
+from library.adapters.queryplanner import plan_query
+from library.adapters.trigramindex import TrigramIndex
+from library.adapters.writeaheadlog import WriteAheadLog, entry_record, review_record, user_record
 
 
 
 
-class MemoryRepository(AbstractRepository):
+class RepositoryVersion:
+    # One version of everything MemoryRepository holds. A published version is never changed again: writers
+    # build the next one with a VersionWriter and swap it in, so a reader holding a version always sees the
+    # same data.
+    __slots__ = ('number', 'books', 'reviews', 'users', 'publishers', 'authors', 'books_by_tag', 'books_by_id',
+                 'users_by_name', 'users_by_id', 'authors_by_id', 'publishers_by_name', 'books_by_year',
+                 'books_by_author', 'books_by_publisher', 'title_index', 'author_name_index', 'reviews_by_book',
+                 'reviews_by_user', 'book_columns', 'books_in_id_order', 'leaderboards', 'facets', 'log_seq')
 
     def __init__(self):
-        self.__books = []
-        self.__reviews = []
-        self.__search = SearchMethod(self.__books, self.__reviews)
-        self.__users = []
-        self.__publishers = []
-        self.__authors = []
+        self.number = 0
+        self.books = SharedList()
+        self.reviews = SharedList()
+        self.users = SharedList()
+        self.publishers = SharedList()
+        self.authors = SharedList()
+        # inverted tag index, each tag maps to its books in the order they were added
+        self.books_by_tag = SharedMap()
+        # primary key indexes kept by the add methods. The first object added under a key wins,
+        # as it did when the lists were scanned.
+        self.books_by_id = SharedMap()
+        self.users_by_name = SharedMap()
+        self.users_by_id = SharedMap()
+        self.authors_by_id = SharedMap()
+        self.publishers_by_name = SharedMap()
+        # release year index: every book with a year under its year, books of the same year in the order added
+        self.books_by_year = SortedIndex()
+        # secondary indexes from an author's id and a publisher's name to their books, in the order added
+        self.books_by_author = SharedMap()
+        self.books_by_publisher = SharedMap()
+        # substring search over book titles and author names
+        self.title_index = TrigramIndex()
+        self.author_name_index = TrigramIndex()
+        # review indexes: for each book id and each user id, the (timestamp, review_id) of its reviews in
+        # order and the reviews themselves alongside them
+        self.reviews_by_book = SharedMap()
+        self.reviews_by_user = SharedMap()
+        # the attributes books are filtered on in typed arrays, a row for each book in books_by_id
+        self.book_columns = BookColumns()
+        # the books of books_by_id under their ids, for paging through the catalog in order of book_id
+        self.books_in_id_order = SortedIndex()
+        # a Leaderboard for each ranking over all books, and over the books of each tag and each publisher,
+        # keyed by (ranking, None), (ranking, 'tag', tag) and (ranking, 'publisher', publisher name)
+        self.leaderboards = SharedMap()
+        # the number of books with each tag, publisher, decade and format, and each book's values for them
+        self.facets = FacetCounts()
+        # the seq of the last write-ahead log record whose write the version holds
+        self.log_seq = 0
+
 
+class MemoryRepository(AbstractRepository):
+    # Reads take no lock. They use the current RepositoryVersion, which is never changed once published.
+    # Writes are made one at a time under a lock. Each builds a new version, copying only the parts of the
+    # containers it changes, and publishes it with a single assignment. A batch publishes many writes as one
+    # version. A thread that pins a version, as each request does, reads that version until it unpins it.
+    # With a WriteAheadLog attached, the records of a write are appended to it before the write is published.
+
+    def __init__(self):
+        self.__version = RepositoryVersion()
+        self.__write_lock = threading.Lock()
+        self.__writer = None
+        self.__writer_thread = None
+        self.__pinned = threading.local()
+        self.__log = None
+        # the records of the writes being made, or None when they are not logged
+        self.__log_records = None
+
+    # only the published version goes into snapshots
+    def __getstate__(self):
+        return {'version': self.__version}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__version = state['version']
+
+    # the version the calling thread reads: the one it is writing, the one it pinned, or the latest one
+    def __view(self) -> RepositoryVersion:
+        if self.__writer_thread == threading.get_ident():
+            return self.__writer.version
+        pinned = getattr(self.__pinned, 'version', None)
+        return self.__version if pinned is None else pinned
+
+    # the number of the version the calling thread reads, which goes up by one with every published write
+    @property
+    def version(self) -> int:
+        return self.__view().number
+
+    # Makes every read from the calling thread see the current version until unpin_version is called, so
+    # a request sees one consistent repository. The thread's own writes are pinned as they are published.
+    def pin_version(self):
+        self.__pinned.version = self.__version
+
+    def unpin_version(self):
+        self.__pinned.version = None
+
+    # Writes made by the calling thread inside the block are published together as one version when it
+    # exits, and not at all if it raises. Reads from the same thread see the writes straight away.
+    # With logged=False the writes are not appended to the write-ahead log, for writes that are made again
+    # on startup anyway.
+    @contextmanager
+    def batch(self, logged: bool = True):
+        with self.__writing(logged):
+            yield
+
+    # Appends the records of every later write to the log. Attach it after the writes it holds are replayed.
+    def attach_log(self, log: WriteAheadLog):
+        self.__log = log
+
+    # the seq of the last write-ahead log record the repository holds
+    @property
+    def log_seq(self) -> int:
+        return self.__view().log_seq
+
+    @log_seq.setter
+    def log_seq(self, seq: int):
+        with self.__writing() as writer:
+            writer.version.log_seq = seq
+
+    @contextmanager
+    def __writing(self, logged: bool = True):
+        if self.__writer_thread == threading.get_ident():
+            # part of a batch the thread already has open
+            yield self.__writer
+            return
+        with self.__write_lock:
+            self.__writer = VersionWriter(self.__version)
+            self.__writer_thread = threading.get_ident()
+            self.__log_records = [] if logged and self.__log is not None else None
+            try:
+                yield self.__writer
+                if self.__log_records:
+                    # a write that could not be logged is never published
+                    self.__writer.version.log_seq = self.__log.append(self.__log_records)
+                self.__publish(self.__writer)
+            finally:
+                self.__writer = None
+                self.__writer_thread = None
+                self.__log_records = None
+
+    # keeps the record of a write for the log, made by record_of only when the write is logged
+    def __record(self, record_of, *args):
+        if self.__log_records is not None:
+            self.__log_records.append(record_of(*args))
+
+    def __publish(self, writer: VersionWriter):
+        version = writer.version
+        if version.book_columns.needs_build:
+            writer.field('book_columns').build()
+        self.__version = version
+        if getattr(self.__pinned, 'version', None) is not None:
+            self.__pinned.version = version
 
     # returns all books in the repository
     @property
     def books(self) -> List[Book]:
-        return self.__books
+        return self.__view().books
 
     # returns all the publishers in the repository
     @property
     def publishers(self) -> List[Publisher]:
-        return self.__publishers
+        return self.__view().publishers
 
     # returns all authors in the repository
     @property
     def authors(self) -> List[Author]:
-        return self.__authors
+        return self.__view().authors
 
     # returns all reviews in repository
     @property
     def reviews(self) -> List[Review]:
-        return self.__reviews
+        return self.__view().reviews
 
-    # adds a review to the repository
+    # adds a review to the repository, numbered by review_id in the order reviews are added
     def add_review(self, review: Review):
         if isinstance(review, Review):
-            self.__reviews.append(review)
-
-    # gets review for a book from the repository
-    def get_reviews(self, book: Book) -> List[Review]:
-        self.__search.search_reviews_by_book(book)
-        return self.__search.found_items
+            with self.__writing() as writer:
+                self.__record(review_record, review)
+                review.review_id = len(writer.version.reviews) + 1
+                writer.field('reviews').append(review)
+                if review.book is not None:
+                    self.__add_to_timeline(writer, 'reviews_by_book', review.book.book_id, review)
+                    book = writer.version.books_by_id.get(review.book.book_id)
+                    if book is not None:
+                        num_reviews = len(writer.version.reviews_by_book[book.book_id][0])
+                        self.__rank(writer, book, 'reviews', num_reviews, num_reviews - 1 or None)
+                if review.user is not None:
+                    self.__add_to_timeline(writer, 'reviews_by_user', review.user.user_id, review)
+
+    # gets reviews for a book from the repository, newest first, with a binary search for before
+    def get_reviews(self, book: Book, limit: int = None, before: datetime = None,
+                    before_id: int = None) -> List[Review]:
+        return self.__page(self.__view().reviews_by_book.get(book.book_id), limit, before, before_id)
+
+    # gets reviews written by a user, newest first
+    def get_user_reviews(self, user: User, limit: int = None, before: datetime = None,
+                         before_id: int = None) -> List[Review]:
+        return self.__page(self.__view().reviews_by_user.get(user.user_id), limit, before, before_id)
+
+    # A review newer than the timeline's others is appended to the lists it shares with earlier versions.
+    # Only a review written before the newest one copies the timeline.
+    @staticmethod
+    def __add_to_timeline(writer: VersionWriter, name: str, key, review: Review):
+        timelines = writer.field(name)
+        keys, reviews = timelines.get(key) or (SharedList(), SharedList())
+        review_key = (review.timestamp, review.review_id)
+        if not keys or review_key > keys[-1]:
+            keys, reviews = copy(keys), copy(reviews)
+            keys.append(review_key)
+            reviews.append(review)
+        else:
+            position = bisect(keys, review_key)
+            keys, reviews = keys[:], reviews[:]
+            keys.insert(position, review_key)
+            reviews.insert(position, review)
+            keys, reviews = SharedList(keys), SharedList(reviews)
+        timelines[key] = (keys, reviews)
+
+    # the reviews before the (before, before_id) key, or written before the time before without before_id
+    @staticmethod
+    def __page(timeline, limit: int, before: datetime, before_id: int) -> List[Review]:
+        if timeline is None:
+            return []
+        keys, reviews = timeline
+        if before is None:
+            end = len(keys)
+        else:
+            end = bisect_left(keys, (before,) if before_id is None else (before, before_id))
+        start = 0 if limit is None else max(end - limit, 0)
+        page = reviews[start:end]
+        page.reverse()
+        return page
 
     # adds a user to the repository
     def add_user(self, user: User):
         if isinstance(user, User):
-            self.__users.append(user)
+            with self.__writing() as writer:
+                self.__record(user_record, user)
+                writer.field('users').append(user)
+                writer.field('users_by_name').setdefault(user.user_name, user)
+                writer.field('users_by_id').setdefault(user.user_id, user)
 
     # gets a user based on the given user_name
     def get_user(self, user_name: str):
-        return next((user for user in self.__users if user.user_name == user_name), None)
+        return self.__view().users_by_name.get(user_name)
 
     # gets a user based on the given user_id
     def get_user_by_id(self, user_id: str):
-        return next((user for user in self.__users if user.user_id == user_id), None)
+        return self.__view().users_by_id.get(user_id)
+
+    # gets the users with the given user_ids
+    def get_users_by_ids(self, user_ids) -> Dict[str, User]:
+        users_by_id = self.__view().users_by_id
+        return {user_id: users_by_id[user_id] for user_id in user_ids if user_id in users_by_id}
 
     # adds a book to the repository
     def add_book(self, book):
         if isinstance(book, Book):
-            self.__books.append(book)
+            with self.__writing() as writer:
+                writer.field('books').append(book)
+                if book.book_id not in writer.version.books_by_id:
+                    self.__index_book(writer, book)
+
+    def __index_book(self, writer: VersionWriter, book: Book):
+        writer.field('books_by_id')[book.book_id] = book
+        # a book's tags are indexed when it is added, so they are set before add_book
+        books_by_tag = writer.field('books_by_tag')
+        for tag in book.tags:
+            writer.item(books_by_tag, tag, SharedList).append(book)
+        if isinstance(book.release_year, int):
+            writer.field('books_by_year').insert(book.release_year, book)
+        books_by_author = writer.field('books_by_author')
+        for author in book.authors:
+            writer.item(books_by_author, author.unique_id, SharedList).append(book)
+        if book.publisher is not None:
+            writer.item(writer.field('books_by_publisher'), book.publisher.name, SharedList).append(book)
+        writer.field('title_index').add(book, book.title)
+        writer.field('book_columns').append(book)
+        writer.field('facets').add(book)
+        for ranking in RANKINGS:
+            score = self.__score(writer.version, book, ranking)
+            if score is not None:
+                self.__rank(writer, book, ranking, score)
+        writer.field('books_in_id_order').insert(book.book_id, book)
+
+    # what a book is ranked by, or None when it has no value to rank it by, such as a book without reviews
+    @staticmethod
+    def __score(version: RepositoryVersion, book: Book, ranking: str):
+        if ranking == 'reviews':
+            timeline = version.reviews_by_book.get(book.book_id)
+            return len(timeline[0]) if timeline else None
+        return getattr(book, ranking)
+
+    @staticmethod
+    def __leaderboard_keys(ranking: str, book: Book) -> list:
+        keys = [(ranking, None)] + [(ranking, 'tag', tag) for tag in book.tags]
+        if book.publisher is not None:
+            keys.append((ranking, 'publisher', book.publisher.name))
+        return keys
+
+    # offers the book's new score to each leaderboard it is on, copying only the ones it changes
+    def __rank(self, writer: VersionWriter, book: Book, ranking: str, score, old_score=None):
+        leaderboards = writer.version.leaderboards
+        for key in self.__leaderboard_keys(ranking, book):
+            leaderboard = leaderboards.get(key)
+            if leaderboard is None or leaderboard.changes(book.book_id, score, old_score):
+                writer.item(writer.field('leaderboards'), key, Leaderboard).offer(book.book_id, score, old_score)
+                leaderboards = writer.version.leaderboards
 
     # gets a book based on the given book_id
     def get_book(self, book_id) -> Book:
-        for book in self.__books:
-            if book.book_id == int(book_id):
-                return book
-        return None
-
+        return self.__view().books_by_id.get(int(book_id))
+
+    # gets the books with the given book_ids
+    def get_books_by_ids(self, book_ids) -> Dict[int, Book]:
+        books_by_id = self.__view().books_by_id
+        books = {}
+        for book_id in book_ids:
+            book = books_by_id.get(int(book_id))
+            if book is not None:
+                books[book.book_id] = book
+        return books
+
+    # case-insensitive substring search through the title trigram index
     def get_books_by_title(self, title: str):
-        self.__search.search_by_title(title)
-        return self.__search.found_items
+        return self.__view().title_index.search(title)
 
     def get_authors_by_name(self, name: str):
-        authors = []
-        for author in self.__authors:
-            if name.lower()  in author.full_name.lower():
-                authors.append(author)
-        return authors
+        return self.__view().author_name_index.search(name)
 
+    # only the distinct tags are matched, not the tags of every book
     def get_tags_by_input(self, input: str):
-        tags = set()
-        for book in self.__books:
-            for tag in book.tags:
-                if input in tag:
-                    tags.add(tag)
-        return tags
+        return {tag for tag in self.__view().books_by_tag if input in tag}
+
+    # the number of books with each of the given tags, read off the tag index
+    def get_tag_counts(self, tags) -> Dict[str, int]:
+        books_by_tag = self.__view().books_by_tag
+        return {tag: len(books_by_tag.get(tag, ())) for tag in tags}
+
+    # A page of books in order of book_id, found with a binary search for the book_id it starts after,
+    # so later pages cost no more than the first
+    def get_books_page(self, limit: int, after: int = None) -> List[Book]:
+        books = self.__view().books_in_id_order
+        start = 0 if after is None else books.bisect_right(after)
+        return books.values(start, start + limit)
+
+    # The best books by a ranking, read off its leaderboard. A longer list than a leaderboard keeps, or one for
+    # a tag and a publisher together, is picked from the books in scope with a heap of size limit.
+    def get_top_books(self, ranking: str, limit: int, tag: str = None, publisher: Publisher = None) -> List[Book]:
+        if ranking not in RANKINGS:
+            raise ValueError(f"books can be ranked by {', '.join(RANKINGS)}, not {ranking!r}")
+        version = self.__view()
+        if tag is not None and publisher is not None:
+            books = [book for book in version.books_by_tag.get(tag, ())
+                     if book.publisher is not None and book.publisher.name == publisher.name]
+        else:
+            if tag is not None:
+                key, books = (ranking, 'tag', tag), version.books_by_tag.get(tag, ())
+            elif publisher is not None:
+                key, books = (ranking, 'publisher', publisher.name), version.books_by_publisher.get(publisher.name, ())
+            else:
+                key, books = (ranking, None), version.books_by_id.values()
+            leaderboard = version.leaderboards.get(key)
+            if leaderboard is None:
+                return []
+            if limit <= LEADERBOARD_SIZE or len(leaderboard) < LEADERBOARD_SIZE:
+                return [version.books_by_id[book_id] for book_id in leaderboard.top(limit)]
+        scores = ((self.__score(version, book, ranking), book.book_id) for book in books)
+        best = heapq.nsmallest(limit, ((-score, book_id) for score, book_id in scores if score is not None))
+        return [version.books_by_id[book_id] for _, book_id in best]
+
+    # the facet counts kept as books are added, or the counts for the given books read off their rows
+    def get_facet_counts(self, book_ids=None) -> Dict[str, dict]:
+        return self.__view().facets.counts(None if book_ids is None else map(int, book_ids))
 
     # returns the amount of books in the repository
     def get_num_books(self) -> int:
-        return len(self.__books)
+        return len(self.__view().books)
 
     # returns books with the given tag
     def get_books_by_tag(self, tag: str) -> List[Book]:
-        self.__search.search_by_tag(tag)
-        return self.__search.found_items
+        version = self.__view()
+        return SearchMethod(version.books, version.reviews, version.books_by_tag).search_by_tag(tag)
 
     # gets books written by an inputted author
     def get_books_by_author(self, author: Author) -> List[Book]:
-        self.__search.search_by_author(author)
-        return self.__search.found_items
-
-    # gets books within a given publication year range
-    def get_books_by_date_range(self, start: int, end: int) -> List[Book]:
-        self.__search.search_by_date_range(start, end)
-        return self.__search.found_items
+        return list(self.__view().books_by_author.get(author.unique_id, ()))
+
+    # gets the books written by any of the given authors, each book once, in the order of the authors
+    def get_books_by_authors(self, authors) -> List[Book]:
+        books_by_author = self.__view().books_by_author
+        books = {}
+        for author in authors:
+            for book in books_by_author.get(author.unique_id, ()):
+                books.setdefault(book.book_id, book)
+        return list(books.values())
+
+    # Gets books released from the start year up to and including the end year with two binary searches.
+    # Books of the same year stay in the order they were added, and descending reverses the whole range.
+    def get_books_by_date_range(self, start: int = None, end: int = None, descending: bool = False) -> List[Book]:
+        books_by_year = self.__view().books_by_year
+        low = 0 if start is None else books_by_year.bisect_left(start)
+        high = len(books_by_year) if end is None else books_by_year.bisect_right(end)
+        books = books_by_year.values(low, high)
+        if descending:
+            books.reverse()
+        return books
+
+    # Books matching every given filter, in the order they were added, found with vectorised masks over the
+    # columnar store. release_year, rating and num_pages take a (low, high) range where either end can be None.
+    def filter_books(self, release_year: tuple = None, rating: tuple = None, num_pages: tuple = None,
+                     ebook: bool = None, publisher: Publisher = None) -> List[Book]:
+        return self.__view().book_columns.filter(release_year, rating, num_pages, ebook,
+                                                 None if publisher is None else publisher.name)
+
+    # Books meeting every condition of the query, in order of book_id. The planner fetches books
+    # through whichever index or column masks it expects to be cheapest and checks the other conditions on
+    # what comes back. With explain the QueryPlan is returned instead of the books.
+    def find_books(self, query: BookQuery, explain: bool = False):
+        planned = plan_query(self.__view(), query)
+        return planned.explain() if explain else planned.run()
 
     # gets books related to the given books.
     def get_related_books(self, book: Book) -> List[Book]:
-        return self.__search.search_related_books(book)
+        version = self.__view()
+        return SearchMethod(version.books, version.reviews, version.books_by_tag).search_related_books(book)
 
     # gets books by publisher
     def get_books_by_publisher(self, publisher: Publisher) -> List[Book]:
-        self.__search.search_books_by_publisher(publisher)
-        return self.__search.found_items
+        return list(self.__view().books_by_publisher.get(publisher.name, ()))
 
     # adds an author to repository
     def add_author(self, author_input: Author):
-        self.__authors.append(author_input)
+        with self.__writing() as writer:
+            writer.field('authors').append(author_input)
+            writer.field('author_name_index').add(author_input, author_input.full_name)
+            writer.field('authors_by_id').setdefault(author_input.unique_id, author_input)
 
     # gets an author from the repository with the given id
     def get_author(self, author_id) -> Author:
-        return next((author for author in self.__authors if author.unique_id == author_id), None)
+        return self.__view().authors_by_id.get(author_id)
 
     # gets the number of authors in the repository
     def get_num_authors(self) -> int:
-        return len(self.__authors)
+        return len(self.__view().authors)
 
     # adds the publisher to repository
     def add_publisher(self, publisher_input: Publisher):
         if isinstance(publisher_input, Publisher):
-            self.__publishers.append(publisher_input)
+            with self.__writing() as writer:
+                writer.field('publishers').append(publisher_input)
+                writer.field('publishers_by_name').setdefault(publisher_input.name, publisher_input)
 
     # gets a publisher from the repository based on the inputted name
     def get_publisher(self, publisher_name) -> Publisher:
-        return next((publisher for publisher in self.__publishers if publisher.name == publisher_name), None)
+        publisher = self.__view().publishers_by_name.get(publisher_name)
+        # a publisher renamed since the names were indexed is not found by its old name, and only found by
+        # its new one once rename_publisher or reindex_publishers has indexed it again
+        if publisher is not None and publisher.name != publisher_name:
+            return None
+        return publisher
+
+    # renames a publisher that is in the repository and indexes its books under the new name, as one write
+    def rename_publisher(self, publisher: Publisher, publisher_name: str):
+        with self.__writing():
+            publisher.name = publisher_name
+            self.reindex_publishers()
+
+    # Publisher names can be changed through the name setter. Call this after renaming a publisher that is
+    # already in the repository so it is found by its new name.
+    def reindex_publishers(self):
+        with self.__writing() as writer:
+            version = writer.version
+            publishers_by_name = SharedMap()
+            for publisher in version.publishers:
+                publishers_by_name.setdefault(publisher.name, publisher)
+            books_by_publisher = SharedMap()
+            book_columns = BookColumns()
+            facets = FacetCounts()
+            books = self.__indexed_books(version)
+            for book in books:
+                if book.publisher is not None:
+                    books_by_publisher.setdefault(book.publisher.name, SharedList()).append(book)
+                book_columns.append(book)
+                facets.add(book)
+            book_columns.build()
+            # the publisher leaderboards are ranked again under the books' current publishers
+            leaderboards = SharedMap((key, leaderboard) for key, leaderboard in version.leaderboards.items()
+                                     if key[1] != 'publisher')
+            for book in books:
+                if book.publisher is not None:
+                    for ranking in RANKINGS:
+                        score = self.__score(version, book, ranking)
+                        if score is not None:
+                            key = (ranking, 'publisher', book.publisher.name)
+                            leaderboards.setdefault(key, Leaderboard()).offer(book.book_id, score)
+            writer.replace('leaderboards', leaderboards)
+            writer.replace('publishers_by_name', publishers_by_name)
+            writer.replace('books_by_publisher', books_by_publisher)
+            writer.replace('book_columns', book_columns)
+            writer.replace('facets', facets)
+
+    # the books of books_by_id in the order they were added, the first book added under each id
+    @staticmethod
+    def __indexed_books(version: RepositoryVersion) -> List[Book]:
+        books = {}
+        for book in version.books:
+            books.setdefault(book.book_id, book)
+        return list(books.values())
 
     # gets the number of publishers in the repository
     def get_num_publishers(self) -> int:
-        return len(self.__publishers)
+        return len(self.__view().publishers)
 
-    #following methods are only required by the database repository and is not needed by the memory repository.
+    # reading lists are kept by their users, so entries only need to reach the write-ahead log
     def add_entry(self, entry):
-        pass
+        if self.__log is not None:
+            with self.__writing():
+                self.__record(entry_record, 'entry', entry)
 
     def update_entry(self, entry):
-        pass
+        if self.__log is not None:
+            with self.__writing():
+                self.__record(entry_record, 'entry_update', entry)
 
 
@@ -0,0 +1,51 @@
+import os
+import pickle
+
+from library.adapters.repository import MemoryRepository, RepositoryVersion
+
+SNAPSHOT_MAGIC = b"LIBSNAP\n"
+# bump when the snapshot layout changes; changes to MemoryRepository's fields are picked up by layout_key()
+SNAPSHOT_VERSION = 2
+
+
+# the size and modification time of every source file, so any edit to the data invalidates the snapshot
+def source_key(source_files) -> tuple:
+    key = []
+    for file_name in source_files:
+        stat = os.stat(file_name)
+        key.append((os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns))
+    return tuple(key)
+
+
+# the attribute names of an empty MemoryRepository and its versions, so a snapshot of an older repository
+# layout is not loaded
+def layout_key() -> tuple:
+    return tuple(sorted(vars(MemoryRepository()))) + RepositoryVersion.__slots__
+
+
+# Writes the populated repository, indexes included, as a pickle behind a small versioned header.
+# The file is written next to its destination first so a crash never leaves a half written snapshot.
+def save_snapshot(repository: MemoryRepository, file_name: str, source_files):
+    temp_file_name = f"{file_name}.tmp"
+    with open(temp_file_name, 'wb') as snapshot_file:
+        snapshot_file.write(SNAPSHOT_MAGIC)
+        pickle.dump((SNAPSHOT_VERSION, layout_key(), source_key(source_files)), snapshot_file,
+                    pickle.HIGHEST_PROTOCOL)
+        pickle.dump(repository, snapshot_file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file_name, file_name)
+
+
+# returns the saved repository, or None when there is no snapshot or it does not match the source files
+def load_snapshot(file_name: str, source_files):
+    if not os.path.exists(file_name):
+        return None
+    with open(file_name, 'rb') as snapshot_file:
+        if snapshot_file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            return None
+        try:
+            header = pickle.load(snapshot_file)
+        except (pickle.UnpicklingError, EOFError):
+            return None
+        if header != (SNAPSHOT_VERSION, layout_key(), source_key(source_files)):
+            return None
+        return pickle.load(snapshot_file)
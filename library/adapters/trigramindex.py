@@ -0,0 +1,80 @@
+from array import array
+from copy import copy
+
+from library.adapters.copyonwrite import SharedList, SharedMap
+
+# a trigram posting list may be intersected into the candidates while it is at most this many times larger,
+# past that it is cheaper to check the candidates' text directly
+INTERSECT_RATIO = 4
+
+
+class TrigramIndex:
+    # Case-insensitive substring search over the text of many items. Every three character sequence of an item's
+    # lower-cased text maps to the rows of the items that contain it. A query's rarest trigrams narrow the rows
+    # down to a few candidates, and only those candidates' text is checked for the whole query.
+
+    def __init__(self):
+        self.__items = SharedList()
+        self.__texts = SharedList()
+        self.__postings = SharedMap()
+
+    # A copy shares the items, texts and posting lists with the original and adds rows to them by length, so a
+    # copy-on-write repository version copies only the postings of the trigrams an added text has.
+    def __copy__(self):
+        index = TrigramIndex()
+        index.__items = copy(self.__items)
+        index.__texts = copy(self.__texts)
+        index.__postings = copy(self.__postings)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def add(self, item, text: str):
+        row = len(self.__items)
+        text = text.lower()
+        self.__items.append(item)
+        self.__texts.append(text)
+        for trigram in {text[i:i + 3] for i in range(len(text) - 2)}:
+            postings = self.__postings.get(trigram)
+            postings = SharedList(array('I')) if postings is None else copy(postings)
+            postings.append(row)
+            self.__postings[trigram] = postings
+
+    # the number of texts a search for the query checks, an upper bound on the number it finds
+    def estimate(self, query: str) -> int:
+        query = query.lower()
+        if len(query) < 3:
+            return len(self.__items)
+        return min(len(self.__postings.get(query[i:i + 3], ())) for i in range(len(query) - 2))
+
+    # the items whose text contains the query, in the order they were added
+    def search(self, query: str) -> list:
+        query = query.lower()
+        # the rows of the postings are all below the index's length, so the lists are read directly
+        items, texts = self.__items.backing, self.__texts.backing
+        if len(query) < 3:
+            # too short to have a trigram, every text is checked
+            return [items[row] for row, text in enumerate(self.__texts) if query in text]
+
+        postings = []
+        for trigram in {query[i:i + 3] for i in range(len(query) - 2)}:
+            trigram_postings = self.__postings.get(trigram)
+            if trigram_postings is None:
+                return []
+            postings.append(trigram_postings)
+        postings.sort(key=len)
+
+        candidates = postings[0]
+        if len(postings) > 1 and len(postings[1]) <= len(candidates) * INTERSECT_RATIO:
+            candidates = set(candidates)
+            for trigram_postings in postings[1:]:
+                if len(trigram_postings) > len(candidates) * INTERSECT_RATIO:
+                    break
+                candidates.intersection_update(trigram_postings)
+            candidates = sorted(candidates)
+        if len(query) == 3:
+            # the query is its own trigram, so every candidate contains it
+            return [items[row] for row in candidates]
+        # the trigrams can all be present without being next to each other, so each candidate is verified
+        return [items[row] for row in candidates if query in texts[row]]
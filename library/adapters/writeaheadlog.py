@@ -0,0 +1,252 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+from library.domain.model import BookEntry, Review, User
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# how often appended records are forced to disk, a crash of the machine loses at most this much of the writes
+SYNC_SECONDS = 0.1
+
+
+class WriteAheadLog:
+    # An append-only file of the writes made to a MemoryRepository, one json record per line numbered by seq,
+    # so they can be made again on startup. Records reach the file as they are appended, and are forced to
+    # disk in batches every sync_seconds by a daemon thread, so a write never waits for the disk unless
+    # sync_seconds is 0. Compacting moves the records to an archive once a snapshot holds them, which is read
+    # only when the repository is built from the data files again.
+
+    def __init__(self, file_name: str, sync_seconds: float = SYNC_SECONDS):
+        self.__file_name = file_name
+        self.__archive_file_name = f"{file_name}.archive"
+        self.__sync_seconds = sync_seconds
+        self.__lock = threading.Lock()
+        self.__file = open(file_name, 'a+b')
+        # one process appends to a log, as the seqs are counted by it
+        if fcntl is not None:
+            try:
+                fcntl.flock(self.__file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self.__file.close()
+                raise RuntimeError(f"the log {file_name} is open in another process")
+        self.__archived_seq = last_seq(self.__archive_file_name)
+        self.__seq = max(self.__recover(), self.__archived_seq)
+        self.__unsynced = 0
+        self.__closed = threading.Event()
+        self.__sync_thread = None
+        if sync_seconds > 0:
+            self.__sync_thread = threading.Thread(target=self.__sync_periodically, name="log-sync", daemon=True)
+            self.__sync_thread.start()
+
+    @property
+    def file_name(self) -> str:
+        return self.__file_name
+
+    # the seq of the last record appended
+    @property
+    def seq(self) -> int:
+        return self.__seq
+
+    # Drops a record left half written at the end of the file by a crash and returns the seq of the last
+    # whole one. A record that cannot be read before the end means the file was damaged, so it is not touched.
+    def __recover(self) -> int:
+        seq = end = 0
+        self.__file.seek(0)
+        lines = self.__file.readlines()
+        for number, line in enumerate(lines):
+            record = parse_record(line)
+            if record is None:
+                if number < len(lines) - 1:
+                    raise ValueError(f"record {number + 1} of the log {self.__file_name} cannot be read")
+                print(f"Dropped a record left unfinished at the end of {self.__file_name}")
+                self.__file.truncate(end)
+                break
+            seq = record['seq']
+            end += len(line)
+        return seq
+
+    # Appends the records, numbered after the last one, and returns the seq of the last of them
+    def append(self, records: list) -> int:
+        with self.__lock:
+            lines = []
+            for record in records:
+                self.__seq += 1
+                lines.append(encode_record({'seq': self.__seq, **record}))
+            self.__file.write(b"".join(lines))
+            self.__file.flush()
+            if self.__sync_seconds > 0:
+                self.__unsynced += len(lines)
+            else:
+                os.fsync(self.__file.fileno())
+            return self.__seq
+
+    # forces the records appended since the last sync to disk, outside the lock so appends carry on meanwhile
+    def sync(self):
+        with self.__lock:
+            unsynced, self.__unsynced = self.__unsynced, 0
+        if unsynced:
+            os.fsync(self.__file.fileno())
+
+    def __sync_periodically(self):
+        while not self.__closed.wait(self.__sync_seconds):
+            self.sync()
+
+    def close(self):
+        if self.__closed.is_set():
+            return
+        self.__closed.set()
+        if self.__sync_thread is not None:
+            self.__sync_thread.join()
+        self.sync()
+        with self.__lock:
+            self.__file.close()
+
+    # The records with a seq after after_seq, from the archive and then the log. A record that was archived by
+    # a compaction that did not finish is in both, and is read once.
+    def records(self, after_seq: int = 0):
+        with self.__lock:
+            self.__file.flush()
+        file_names = [self.__file_name]
+        if after_seq < self.__archived_seq:
+            file_names.insert(0, self.__archive_file_name)
+        for file_name in file_names:
+            with open(file_name, 'rb') as log_file:
+                for line in log_file:
+                    record = parse_record(line)
+                    # an archive line cut short by a crash is also in the log, which was not emptied after it
+                    if record is not None and record['seq'] > after_seq:
+                        after_seq = record['seq']
+                        yield record
+
+    # Makes the writes of the records the repository does not hold yet, as one batch that is not logged again,
+    # and returns the number of records replayed
+    def replay(self, repository) -> int:
+        num_records = 0
+        with repository.batch(logged=False):
+            for record in self.records(repository.log_seq):
+                apply_record(repository, record)
+                repository.log_seq = record['seq']
+                num_records += 1
+        return num_records
+
+    # Moves every record into the archive and empties the log. Only call it once a snapshot holds the records,
+    # the archive is then read only when that snapshot no longer matches the data files.
+    def compact(self) -> int:
+        with self.__lock:
+            self.__file.flush()
+            self.__file.seek(0)
+            data = self.__file.read()
+            if not data:
+                return 0
+            with open(self.__archive_file_name, 'a+b') as archive_file:
+                # finishes a line cut short by a compaction that crashed, so the records do not run into it
+                if archive_file.tell() and not self.__ends_with_newline(archive_file):
+                    archive_file.write(b"\n")
+                archive_file.write(data)
+                archive_file.flush()
+                os.fsync(archive_file.fileno())
+            self.__archived_seq = self.__seq
+            self.__file.truncate(0)
+            os.fsync(self.__file.fileno())
+            self.__unsynced = 0
+            return data.count(b"\n")
+
+    @staticmethod
+    def __ends_with_newline(archive_file) -> bool:
+        archive_file.seek(-1, os.SEEK_END)
+        return archive_file.read(1) == b"\n"
+
+
+def encode_record(record: dict) -> bytes:
+    return json.dumps(record, separators=(',', ':')).encode('utf-8') + b"\n"
+
+
+# the record on a line, or None when the line was not finished or cannot be read
+def parse_record(line: bytes):
+    if not line.endswith(b"\n"):
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and 'seq' in record else None
+
+
+# the seq of the last whole record of a log file, read from its end, or 0 when there is none
+def last_seq(file_name: str) -> int:
+    if not os.path.exists(file_name):
+        return 0
+    with open(file_name, 'rb') as log_file:
+        size = log_file.seek(0, os.SEEK_END)
+        tail = 4096
+        while True:
+            start = max(size - tail, 0)
+            log_file.seek(start)
+            lines = log_file.read().split(b"\n")
+            # the first line may start before the tail and the last one is empty or unfinished
+            for line in reversed(lines[1 if start else 0:-1]):
+                record = parse_record(line + b"\n")
+                if record is not None:
+                    return record['seq']
+            if start == 0:
+                return 0
+            tail *= 4
+
+
+# user ids made by User are random bytes, which json has no type for
+def encode_user_id(user_id):
+    return {'hex': user_id.hex()} if isinstance(user_id, bytes) else user_id
+
+
+def decode_user_id(user_id):
+    return bytes.fromhex(user_id['hex']) if isinstance(user_id, dict) else user_id
+
+
+def user_record(user: User) -> dict:
+    return {'op': 'user', 'user_name': user.user_name, 'password': user.password,
+            'user_id': encode_user_id(user.user_id)}
+
+
+def review_record(review: Review) -> dict:
+    return {'op': 'review', 'user_name': None if review.user is None else review.user.user_name,
+            'book_id': None if review.book is None else review.book.book_id, 'review_text': review.review_text,
+            'rating': review.rating, 'timestamp': review.timestamp.isoformat()}
+
+
+# op is 'entry' for an entry added to a reading list and 'entry_update' for one whose progress changed
+def entry_record(op: str, entry: BookEntry) -> dict:
+    return {'op': op, 'user_name': entry.collection.owner.user_name, 'book_id': entry.book.book_id,
+            'status': entry.status, 'pages_read': entry.pages_read}
+
+
+# makes the write of a record again through the repository's add methods
+def apply_record(repository, record: dict):
+    op = record['op']
+    if op == 'user':
+        repository.add_user(User(record['user_name'], record['password'], decode_user_id(record['user_id'])))
+        return
+    user = None if record['user_name'] is None else repository.get_user(record['user_name'])
+    book = None if record['book_id'] is None else repository.get_book(record['book_id'])
+    if op == 'review':
+        repository.add_review(Review(user, book, record['review_text'], record['rating'],
+                                     datetime.fromisoformat(record['timestamp'])))
+    elif user is None or book is None:
+        print(f"Skipped the reading list record {record['seq']}, its user or book is gone")
+    elif op == 'entry':
+        entry = BookEntry(user.reading_list, book, record['status'], record['pages_read'])
+        repository.add_entry(entry)
+        user.reading_list.book_entries.append(entry)
+    elif op == 'entry_update':
+        for entry in user.reading_list.book_entries:
+            if entry.book == book:
+                entry.update_status(record['status'])
+                entry.update_pages_read(record['pages_read'])
+                repository.update_entry(entry)
+                break
+    else:
+        raise ValueError(f"unknown log record {op!r}")
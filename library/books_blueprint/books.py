@@ -1,4 +1,6 @@
-from flask import Blueprint, render_template, url_for, session, request
+from datetime import datetime
+
+from flask import Blueprint, render_template, url_for, session, request, abort
 from random import randrange
 
 from werkzeug.utils import redirect
@@ -13,6 +15,15 @@ import library.adapters.abstractrepository as repo
 
 book_blueprint = Blueprint('book_blueprint', __name__)
 
+REVIEWS_PER_PAGE = 20
+BOOKS_PER_PAGE = 30
+# the top lists /list can sort by, and how long they are unless limit asks for fewer or more
+TOP_LISTS = {'rating': "Highest rated", 'reviews': "Most reviewed", 'num_pages': "Longest"}
+TOP_BOOKS = 20
+MAX_TOP_BOOKS = 500
+# the most common values shown for each facet of the search results
+FACET_VALUES = 10
+
 
 class ReviewForm(FlaskForm):
     review = StringField("Enter your review here", widget=TextArea(), default="Enter your review here")
@@ -64,31 +75,53 @@ def list_books():
         books = repo.repo_instance.get_books_by_title(searched)
         authors = repo.repo_instance.get_authors_by_name(searched)
         tags = repo.repo_instance.get_tags_by_input(searched)
-        authors_books = []
+        authors_books = repo.repo_instance.get_books_by_authors(authors)
         tag_books = set()
-        for author in authors:
-            authors_books = authors_books + repo.repo_instance.get_books_by_author(author)
         for tag in tags:
-            tag_books = tag_books.union(set(repo.repo_instance.get_books_by_tag(tag)))
+            tag_books.update(repo.repo_instance.get_books_by_tag(tag))
+        # counted once over every book the search found
+        found_ids = {book.book_id for found in (books, authors_books, tag_books) for book in found}
+        facets = {facet: list(counts.items())[:FACET_VALUES]
+                  for facet, counts in repo.repo_instance.get_facet_counts(found_ids).items()}
         return render_template("books.html", books=books, authors_books=authors_books, user=user, title=f"Books "
                                                                                                         f"titles "
                                                                                                         f"containing "
-                                                                                                        f"'{search_form.search.data}'", search_form=search_form, searched=searched, tag_books=tag_books)
+                                                                                                        f"'{search_form.search.data}'", search_form=search_form, searched=searched, tag_books=tag_books,
+                               facets=facets)
+    sort = request.args.get("sort")
+    if sort in TOP_LISTS:
+        limit = min(max(request.args.get("limit", TOP_BOOKS, type=int), 1), MAX_TOP_BOOKS)
+        books = repo.repo_instance.get_top_books(sort, limit, tag, publisher)
+        title = f"{TOP_LISTS[sort]} books"
+        if tag:
+            title += f" with the tag {tag}"
+        if publisher:
+            title += f" published by {publisher.name}"
+        return render_template("books.html", books=books, user=user, title=title, search_form=search_form,
+                               top_lists=TOP_LISTS, scope={"tag": tag, "publisher": request.args.get("publisher")})
     if tag:
         return render_template("books.html", books=repo.repo_instance.get_books_by_tag(tag), user=user,
-                               title=f"Books with the tag {tag}", search_form=search_form)
+                               title=f"Books with the tag {tag}", search_form=search_form, top_lists=TOP_LISTS,
+                               scope={"tag": tag})
     if publisher:
         return render_template("books.html", books=repo.repo_instance.get_books_by_publisher(publisher), user=user,
-                               title=f"Books published by {publisher.name}", search_form=search_form)
+                               title=f"Books published by {publisher.name}", search_form=search_form,
+                               top_lists=TOP_LISTS, scope={"publisher": publisher.name})
     if author:
         author = repo.repo_instance.get_author(int(author))
         return render_template("books.html", books=repo.repo_instance.get_books_by_author(author), user=user,
                                title=f"Books by {author.full_name}", search_form=search_form)
+    # one page of the catalog in order of book_id, the next page follows the id of the last book shown
+    after = request.args.get("after")
     try:
-        books = repo.repo_instance.books()
-    except TypeError:
-        books = repo.repo_instance.books
-    return render_template('books.html', books=books, user=user, title="All Books", search_form=search_form)
+        after = int(after) if after else None
+    except ValueError:
+        abort(400)
+    books = repo.repo_instance.get_books_page(BOOKS_PER_PAGE + 1, after)
+    next_books = books[BOOKS_PER_PAGE - 1].book_id if len(books) > BOOKS_PER_PAGE else None
+    books = books[:BOOKS_PER_PAGE]
+    return render_template('books.html', books=books, next_books=next_books, user=user, title="All Books",
+                           search_form=search_form, top_lists=TOP_LISTS, scope={})
 
 
 @book_blueprint.route('/selected_book', methods=["GET", "POST"])
@@ -106,9 +139,22 @@ def selected_book():
             if current_book == book_entry.book:
                 in_reading_list = book_entry
                 break
-    reviews = reversed(repo.repo_instance.get_reviews(current_book))
+    # one page of the newest reviews, older pages follow the timestamp and review_id of the last review shown
+    before, before_id = request.args.get("before"), request.args.get("before_id")
+    try:
+        before = datetime.fromisoformat(before) if before else None
+        before_id = int(before_id) if before_id else None
+    except ValueError:
+        abort(400)
+    reviews = repo.repo_instance.get_reviews(current_book, REVIEWS_PER_PAGE + 1, before, before_id)
+    older_reviews = None
+    if len(reviews) > REVIEWS_PER_PAGE:
+        last_review = reviews[REVIEWS_PER_PAGE - 1]
+        older_reviews = {"before": last_review.timestamp.isoformat(), "before_id": last_review.review_id}
+    reviews = reviews[:REVIEWS_PER_PAGE]
     return render_template('single_book.html', book=current_book, user=user, currentReview=current_review,
-                           reviews=reviews, in_reading_list=in_reading_list, readingList=form, tags=tags,
+                           reviews=reviews, older_reviews=older_reviews, in_reading_list=in_reading_list,
+                           readingList=form, tags=tags,
                            related=repo.repo_instance.get_related_books(current_book), search_form=search_form)
 
 @book_blueprint.route('/review_book', methods=["GET", "POST"])
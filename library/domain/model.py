@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import List, Set
 import random
 import os
+import sys
 import library.adapters.abstractrepository as repo
 
 
@@ -9,12 +10,7 @@ class Publisher:
 
     def __init__(self, publisher_name: str):
         # This makes sure the setter is called here in the initializer/constructor as well.
-        self.__name = "N/A"
-        if isinstance(publisher_name, str):
-            # Make sure leading and trailing whitespace is removed.
-            publisher_name = publisher_name.strip()
-            if publisher_name != "":
-                self.__name = publisher_name
+        self.name = publisher_name
 
     @property
     def name(self) -> str:
@@ -27,7 +23,8 @@ class Publisher:
             # Make sure leading and trailing whitespace is removed.
             publisher_name = publisher_name.strip()
             if publisher_name != "":
-                self.__name = publisher_name
+                # interned so every book of a publisher shares one copy of its name
+                self.__name = sys.intern(publisher_name)
 
     def __repr__(self):
         return f'<Publisher {self.name}>'
@@ -76,7 +73,7 @@ class Author:
             # make sure leading and trailing whitespace is removed
             author_full_name = author_full_name.strip()
             if author_full_name != "":
-                self.__full_name = author_full_name
+                self.__full_name = sys.intern(author_full_name)
             else:
                 raise ValueError
         else:
@@ -227,6 +224,9 @@ class Book:
 
     @tags.setter
     def tags(self, tags: Set[str]):
+        # the same tag names appear on most books, so each distinct name is kept once in memory
+        if isinstance(tags, set):
+            tags = {sys.intern(tag) if isinstance(tag, str) else tag for tag in tags}
         self.__tags = tags
 
     def remove_author(self, author: Author):
@@ -277,6 +277,11 @@ class ReadingCollection:
         self.__book_entries = []
         self.__user = user
 
+    # the user whose list it is, not named user as the ORM maps the user column by that name
+    @property
+    def owner(self):
+        return self.__user
+
     @property
     def book_entries(self):
         return self.__book_entries
@@ -307,6 +312,11 @@ class BookEntry:
     def book(self):
         return self.__book
 
+    # the reading list the entry is in, not named reading_list as the ORM maps the column by that name
+    @property
+    def collection(self):
+        return self.__reading_list
+
     @property
     def status(self):
         return self.__status
@@ -337,8 +347,11 @@ class BookEntry:
 
 
 class Review:
+    # the user is not mapped by the ORM, so reviews it loads fall back to this
+    __user = None
 
-    def __init__(self, user, book: Book, review_text: str, rating: int):
+    # timestamp is given when a review is made again, as from the write-ahead log
+    def __init__(self, user, book: Book, review_text: str, rating: int, timestamp: datetime = None):
         if isinstance(book, Book):
             self.__book = book
         else:
@@ -354,13 +367,18 @@ class Review:
         else:
             raise ValueError
 
-        self.__timestamp = datetime.now()
+        self.__timestamp = datetime.now() if timestamp is None else timestamp
         self.__user = user
+        self.__review_id = None
 
     @property
     def book(self) -> Book:
         return self.__book
 
+    @property
+    def user(self):
+        return self.__user
+
     @property
     def review_text(self) -> str:
         return self.__review_text
@@ -373,6 +391,15 @@ class Review:
     def timestamp(self) -> datetime:
         return self.__timestamp
 
+    # given by the repository the review is added to, it orders reviews written at the same time
+    @property
+    def review_id(self) -> int:
+        return self.__review_id
+
+    @review_id.setter
+    def review_id(self, review_id: int):
+        self.__review_id = review_id
+
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
             return False
@@ -506,80 +533,65 @@ class BooksInventory:
 
 
 class SearchMethod:
+    # Every search returns its results instead of keeping them on the object, so one SearchMethod can be
+    # shared by the threads serving concurrent requests.
 
-    def __init__(self, books, reviews):
+    # books_by_tag, when given, maps each tag to the books that have it and is used instead of scanning the books
+    def __init__(self, books, reviews, books_by_tag=None):
         self.__dataset_of_books = books
         self.__dataset_of_reviews = reviews
-        self.__found_items = []
-
-    # returns all the found items by the search method
-    @property
-    def found_items(self):
-        return self.__found_items
+        self.__books_by_tag = books_by_tag
 
     # function will search for related tags.
     def search_by_tag(self, tag: str):
-        self.__found_items = []
-        for book in self.__dataset_of_books:
-            if tag in book.tags:
-                self.__found_items.append(book)
+        if self.__books_by_tag is not None:
+            books = self.__books_by_tag.get(tag)
+            return [] if books is None else books[:]
+        return [book for book in self.__dataset_of_books if tag in book.tags]
 
     # function will search for books relating to an author
     def search_by_author(self, author: Author):
-        self.__found_items = []
-        for book in self.__dataset_of_books:
-            if author in set(book.authors):
-                self.__found_items.append(book)
-
-    # function will search for books within a given publication year range.
-    def search_by_date_range(self, older_date: int, newer_date: int):
-        self.__found_items = []
-        for book in self.__dataset_of_books:
-            if isinstance(book.release_year, int) and newer_date <= book.release_year <= older_date:
-                self.__found_items.append(book)
-
-    # function will return a set of books that relate to a given book.
+        return [book for book in self.__dataset_of_books if author in book.authors]
+
+    # function will search for books released from the start year up to and including the end year.
+    # A start or end of None leaves that side of the range open.
+    def search_by_date_range(self, start: int = None, end: int = None):
+        return [book for book in self.__dataset_of_books
+                if isinstance(book.release_year, int) and (start is None or start <= book.release_year)
+                and (end is None or book.release_year <= end)]
+
+    # function will return up to 20 books that relate to a given book.
     def search_related_books(self, book: Book):
         related_books = set()
-        self.search_by_tag("read-it")
-        book = self.found_items[0]
+        read_it = self.search_by_tag("read-it")
+        if not read_it:
+            return []
+        book = read_it[0]
         for tag in book.tags:
-            self.search_by_tag(tag)
-            related_books = related_books.union(set(self.found_items))
-        rec_books = random.sample(related_books, 19)
+            related_books.update(self.search_by_tag(tag))
+        rec_books = random.sample(list(related_books), min(19, len(related_books)))
         rec_books.append(book)
         return reversed(rec_books)
 
     # deal with the implementation later
     def search_by_title(self, title: str):
-        self.__found_items = []
-        for book in self.__dataset_of_books:
-            if book.title.lower().find(title.lower()) != -1:
-                self.__found_items.append(book)
+        title = title.lower()
+        return [book for book in self.__dataset_of_books if book.title.lower().find(title) != -1]
 
     def search_books_by_author(self, author: Author):
-        self.__found_items = []
-        for book in self.__dataset_of_books:
-            if author in book.authors:
-                self.__found_items.append(book)
+        return self.search_by_author(author)
 
     def search_books_by_publisher(self, publisher: Publisher):
-        self.__found_items = []
-        for book in self.__dataset_of_books:
-            if publisher == book.publisher:
-                self.__found_items.append(book)
+        return [book for book in self.__dataset_of_books if publisher == book.publisher]
 
     def search_reviews_by_book(self, book: Book):
-        self.__found_items = []
-        for review in self.__dataset_of_reviews:
-            if review.book == book:
-                self.__found_items.append(review)
+        return [review for review in self.__dataset_of_reviews if review.book == book]
 
 
 class Tag:
 
     def __init__(self, tag):
-        self.__tag = tag
+        self.__tag = sys.intern(tag) if isinstance(tag, str) else tag
         self.__tagged_books = []
 
     @property
@@ -95,7 +95,7 @@ def display_review():
     search_form = SearchFrom()
     if session.get("logged_in"):
         user = repo.repo_instance.get_user(session["user"])
-        reviews = repo.repo_instance.get_reviews(user)
-        return render_template("test_reviews_display.html", reviews=user.reviews, user=session.get("user"), search_form=search_form)
+        reviews = repo.repo_instance.get_user_reviews(user)
+        return render_template("test_reviews_display.html", reviews=reviews, user=session.get("user"), search_form=search_form)
     else:
         return redirect(url_for('user_blueprint.sign'))
\ No newline at end of file
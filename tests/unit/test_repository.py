@@ -1,11 +1,27 @@
+import json
+import shutil
+import sys
+import threading
+from copy import copy
+from datetime import datetime
 from pathlib import Path
 import pytest
 
 from utils import get_project_root
 
-from library.domain.model import Publisher, Author, Book, Review, User, BooksInventory
-from library.adapters.jsondatareader import BooksJSONReader
+from library.domain.model import Publisher, Author, Book, Review, User, BooksInventory, SearchMethod, BookEntry
+from library.adapters.jsondatareader import BooksJSONReader, book_record, BOOK_FIELDS
+from library.adapters.profiler import IngestProfiler
+from library.adapters.parallelreader import iter_records_parallel, line_aligned_ranges
+from library.adapters.trigramindex import TrigramIndex
+from library.adapters.columnstore import BookColumns
+from library.adapters.copyonwrite import SharedList, SharedMap, SortedIndex
+from library.adapters.bookquery import BookQuery
+from library.adapters.snapshot import save_snapshot, load_snapshot
+from library.adapters.mappedcatalog import open_catalog, write_catalog
+from library.adapters.mappedrepository import MappedRepository, ReadOnlyCatalogError
 from library.adapters.repository import MemoryRepository
+from library.adapters.writeaheadlog import WriteAheadLog
 from library.adapters.abstractrepository import add_users
 import library.adapters.abstractrepository as repo
 
@@ -100,4 +116,644 @@ class TestRepository:
     def test_search_by_title(self, create_books_150_books):
         create_books_150_books
         assert len(repo.repo_instance.get_books_by_title("The")) == 40
-        pass
\ No newline at end of file
+        pass
+
+    def test_get_books_and_users_by_ids(self, create_books_150_books):
+        create_books_150_books
+        books = repo.repo_instance.get_books_by_ids([17277791, "707611", 17277791, 99999999])
+        assert books == {17277791: repo.repo_instance.get_book(17277791), 707611: repo.repo_instance.get_book(707611)}
+        users = repo.repo_instance.get_users_by_ids(["16bcc03cb29d0950f52a897ceaf8eb6e", "missing"])
+        assert users == {"16bcc03cb29d0950f52a897ceaf8eb6e": repo.repo_instance.get_user("caleb")}
+
+    def test_tag_index_matches_a_scan(self, create_books_150_books):
+        create_books_150_books
+        books = repo.repo_instance.books
+        for tag in ("magic", "yaoi", "to-read", "not a tag"):
+            assert repo.repo_instance.get_books_by_tag(tag) == [book for book in books if tag in book.tags]
+        counts = repo.repo_instance.get_tag_counts(["yaoi", "not a tag"])
+        assert counts == {"yaoi": 5, "not a tag": 0}
+
+        book = Book(99999999, "Newly added")
+        book.tags = {"yaoi"}
+        repo.repo_instance.add_book(book)
+        assert repo.repo_instance.get_books_by_tag("yaoi")[-1] is book
+        assert repo.repo_instance.get_tag_counts(["yaoi"]) == {"yaoi": 6}
+
+    def test_date_range_index_matches_a_scan(self, create_books_150_books):
+        create_books_150_books
+        books = repo.repo_instance.books
+        search = SearchMethod(books, [])
+        for start, end in ((2016, 2016), (2000, 2010), (None, 1990), (2015, None), (None, None), (2017, 2000)):
+            expected = sorted(search.search_by_date_range(start, end), key=lambda book: book.release_year)
+            assert repo.repo_instance.get_books_by_date_range(start, end) == expected
+            assert repo.repo_instance.get_books_by_date_range(start, end, descending=True) == expected[::-1]
+
+        # a book added out of year order is merged in by the next query
+        book = Book(99999999, "Newly added")
+        book.release_year = 1900
+        repo.repo_instance.add_book(book)
+        assert repo.repo_instance.get_books_by_date_range(end=1900) == [book]
+
+    def test_column_filters_match_a_scan(self, create_books_150_books):
+        create_books_150_books
+        books = repo.repo_instance.books
+        marvel = repo.repo_instance.get_publisher("Marvel")
+
+        def in_range(value, bounds):
+            low, high = bounds
+            return value is not None and (low is None or low <= value) and (high is None or value <= high)
+
+        for filters in ({"release_year": (2010, 2016)}, {"rating": (4.0, None), "ebook": False},
+                        {"num_pages": (None, 100), "release_year": (2000, None)}, {"publisher": marvel},
+                        {"rating": (3.5, 4.2), "ebook": True}, {"rating": (3.5, 4.2), "num_pages": (100, 300)},
+                        {}):
+            expected = [book for book in books
+                        if all(in_range(getattr(book, name), bounds) for name, bounds in filters.items()
+                               if name not in ("ebook", "publisher"))
+                        and ("ebook" not in filters or book.ebook is filters["ebook"])
+                        and ("publisher" not in filters or book.publisher == filters["publisher"])]
+            assert repo.repo_instance.filter_books(**filters) == expected
+        assert repo.repo_instance.filter_books(publisher=Publisher("Not a publisher")) == []
+
+    def test_find_books_matches_a_scan(self, create_books_150_books):
+        create_books_150_books
+        repository = repo.repo_instance
+        books = sorted(repository.get_books_by_ids(book.book_id for book in repository.books).values(),
+                       key=lambda book: book.book_id)
+        marvel = repository.get_publisher("Marvel")
+        author = repository.get_author(12948)
+        queries = [BookQuery(tags=["yaoi"], release_year=(2010, 2015)),
+                   BookQuery(tags=["magic", "fantasy"], rating=(4.0, None)),
+                   BookQuery(release_year=(2000, None), rating=(3.5, 4.5), ebook=False),
+                   BookQuery(publisher=marvel, num_pages=(100, None)),
+                   BookQuery(author=author, title="rumic"),
+                   BookQuery(title="the", ebook=True),
+                   BookQuery(tags=["not a tag"], rating=(1.0, None)),
+                   BookQuery()]
+        for query in queries:
+            assert repository.find_books(query) == [book for book in books if query.matches(book)]
+
+        # a rare tag is fetched through its index and the broad range is checked on the few books it returns
+        plan = repository.find_books(BookQuery(tags=["yaoi"], release_year=(2000, None)), explain=True)
+        assert "use tag 'yaoi' index" in plan.steps[-2]
+        assert plan.steps[-1].startswith("check release_year 2000..")
+        plan = repository.find_books(BookQuery(release_year=(2016, 2016), rating=(4.0, None), tags=["to-read"]),
+                                     explain=True)
+        assert "use column masks on release_year, rating" in str(plan)
+
+    def test_top_books_match_a_sort(self, create_books_150_books):
+        create_books_150_books
+        repository = repo.repo_instance
+        books = list(repository.get_books_by_ids(book.book_id for book in repository.books).values())
+        marvel = repository.get_publisher("Marvel")
+
+        def num_reviews(book):
+            return len(repository.get_reviews(book)) or None
+
+        for ranking, score in (("rating", lambda book: book.rating), ("reviews", num_reviews),
+                               ("num_pages", lambda book: book.num_pages)):
+            for tag, publisher in ((None, None), ("magic", None), (None, marvel), ("fantasy", marvel)):
+                expected = sorted((book for book in books if score(book) is not None
+                                   and (tag is None or tag in book.tags)
+                                   and (publisher is None or book.publisher == publisher)),
+                                  key=lambda book: (-score(book), book.book_id))
+                assert repository.get_top_books(ranking, 10, tag, publisher) == expected[:10]
+        with pytest.raises(ValueError):
+            repository.get_top_books("title", 10)
+
+    def test_leaderboards_follow_new_reviews(self):
+        repository = MemoryRepository()
+        user = User("dave", "123456789", "d1")
+        books = [Book(book_id, f"Book {book_id}") for book_id in range(250)]
+        for book in books:
+            book.num_pages = book.book_id % 120
+            repository.add_book(book)
+        expected = sorted(books, key=lambda book: (-book.num_pages, book.book_id))
+        assert repository.get_top_books("num_pages", 5) == expected[:5]
+        # longer than a leaderboard keeps, taken from every book instead
+        assert repository.get_top_books("num_pages", 200) == expected[:200]
+
+        for book_id in [3, 249, 3, 0, 3, 0, 249]:
+            repository.add_review(Review(user, books[book_id], "Review", 4))
+        assert [book.book_id for book in repository.get_top_books("reviews", 5)] == [3, 0, 249]
+
+    def test_facet_counts_match_a_scan(self, create_books_150_books):
+        create_books_150_books
+        repository = repo.repo_instance
+        books = list(repository.get_books_by_ids(book.book_id for book in repository.books).values())
+
+        def scan(books):
+            counts = {"tag": {}, "publisher": {}, "decade": {}, "format": {}}
+            for book in books:
+                values = [("tag", tag) for tag in book.tags]
+                if book.publisher is not None:
+                    values.append(("publisher", book.publisher.name))
+                if isinstance(book.release_year, int):
+                    values.append(("decade", book.release_year // 10 * 10))
+                if book.ebook is not None:
+                    values.append(("format", "ebook" if book.ebook else "print"))
+                for facet, value in values:
+                    counts[facet][value] = counts[facet].get(value, 0) + 1
+            return counts
+
+        assert repository.get_facet_counts() == scan(books)
+        found = repository.get_books_by_title("the")
+        facets = repository.get_facet_counts([book.book_id for book in found] + [found[0].book_id, 1])
+        assert facets == scan(found)
+        assert list(facets["tag"].values()) == sorted(facets["tag"].values(), reverse=True)
+        assert repository.get_facet_counts([]) == {"tag": {}, "publisher": {}, "decade": {}, "format": {}}
+
+    def test_binned_columns_match_a_scan(self):
+        columns = BookColumns()
+        books = []
+        for book_id in range(3000):
+            book = Book(book_id, f"Book {book_id}")
+            book.num_pages = (book_id * 7919) % 1500
+            book.rating = 1 + ((book_id * 31) % 397) / 100 if book_id % 5 else None
+            books.append(book)
+            columns.append(book)
+            if book_id == 2500:
+                # the rows after this go into the bins built from the rows before
+                columns.build()
+        for num_pages, rating in (((100, 1100), None), ((None, 7), (2.5, 3.5)), ((1499, None), (1.0, None))):
+            expected = [book for book in books if (num_pages[0] is None or num_pages[0] <= book.num_pages)
+                        and (num_pages[1] is None or book.num_pages <= num_pages[1])
+                        and (rating is None or book.rating is not None and rating[0] <= book.rating
+                             and (rating[1] is None or book.rating <= rating[1]))]
+            assert columns.filter(num_pages=num_pages, rating=rating) == expected
+
+    def test_review_pages(self):
+        repository = MemoryRepository()
+        book, other_book = Book(1, "Reviewed"), Book(2, "Other")
+        user = User("dave", "123456789", "d1")
+        reviews = [Review(user, book if i % 2 == 0 else other_book, f"Review {i}", 3) for i in range(9)]
+        for review in reviews:
+            repository.add_review(review)
+
+        newest_first = reviews[8::-2]
+        assert repository.get_reviews(book) == newest_first
+        first_page = repository.get_reviews(book, 3)
+        assert first_page == newest_first[:3]
+        assert repository.get_reviews(book, 3, first_page[-1].timestamp, first_page[-1].review_id) == newest_first[3:]
+        assert repository.get_reviews(Book(3, "Unreviewed")) == []
+        assert repository.get_user_reviews(user, 2) == [reviews[8], reviews[7]]
+
+    def test_review_pages_with_equal_timestamps(self):
+        repository = MemoryRepository()
+        book, user = Book(1, "Reviewed"), User("dave", "123456789", "d1")
+        written = datetime(2021, 10, 1, 12)
+        reviews = [Review(user, book, f"Review {i}", 3, written) for i in range(5)]
+        for review in reviews:
+            repository.add_review(review)
+
+        first_page = repository.get_reviews(book, 2)
+        assert [review.review_text for review in first_page] == ["Review 4", "Review 3"]
+        last = first_page[-1]
+        next_page = repository.get_reviews(book, 10, last.timestamp, last.review_id)
+        assert [review.review_text for review in next_page] == ["Review 2", "Review 1", "Review 0"]
+        assert repository.get_user_reviews(user, 10, last.timestamp, last.review_id) == next_page
+
+    def test_book_pages(self):
+        repository = MemoryRepository()
+        for book_id in [5, 2, 9, 1, 7]:
+            repository.add_book(Book(book_id, f"Book {book_id}"))
+        repository.add_book(Book(2, "Duplicate"))
+
+        first_page = repository.get_books_page(2)
+        assert [book.book_id for book in first_page] == [1, 2]
+        assert first_page[1].title == "Book 2"
+        assert [book.book_id for book in repository.get_books_page(10, after=2)] == [5, 7, 9]
+        assert [book.book_id for book in repository.get_books_page(2, after=6)] == [7, 9]
+        assert repository.get_books_page(2, after=9) == []
+        with repository.batch():
+            repository.add_book(Book(3, "Book 3"))
+            assert [book.book_id for book in repository.get_books_page(2, after=2)] == [3, 5]
+
+    def test_author_and_publisher_indexes_match_a_scan(self, create_books_150_books):
+        create_books_150_books
+        books = repo.repo_instance.books
+        for author in repo.repo_instance.authors[:20]:
+            assert repo.repo_instance.get_books_by_author(author) == [book for book in books if author in book.authors]
+        for publisher in repo.repo_instance.publishers:
+            assert repo.repo_instance.get_books_by_publisher(publisher) == \
+                   [book for book in books if book.publisher == publisher]
+
+        authors = repo.repo_instance.get_authors_by_name("Tak")
+        found = repo.repo_instance.get_books_by_authors(authors + authors)
+        assert len(found) == len(set(found))
+        assert set(found) == {book for book in books if any(author in book.authors for author in authors)}
+
+    def test_trigram_search_matches_a_scan(self, create_books_150_books):
+        create_books_150_books
+        books = repo.repo_instance.books
+        for query in ("The", "holmes", "o", "", "Vol. 1", "not a title"):
+            assert repo.repo_instance.get_books_by_title(query) == \
+                   [book for book in books if query.lower() in book.title.lower()]
+        authors = repo.repo_instance.authors
+        for query in ("Tak", "ed b", "zz"):
+            assert repo.repo_instance.get_authors_by_name(query) == \
+                   [author for author in authors if query.lower() in author.full_name.lower()]
+
+        # every trigram of the query is in the text, but not next to each other
+        index = TrigramIndex()
+        index.add("first", "abcd bcde")
+        index.add("second", "abcde")
+        assert index.search("ABCDE") == ["second"]
+
+    def test_primary_key_indexes(self):
+        repository = MemoryRepository()
+        first, duplicate = Book(1, "First"), Book(1, "Duplicate")
+        repository.add_book(first)
+        repository.add_book(duplicate)
+        assert repository.get_book("1") is first
+        assert repository.get_book(2) is None
+
+        marvel = Publisher("Marvel")
+        repository.add_publisher(marvel)
+        marvel.name = "Marvel Comics"
+        version = repository.version
+        # reads never index the new name themselves
+        assert repository.get_publisher("Marvel") is None
+        assert repository.get_publisher("Marvel Comics") is None
+        assert repository.version == version
+        repository.reindex_publishers()
+        assert repository.get_publisher("Marvel Comics") is marvel
+        repository.rename_publisher(marvel, "Marvel Entertainment")
+        assert repository.get_publisher("Marvel Comics") is None
+        assert repository.get_publisher("Marvel Entertainment") is marvel
+
+        user = User("Dave", "123456789", "d1")
+        repository.add_user(user)
+        assert repository.get_user("dave") is repository.get_user_by_id("d1") is user
+
+    def test_concurrent_reads_during_writes(self):
+        repository = MemoryRepository()
+        user = User("dave", "123456789", "d1")
+        repository.add_user(user)
+        num_books = 400
+        errors = []
+        writing = threading.Event()
+        writing.set()
+
+        def write():
+            try:
+                for book_id in range(num_books):
+                    book = Book(book_id, f"Stress {book_id}")
+                    book.tags = {"stress", f"tag{book_id % 7}"}
+                    # years go down as well as up so the year index has to be sorted again
+                    book.release_year = 2000 + (book_id * 37) % 23
+                    repository.add_book(book)
+                    repository.add_review(Review(user, book, f"Review {book_id}", 3))
+            finally:
+                writing.clear()
+
+        def read():
+            try:
+                while writing.is_set():
+                    tagged = repository.get_books_by_tag("stress")
+                    assert [book.book_id for book in tagged] == list(range(len(tagged)))
+                    assert all(repository.get_book(book.book_id) is book for book in tagged)
+                    years = [book.release_year for book in repository.get_books_by_date_range(2005, 2015)]
+                    assert years == sorted(years) and all(2005 <= year <= 2015 for year in years)
+                    found = repository.get_books_by_title("stress 1")
+                    assert all(book.title.startswith("Stress 1") for book in found)
+                    assert repository.get_tags_by_input("tag") <= {f"tag{tag}" for tag in range(7)}
+                    timestamps = [review.timestamp for review in repository.get_user_reviews(user, 50)]
+                    assert timestamps == sorted(timestamps, reverse=True)
+            except Exception as error:
+                errors.append(error)
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        try:
+            readers = [threading.Thread(target=read) for _ in range(4)]
+            for reader in readers:
+                reader.start()
+            write()
+            for reader in readers:
+                reader.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        assert errors == []
+        assert repository.version == 2 * num_books + 1
+        assert len(repository.get_books_by_tag("stress")) == num_books
+        assert len(repository.get_books_by_date_range()) == num_books
+        assert len(repository.get_reviews(repository.get_book(0))) == 1
+
+    def test_pinned_versions_and_batches(self):
+        repository = MemoryRepository()
+        repository.add_book(Book(1, "First"))
+        pinned, written, seen = threading.Event(), threading.Event(), []
+
+        def request():
+            repository.pin_version()
+            pinned.set()
+            written.wait()
+            seen.append((repository.version, repository.get_num_books(), repository.get_book(2)))
+            repository.unpin_version()
+            seen.append((repository.version, repository.get_num_books()))
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        pinned.wait()
+        with repository.batch():
+            repository.add_book(Book(2, "Second"))
+            repository.add_book(Book(3, "Third"))
+            # the writing thread sees its own writes, other threads only once the batch is published
+            assert repository.get_num_books() == 3
+        written.set()
+        thread.join()
+        assert seen == [(1, 1, None), (2, 3)]
+
+        # a batch that raises publishes nothing
+        with pytest.raises(ValueError):
+            with repository.batch():
+                repository.add_book(Book(4, "Fourth"))
+                raise ValueError
+        assert repository.version == 2 and repository.get_book(4) is None
+        repository.add_book(Book(5, "Fifth"))
+        assert [book.book_id for book in repository.books] == [1, 2, 3, 5]
+
+    def test_shared_containers_keep_what_copies_held(self):
+        books = SharedList()
+        books.extend(["a", "b"])
+        copied = copy(books)
+        copied.append("c")
+        assert list(books) == ["a", "b"] and list(copied) == ["a", "b", "c"] and copied[-1] == "c"
+        # as after a write that was never published, appending to the original drops what the copy appended
+        books.append("d")
+        assert books[:] == ["a", "b", "d"]
+
+        counts, copied = SharedMap(), None
+        for key in range(5000):
+            counts[key % 3000] = key
+            if key == 2000:
+                copied = copy(counts)
+        assert len(counts) == 3000 and counts[10] == 3010 and 4999 not in counts
+        assert len(copied) == 2001 and copied[10] == 10 and 2001 not in copied
+
+        index, pairs, copied = SortedIndex(), [], None
+        for value in range(5000):
+            key = (value * 7919) % 300
+            index.insert(key, value)
+            pairs.append((key, value))
+            if value == 2000:
+                copied, copied_pairs = copy(index), sorted(pairs, key=lambda pair: pair[0])
+        pairs.sort(key=lambda pair: pair[0])
+        # pairs with equal keys stay in the order they were inserted
+        assert index.values() == [value for _, value in pairs]
+        assert copied.values() == [value for _, value in copied_pairs]
+        first, last = index.bisect_left(100), index.bisect_right(199)
+        assert index.values(first, last) == [value for key, value in pairs if 100 <= key <= 199]
+
+    def test_unknown_author_ids_reported(self, tmp_path):
+        root_folder = get_project_root()
+        data_folder = root_folder / "library" / "adapters" / "data"
+        with open(data_folder / "150.json", encoding='UTF-8') as books_jsonfile:
+            book_json = json.loads(books_jsonfile.readline())
+        book_json["authors"] = [{"author_id": "8551671", "role": ""}, {"author_id": "999999999", "role": ""}]
+        books_file = tmp_path / "books.json"
+        books_file.write_text(json.dumps(book_json) + "\n", encoding='UTF-8')
+        reviews_file = tmp_path / "reviews.json"
+        reviews_file.write_text("", encoding='UTF-8')
+        repo.repo_instance = MemoryRepository()
+        reader = BooksJSONReader(str(books_file), str(data_folder / "output.json"), str(reviews_file))
+        reader.read_json_files(repo.repo_instance)
+        assert reader.unknown_author_ids == {999999999}
+        assert [author.unique_id for author in repo.repo_instance.books[0].authors] == [8551671]
+
+    def test_parallel_parse_matches_serial(self):
+        books_file = str(get_project_root() / "library" / "adapters" / "data" / "150.json")
+        ranges = line_aligned_ranges(books_file, 50000)
+        assert len(ranges) > 1
+        with open(books_file, 'rb') as books_jsonfile:
+            for start, end in ranges[1:]:
+                books_jsonfile.seek(start - 1)
+                assert books_jsonfile.read(1) == b"\n"
+        with open(books_file, encoding='UTF-8') as books_jsonfile:
+            serial = [book_record(json.loads(line)) for line in books_jsonfile]
+        assert list(iter_records_parallel(books_file, book_record, 2, 50000)) == serial
+
+    def test_parallel_reader_fills_repository(self):
+        data_folder = get_project_root() / "library" / "adapters" / "data"
+        repo.repo_instance = MemoryRepository()
+        add_users(str(data_folder / "users.txt"))
+        reader = BooksJSONReader(str(data_folder / "150.json"), str(data_folder / "output.json"),
+                                 str(data_folder / "reviews.json"), workers=2)
+        reader.read_json_files(repo.repo_instance)
+        assert len(repo.repo_instance.books) == 153
+        assert len(repo.repo_instance.reviews) == 548
+        assert repo.repo_instance.get_num_authors() == 331
+
+    def test_snapshot_round_trip(self, create_books_150_books, tmp_path):
+        create_books_150_books
+        source_file = tmp_path / "source.json"
+        source_file.write_text("{}\n", encoding='UTF-8')
+        snapshot_file = str(tmp_path / "repository.snapshot")
+        save_snapshot(repo.repo_instance, snapshot_file, [str(source_file)])
+        loaded = load_snapshot(snapshot_file, [str(source_file)])
+        assert loaded is not repo.repo_instance
+        assert len(loaded.books) == 153
+        assert len(loaded.reviews) == 548
+        assert str(loaded.get_book(17277791)) == "<Book X-Force: Phalanx Covenant, book id = 17277791>"
+        assert loaded.get_user("samuel").user_name == "samuel"
+
+        source_file.write_text("{}\n{}\n", encoding='UTF-8')
+        assert load_snapshot(snapshot_file, [str(source_file)]) is None
+        assert load_snapshot(str(tmp_path / "missing.snapshot"), [str(source_file)]) is None
+
+    def test_mapped_catalog_matches_the_memory_repository(self, create_books_150_books, tmp_path):
+        create_books_150_books
+        memory = repo.repo_instance
+        source_file = tmp_path / "source.json"
+        source_file.write_text("{}\n", encoding='UTF-8')
+        catalog_file = str(tmp_path / "catalog.bin")
+        write_catalog(memory, catalog_file, [str(source_file)])
+        mapped = MappedRepository(open_catalog(catalog_file, [str(source_file)]))
+        for review in memory.reviews:
+            mapped.add_review(review)
+
+        assert list(mapped.books) == [memory.get_book(book.book_id) for book in memory.books]
+        book = mapped.get_book(17277791)
+        assert book is mapped.get_book(17277791)
+        original = memory.get_book(17277791)
+        assert (book.title, book.description, book.publisher, book.release_year, book.ebook, book.num_pages,
+                book.rating, book.image_url, book.tags, book.authors) == \
+               (original.title, original.description, original.publisher, original.release_year, original.ebook,
+                original.num_pages, original.rating, original.image_url, original.tags, original.authors)
+        assert mapped.get_book(999) is memory.get_book(999) is None
+        assert mapped.get_books_page(20, after=mapped.get_books_page(20)[-1].book_id) == \
+               memory.get_books_page(20, after=memory.get_books_page(20)[-1].book_id)
+        marvel = mapped.get_publisher("Marvel")
+        author = mapped.get_author(12948)
+        assert mapped.get_books_by_tag("magic") == memory.get_books_by_tag("magic")
+        assert mapped.get_books_by_publisher(marvel) == memory.get_books_by_publisher(marvel)
+        assert mapped.get_books_by_author(author) == memory.get_books_by_author(author)
+        assert mapped.get_books_by_date_range(2010, 2015, True) == memory.get_books_by_date_range(2010, 2015, True)
+        assert mapped.get_books_by_title("the") == memory.get_books_by_title("the")
+        assert mapped.get_authors_by_name("taka") == memory.get_authors_by_name("taka")
+        assert mapped.get_tags_by_input("fan") == memory.get_tags_by_input("fan")
+        assert mapped.get_num_authors() == 331
+        for query in (BookQuery(tags=["yaoi"], release_year=(2010, 2015)), BookQuery(author=author, title="rumic"),
+                      BookQuery(release_year=(2000, None), rating=(3.5, 4.5), ebook=False),
+                      BookQuery(publisher=marvel, num_pages=(100, None)), BookQuery()):
+            assert mapped.find_books(query) == memory.find_books(query)
+        assert "use tag 'yaoi' index: 5 rows" in str(mapped.find_books(BookQuery(tags=["yaoi"]), explain=True))
+        for ranking in ("rating", "reviews", "num_pages"):
+            assert mapped.get_top_books(ranking, 10) == memory.get_top_books(ranking, 10)
+            assert mapped.get_top_books(ranking, 5, "fantasy") == memory.get_top_books(ranking, 5, "fantasy")
+        assert mapped.get_facet_counts() == memory.get_facet_counts()
+        found_ids = [book.book_id for book in memory.get_books_by_title("the")]
+        assert mapped.get_facet_counts(found_ids) == memory.get_facet_counts(found_ids)
+        with pytest.raises(ReadOnlyCatalogError):
+            mapped.add_book(Book(1, "New"))
+
+        # users and reviews written in mapped mode are replayed from the write-ahead log into a new worker
+        log = WriteAheadLog(str(tmp_path / "writes.log"), sync_seconds=0)
+        mapped.attach_log(log)
+        user = User("walter", "password123")
+        mapped.add_user(user)
+        for _ in range(40):
+            mapped.add_review(Review(user, book, "Logged", 5))
+        log.close()
+        restarted = MappedRepository(open_catalog(catalog_file, [str(source_file)]))
+        log = WriteAheadLog(str(tmp_path / "writes.log"), sync_seconds=0)
+        assert log.replay(restarted) == 41
+        assert restarted.get_user("walter").user_id == user.user_id
+        assert restarted.get_top_books("reviews", 1) == [book]
+        log.close()
+
+        source_file.write_text("{}\n{}\n", encoding='UTF-8')
+        assert open_catalog(catalog_file, [str(source_file)]) is None
+        assert open_catalog(str(tmp_path / "missing.bin"), [str(source_file)]) is None
+
+    def test_write_ahead_log_replays_writes_after_a_restart(self, create_books_150_books, tmp_path):
+        create_books_150_books
+        source_file = tmp_path / "source.json"
+        source_file.write_text("{}\n", encoding='UTF-8')
+        base_file, snapshot_file = str(tmp_path / "base.snapshot"), str(tmp_path / "repository.snapshot")
+        log_file = str(tmp_path / "writes.log")
+        save_snapshot(repo.repo_instance, base_file, [str(source_file)])
+
+        log = WriteAheadLog(log_file, sync_seconds=0)
+        repo.repo_instance.attach_log(log)
+        user = User("walter", "password123")
+        repo.repo_instance.add_user(user)
+        book = repo.repo_instance.get_book(17277791)
+        review = Review(user, book, "Logged", 4)
+        repo.repo_instance.add_review(review)
+        entry = BookEntry(user.reading_list, book, "Reading", 10)
+        repo.repo_instance.add_entry(entry)
+        user.reading_list.book_entries.append(entry)
+        entry.update_status("Completed")
+        repo.repo_instance.update_entry(entry)
+        # data file writes are read again on startup, so they are not logged
+        with repo.repo_instance.batch(logged=False):
+            repo.repo_instance.add_review(Review(user, book, "Not logged", 2))
+        assert repo.repo_instance.log_seq == 4
+        log.close()
+        with open(log_file, "ab") as unfinished:
+            unfinished.write(b'{"seq": 5, "op": "us')
+
+        log = WriteAheadLog(log_file, sync_seconds=0)
+        restarted = load_snapshot(base_file, [str(source_file)])
+        assert log.replay(restarted) == 4
+        replayed = restarted.get_user("walter")
+        assert replayed.user_id == user.user_id
+        newest = restarted.get_reviews(book, 1)[0]
+        assert (newest.review_text, newest.timestamp, newest.user) == ("Logged", review.timestamp, replayed)
+        assert [(e.book, e.status, e.pages_read) for e in replayed.reading_list.book_entries] == \
+               [(book, "Completed", 10)]
+        assert log.replay(restarted) == 0
+
+        # compacting folds the log into the snapshot, the archive is read when the snapshot is out of date
+        save_snapshot(restarted, snapshot_file, [str(source_file)])
+        assert log.compact() == 4
+        restarted.attach_log(log)
+        restarted.add_user(User("jesse", "password456"))
+        log.close()
+        log = WriteAheadLog(log_file, sync_seconds=0)
+        assert log.seq == 5
+        compacted = load_snapshot(snapshot_file, [str(source_file)])
+        assert compacted.log_seq == 4
+        assert log.replay(compacted) == 1
+        assert compacted.get_user("jesse") is not None
+        rebuilt = load_snapshot(base_file, [str(source_file)])
+        assert log.replay(rebuilt) == 5
+        assert rebuilt.get_user("walter") is not None and rebuilt.get_user("jesse") is not None
+        log.close()
+
+    def test_ingest_new_reads_only_appended_lines(self, tmp_path):
+        data_folder = get_project_root() / "library" / "adapters" / "data"
+        for file_name in ("150.json", "output.json", "reviews.json"):
+            shutil.copy(data_folder / file_name, tmp_path / file_name)
+        repo.repo_instance = MemoryRepository()
+        reader = BooksJSONReader(str(tmp_path / "150.json"), str(tmp_path / "output.json"),
+                                 str(tmp_path / "reviews.json"))
+        reader.read_json_files(repo.repo_instance)
+        assert reader.ingest_new(repo.repo_instance) == (0, 0)
+
+        book_json = json.loads((data_folder / "150.json").read_text(encoding='UTF-8').splitlines()[0])
+        book_json["book_id"] = "99999999"
+        with open(tmp_path / "150.json", "a", encoding='UTF-8') as books_jsonfile:
+            books_jsonfile.write("\n" + json.dumps(book_json) + "\n")
+        review_json = {"user_id": "none", "book_id": "99999999", "review_text": "Appended", "rating": 4}
+        with open(tmp_path / "reviews.json", "a", encoding='UTF-8') as reviews_jsonfile:
+            reviews_jsonfile.write(json.dumps(review_json) + "\n" + '{"user_id": "no')
+        assert reader.has_new_lines()
+        assert reader.ingest_new(repo.repo_instance) == (1, 1)
+        assert len(repo.repo_instance.books) == 154
+        assert repo.repo_instance.reviews[-1].book == repo.repo_instance.get_book(99999999)
+
+        # the unfinished review line is picked up once it has been completed
+        with open(tmp_path / "reviews.json", "a", encoding='UTF-8') as reviews_jsonfile:
+            reviews_jsonfile.write('ne", "book_id": "99999999", "review_text": "Later", "rating": 2}\n')
+        assert reader.ingest_new(repo.repo_instance) == (0, 1)
+        assert repo.repo_instance.reviews[-1].review_text == "Later"
+
+    def test_projected_books_keep_only_consumed_fields(self):
+        data_folder = get_project_root() / "library" / "adapters" / "data"
+        reader = BooksJSONReader(str(data_folder / "150.json"), str(data_folder / "output.json"),
+                                 str(data_folder / "reviews.json"))
+        full = reader.read_books_file()
+        projected = reader.read_books_file(projected=True)
+        assert len(projected) == len(full) == 153
+        assert set(projected[0]) == set(BOOK_FIELDS)
+        assert projected[0]['popular_shelves'] == [tag['name'] for tag in full[0]['popular_shelves']]
+        assert projected[0]['authors'] == [author['author_id'] for author in full[0]['authors']]
+        assert set(reader.read_reviews_file(projected=True)[0]) == {'user_id', 'book_id', 'review_text', 'rating'}
+        assert 'popular_shelves' in full[0] and set(full[0]) > set(BOOK_FIELDS)
+
+    def test_names_are_shared_between_books(self, create_books_150_books):
+        create_books_150_books
+        tag_names = {}
+        for book in repo.repo_instance.books:
+            for tag in book.tags:
+                assert tag_names.setdefault(tag, tag) is tag
+        assert Publisher("  Marvel ").name is repo.repo_instance.get_publisher("Marvel").name
+        assert Author(1, "Rumiko Takahashi").full_name is repo.repo_instance.get_author(12948).full_name
+
+    def test_profiler_reports_each_stage(self, tmp_path):
+        data_folder = get_project_root() / "library" / "adapters" / "data"
+        profiler = IngestProfiler()
+        reader = BooksJSONReader(str(data_folder / "150.json"), str(data_folder / "output.json"),
+                                 str(data_folder / "reviews.json"), profiler=profiler)
+        repo.repo_instance = MemoryRepository()
+        profiler.start()
+        reader.read_json_files(repo.repo_instance)
+        report = profiler.finish()
+        stages = {stage["stage"]: stage for stage in report["stages"]}
+        for name in ("books: decode", "books: normalise", "books: construct", "books: tags", "books: authors",
+                     "books: insert"):
+            assert stages[name]["records"] == 153
+        assert stages["reviews: insert"]["records"] == 548
+        assert stages["authors: decode"]["records"] == 331
+        assert all(stage["peak_memory_mb"] > 0 for stage in report["stages"])
+        assert sum(stage["seconds"] for stage in report["stages"]) <= report["total_seconds"]
+
+        # nothing is recorded once the profiler has finished
+        reader.read_author_names()
+        assert profiler.report() == report
+        profiler.write_report(str(tmp_path / "report.json"))
+        assert json.loads((tmp_path / "report.json").read_text()) == report
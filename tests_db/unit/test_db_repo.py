@@ -3,6 +3,7 @@ from datetime import date, datetime
 import pytest
 
 import library.adapters.abstractrepository as repo
+from library.adapters.bookquery import BookQuery
 from library.adapters.databaserepository import SqlAlchemyRepository
 from library.domain.model import Publisher, Author, Book, ReadingCollection, BookEntry, Review, User, BooksInventory, SearchMethod, Tag
 
@@ -181,4 +182,148 @@ def test_get_tags_by_input(populate150books):
 def test_search_by_title(populate150books):
     populate150books()
     assert len(repo.repo_instance.get_books_by_title("The")) == 40
-    pass
\ No newline at end of file
+    pass
+
+def test_bulk_load_links_books(populate150books):
+    populate150books()
+    book = repo.repo_instance.get_book(17277791)
+    assert book.title == "X-Force: Phalanx Covenant"
+    assert book.publisher.name == "Marvel"
+    assert [author.unique_id for author in book.authors] == [28126, 14461, 145378, 79750, 20013, 61367, 6542722,
+                                                            1226213]
+    assert len(book.tags) == 16
+
+
+def test_get_books_and_users_by_ids(populate150books):
+    populate150books()
+    book_ids = [book.book_id for book in repo.repo_instance.books()]
+    books = repo.repo_instance.get_books_by_ids(book_ids + [99999999])
+    assert len(books) == 153
+    assert books[book_ids[0]] is repo.repo_instance.get_book(book_ids[0])
+    users = repo.repo_instance.get_users_by_ids(["16bcc03cb29d0950f52a897ceaf8eb6e", "missing"])
+    assert users == {"16bcc03cb29d0950f52a897ceaf8eb6e": repo.repo_instance.get_user("caleb")}
+
+
+def test_get_tag_counts(populate150books):
+    populate150books()
+    assert repo.repo_instance.get_tag_counts([Tag("yaoi"), "not a tag"]) == {"yaoi": 5, "not a tag": 0}
+
+
+def test_get_books_by_date_range(populate150books):
+    populate150books()
+    books = repo.repo_instance.get_books_by_date_range(2010, 2012)
+    assert books and all(2010 <= book.release_year <= 2012 for book in books)
+    assert [book.release_year for book in books] == sorted(book.release_year for book in books)
+    newest = repo.repo_instance.get_books_by_date_range(2015, descending=True)
+    assert newest[0].release_year == max(book.release_year for book in newest)
+    assert len(repo.repo_instance.get_books_by_date_range()) == \
+           len([book for book in repo.repo_instance.books() if book.release_year is not None])
+
+
+def test_get_reviews_in_pages(populate150books):
+    populate150books()
+    book = repo.repo_instance.get_book(0)
+    user = repo.repo_instance.get_user("samuel")
+    for i in range(5):
+        review = Review(user, book, f"Review {i}", 3)
+        user.add_review(review)
+        repo.repo_instance.add_review(review)
+
+    first_page = repo.repo_instance.get_reviews(book, 2)
+    assert [review.review_text for review in first_page] == ["Review 4", "Review 3"]
+    next_page = repo.repo_instance.get_reviews(book, 10, first_page[-1].timestamp, first_page[-1].review_id)
+    assert [review.review_text for review in next_page] == ["Review 2", "Review 1", "Review 0",
+                                                            "Absolutely poggers, never missed a shot in my lyfe "
+                                                            "after reading this, ty ty"]
+    assert [review.review_text for review in repo.repo_instance.get_user_reviews(user, 1)] == ["Review 4"]
+
+
+def test_get_reviews_in_pages_with_equal_timestamps(populate150books):
+    populate150books()
+    book = repo.repo_instance.get_book(0)
+    user = repo.repo_instance.get_user("samuel")
+    written = datetime(2030, 1, 1)
+    for i in range(5):
+        review = Review(user, book, f"Review {i}", 3, written)
+        user.add_review(review)
+        repo.repo_instance.add_review(review)
+
+    first_page = repo.repo_instance.get_reviews(book, 2)
+    assert [review.review_text for review in first_page] == ["Review 4", "Review 3"]
+    next_page = repo.repo_instance.get_reviews(book, 3, first_page[-1].timestamp, first_page[-1].review_id)
+    assert [review.review_text for review in next_page] == ["Review 2", "Review 1", "Review 0"]
+
+
+def test_get_books_by_authors(populate150books):
+    populate150books()
+    authors = repo.repo_instance.get_authors_by_name("Tak")
+    found = repo.repo_instance.get_books_by_authors(authors + authors)
+    expected = {book.book_id for author in authors for book in repo.repo_instance.get_books_by_author(author)}
+    assert len(found) == len(expected)
+    assert {book.book_id for book in found} == expected
+
+
+def test_filter_books(populate150books):
+    populate150books()
+    books = repo.repo_instance.books()
+    found = repo.repo_instance.filter_books(release_year=(2010, 2016), num_pages=(None, 200), ebook=False)
+    expected = {book.book_id for book in books if book.release_year is not None and 2010 <= book.release_year <= 2016
+                and book.num_pages is not None and book.num_pages <= 200 and book.ebook is False}
+    assert expected and {book.book_id for book in found} == expected
+    marvel = repo.repo_instance.get_publisher("Marvel")
+    assert {book.book_id for book in repo.repo_instance.filter_books(publisher=marvel)} == \
+           {book.book_id for book in repo.repo_instance.get_books_by_publisher(marvel)}
+
+
+def test_find_books(populate150books):
+    populate150books()
+    books = repo.repo_instance.books()
+    marvel = repo.repo_instance.get_publisher("Marvel")
+    author = repo.repo_instance.get_author(12948)
+    for query in (BookQuery(tags=["magic", "fantasy"], rating=(4.0, None)),
+                  BookQuery(release_year=(2000, None), ebook=False, publisher=marvel),
+                  BookQuery(author=author, title="Rumic"), BookQuery(tags=["yaoi"], num_pages=(None, 200))):
+        expected = sorted(book.book_id for book in books if query.matches(book))
+        assert expected and [book.book_id for book in repo.repo_instance.find_books(query)] == expected
+
+    plan = repo.repo_instance.find_books(BookQuery(tags=["yaoi"], release_year=(2010, 2015)), explain=True)
+    assert plan.steps[0].startswith("SELECT")
+    assert "'yaoi'" in str(plan) and any(step.startswith("plan: ") for step in plan.steps)
+
+
+def test_get_books_page(populate150books):
+    populate150books()
+    book_ids = sorted(book.book_id for book in repo.repo_instance.books())
+    first_page = repo.repo_instance.get_books_page(20)
+    assert [book.book_id for book in first_page] == book_ids[:20]
+    next_page = repo.repo_instance.get_books_page(200, after=first_page[-1].book_id)
+    assert [book.book_id for book in next_page] == book_ids[20:]
+    assert next_page[0].authors
+    assert repo.repo_instance.get_books_page(5, after=book_ids[-1]) == []
+
+
+def test_get_top_books(populate150books):
+    populate150books()
+    books = repo.repo_instance.books()
+    marvel = repo.repo_instance.get_publisher("Marvel")
+    expected = sorted((book for book in books if book.rating is not None),
+                      key=lambda book: (-book.rating, book.book_id))
+    assert repo.repo_instance.get_top_books("rating", 10) == expected[:10]
+    expected = sorted((book for book in books if book.num_pages is not None and book.publisher == marvel),
+                      key=lambda book: (-book.num_pages, book.book_id))
+    assert repo.repo_instance.get_top_books("num_pages", 5, publisher=marvel) == expected[:5]
+    most_reviewed = repo.repo_instance.get_top_books("reviews", 3, tag="yaoi")
+    assert all("yaoi" in [tag.tag for tag in book.tags] and repo.repo_instance.get_reviews(book)
+               for book in most_reviewed)
+
+
+def test_get_facet_counts(populate150books):
+    populate150books()
+    facets = repo.repo_instance.get_facet_counts()
+    assert facets["tag"]["yaoi"] == 5
+    assert facets["publisher"]["Marvel"] == 15
+    assert sum(facets["format"].values()) == repo.repo_instance.get_num_books()
+    marvel_books = repo.repo_instance.get_books_by_publisher(repo.repo_instance.get_publisher("Marvel"))
+    facets = repo.repo_instance.get_facet_counts(book.book_id for book in marvel_books)
+    assert facets["publisher"] == {"Marvel": 15}
+    assert sum(facets["decade"].values()) == len([book for book in marvel_books if book.release_year is not None])